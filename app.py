@@ -1,25 +1,77 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify
+from flask import Flask, Request, render_template, request, redirect, url_for, jsonify, Response, stream_with_context, g, send_file
 import numpy as np
-import tensorflow_hub as hub
-import soundfile as sf
 import tempfile
 import urllib.request
 import csv
 import os
-import wave
 import json
-from vosk import Model, KaldiRecognizer
-import librosa
-import tensorflow as tf
+import threading
+import time
+import contextvars
+import contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import google.generativeai as genai
-from twilio.rest import Client
+import soundfile as sf
+from models.audio import decode_audio_blocks, downmix, to_pcm16, pcm_chunks, accept_waveform
+from models.batching import YamnetBatcher
+from models.embeddings import DangerHead, EmbeddingStore, clip_embedding
+from models.longform import LongformAnalyzer
+from models.readiness import Readiness, LOADING, READY, FAILED
+from models.resample import resample
+from models.speech import get_recognizer_pool, pool_stats, keyword_grammar, find_keywords
+from models.streaming import StreamingDetector
+from models.vad import active_segments, GateStats
+from models.yamnet import load_backend, top_k
+import metrics
+from metrics import span
+from chat_router import ChatRouter
+from chat_sessions import ChatSessionStore, estimate_tokens
+from detect_jobs import DetectJobs, JobQueueFull, DECODED, SOUND_CLASSIFIED, TRANSCRIBED
+from evidence_store import EvidenceStore, EvidenceTooLarge
+from incident_heatmap import IncidentHeatmap
+from inference_service import InferenceClient
+from result_cache import ResultCache
+from sos_dispatch import SENT as SOS_SENT, SosDispatcher, TwilioSender, TWILIO_API_BASE
+from street_graph import StreetGraph, RouteNotFound
+
+class CappedRequest(Request):
+    """Request bodies are cut off at MAX_CONTENT_LENGTH while they are read,
+    except on /detect/stream, whose raw PCM runs as long as the recording."""
+
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'detect_stream':
+            return None
+        return super().max_content_length
 
 app = Flask(__name__)
+app.request_class = CappedRequest
 
 # =============== FLASK SETUP ===============
-UPLOAD_FOLDER = "static/uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+# Uploaded clips are kept as evidence in a content-addressed store: streamed
+# to disk under a size cap, deduplicated by hash, transcoded in the background
+# and pruned to EVIDENCE_QUOTA_MB / EVIDENCE_MAX_AGE_DAYS. Unless
+# EVIDENCE_MAX_MB is set, the cap fits UPLOAD_MAX_SECONDS of 44.1 kHz 16-bit
+# stereo WAV, so recordings long enough for block-wise analysis (beyond
+# LONGFORM_SECONDS) are not refused before they are analyzed.
+UPLOAD_MAX_SECONDS = float(os.getenv('UPLOAD_MAX_SECONDS', '1800'))
+WAV_BYTES_PER_SECOND = 44100 * 2 * 2
+evidence_store = EvidenceStore(
+    os.getenv('EVIDENCE_DIR', 'evidence'),
+    max_bytes=int(float(os.getenv('EVIDENCE_MAX_MB')) * 2**20) if os.getenv('EVIDENCE_MAX_MB')
+    else int(UPLOAD_MAX_SECONDS * WAV_BYTES_PER_SECOND) + 65536,
+    quota_bytes=int(os.getenv('EVIDENCE_QUOTA_MB', '2048')) * 2**20,
+    max_age=int(os.getenv('EVIDENCE_MAX_AGE_DAYS', '30')) * 86400,
+    codec=os.getenv('EVIDENCE_CODEC', 'flac'),
+)
+# Werkzeug spools multipart uploads before a route sees them, so the cap is
+# enforced during parsing, with room for the form's other fields.
+app.config['MAX_CONTENT_LENGTH'] = evidence_store.max_bytes + 65536
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({'error': f'Upload exceeds {evidence_store.max_bytes} bytes'}), 413
 
 # =============== TWILIO SETUP ===============
 # Load Twilio credentials from environment variables to avoid hard-coding secrets.
@@ -29,45 +81,180 @@ auth_token = os.getenv('TWILIO_AUTH_TOKEN') or ""
 twilio_whatsapp = os.getenv('TWILIO_WHATSAPP_FROM', 'whatsapp:+14155238886')   # Sandbox number as default
 my_whatsapp = os.getenv('MY_WHATSAPP_TO', 'whatsapp:+918595092765')
 
-# Initialize Twilio client only if credentials are present. Otherwise client operations will fail
-# with a clear error when attempted.
-if account_sid and auth_token:
-    client = Client(account_sid, auth_token)
-else:
-    client = None
+# SOS messages are sent by background workers over a pooled HTTP session, with
+# retries and per-incident deduplication. Missing credentials make each
+# dispatch fail with a clear error instead of crashing the request.
+# TWILIO_API_BASE can point at scripts/fake_twilio.py for local testing.
+twilio_sender = TwilioSender(
+    account_sid, auth_token, twilio_whatsapp, my_whatsapp,
+    api_base=os.getenv('TWILIO_API_BASE', TWILIO_API_BASE),
+)
+sos_dispatcher = SosDispatcher(
+    twilio_sender,
+    workers=int(os.getenv('SOS_DISPATCH_WORKERS', '2')),
+    max_attempts=int(os.getenv('SOS_MAX_ATTEMPTS', '5')),
+)
 
 # =============== GEMINI SETUP ===============
+# Mental health focused system prompt
+CHAT_SYSTEM_PROMPT = """You are Cosmic Crisis AI Bestie — a proactive safety and emotional support chatbot.
+Your mission: protect, comfort, and guide users in unsafe or stressful situations.
+
+⚡ Response Limits:
+
+Only respond to: safety concerns, emotional trauma, mental health stress, or greetings (hi/hello/check-in).
+
+For unrelated topics (coding, math, random questions), politely decline:
+“I’m designed specifically for emotional safety, trauma support, and mental health. I can’t answer that.”
+
+Modes of Response
+
+[SAFETY MODE]
+
+Triggered by: danger/fear words → "unsafe", "help now", "track me", "alert guardians".
+
+Clear, direct steps: SOS, share location, move to safe spot.
+
+Calm but firm.
+
+30–50 words only.
+
+Example:
+
+"SOS activated. Stay visible, move toward lighted areas. Sharing your location now with trusted contacts. Breathe steady — help is on the way."
+
+[SUPPORT MODE]
+
+Triggered by: stress/emotion words → "scared", "anxious", "lonely", "worthless".
+
+Validate feelings + give one coping method (breathing, grounding, affirmation).
+
+Warm, empathetic, short.
+
+Example:
+
+"I hear your fear. Let’s slow down: inhale 4, hold 4, exhale 6. Repeat twice. You are safe with me in this moment."
+
+[FRIENDLY MODE]
+
+Triggered by: casual greetings/tips → "hi", "motivate me", "check in".
+
+Positive, light, uplifting, short.
+
+Example:
+
+"Hey, friend 🌸. I’m here with you. You’ve got this — let’s keep moving forward together."
+
+Rules
+
+Always 30–50 words.
+
+Emergency → actionable steps only.
+
+Emotional support → empathy + one grounding action.
+
+Friendly → warm and short.
+
+Anything off-topic → politely decline...."""
+
 # Gemini API key should be provided via environment variable GEMINI_API_KEY
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY') or ""
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
     try:
-        gemini_model = genai.GenerativeModel('gemini-2.0-flash')
+        # The system prompt is bound to the model once as its system
+        # instruction instead of being pasted in front of every message.
+        gemini_model = genai.GenerativeModel('gemini-2.0-flash', system_instruction=CHAT_SYSTEM_PROMPT)
     except Exception as e:
         print(f"Warning: failed to initialize Gemini model: {e}")
         gemini_model = None
 else:
     gemini_model = None
 
+# =============== MODEL ARTIFACTS ===============
+# Models are read from MODEL_DIR when present (see scripts/fetch_models.py):
+#   MODEL_DIR/yamnet/                       YAMNet SavedModel
+#   MODEL_DIR/yamnet_class_map.csv          class labels
+#   MODEL_DIR/vosk-model-small-en-us-0.15/  unpacked Vosk model
+# With OFFLINE_MODELS=1 nothing is ever downloaded; missing artifacts leave
+# the engine unavailable and the worker reports not ready.
+MODEL_DIR = os.getenv('MODEL_DIR', 'model_artifacts')
+OFFLINE_MODELS = os.getenv('OFFLINE_MODELS', '0') == '1'
+
+YAMNET_HUB_URL = 'https://tfhub.dev/google/yamnet/1'
+YAMNET_LOCAL_PATH = os.path.join(MODEL_DIR, 'yamnet')
+if os.path.exists(YAMNET_LOCAL_PATH):
+    YAMNET_HANDLE = YAMNET_LOCAL_PATH
+else:
+    YAMNET_HANDLE = None if OFFLINE_MODELS else YAMNET_HUB_URL
+
+if os.path.exists(os.path.join(MODEL_DIR, 'yamnet_class_map.csv')):
+    CLASS_MAP_PATH = os.path.join(MODEL_DIR, 'yamnet_class_map.csv')
+else:
+    CLASS_MAP_PATH = 'yamnet_class_map.csv'
+
+if os.path.exists(os.path.join(MODEL_DIR, 'vosk-model-small-en-us-0.15')):
+    VOSK_MODEL_PATH = os.path.join(MODEL_DIR, 'vosk-model-small-en-us-0.15')
+else:
+    VOSK_MODEL_PATH = "vosk-model-small-en-us-0.15"
+
+# =============== INFERENCE SERVICE ===============
+# With INFERENCE_SOCKET set, YAMNet and Vosk are not loaded in this process:
+# audio goes through a shared-memory ring to the `python inference_service.py`
+# process listening on that socket, which serves every web worker.
+INFERENCE_SOCKET = os.getenv('INFERENCE_SOCKET')
+if INFERENCE_SOCKET:
+    inference_client = InferenceClient(
+        INFERENCE_SOCKET,
+        ring_bytes=int(os.getenv('INFERENCE_RING_MB', '64')) * 2**20,
+        authkey=os.getenv('INFERENCE_AUTHKEY', '').encode() or None,
+    )
+else:
+    inference_client = None
+
 # =============== YAMNET MODEL SETUP ===============
+# YAMNET_BACKEND selects the inference engine: 'tf' (TF Hub graph, default),
+# 'tflite' or 'tflite-int8' (converted models in MODEL_DIR).
+YAMNET_BACKEND = os.getenv('YAMNET_BACKEND', 'tf')
+YAMNET_THREADS = int(os.getenv('YAMNET_THREADS', '0')) or None
+
 # Load YAMNet model (load once at startup)
-try:
-    print("Loading YAMNet model...")
-    model = hub.load('https://tfhub.dev/google/yamnet/1')
-    print("YAMNet model loaded successfully")
-except Exception as e:
-    print(f"Error loading YAMNet model: {e}")
-    model = None
+if inference_client is not None:
+    print(f"Using YAMNet from the inference service at {INFERENCE_SOCKET}")
+    model = inference_client.yamnet
+else:
+    try:
+        print(f"Loading YAMNet model ({YAMNET_BACKEND} backend)...")
+        if YAMNET_BACKEND == 'tf' and YAMNET_HANDLE is None:
+            raise FileNotFoundError(f"YAMNet SavedModel not found at {YAMNET_LOCAL_PATH}")
+        model = load_backend(YAMNET_BACKEND, handle=YAMNET_HANDLE, model_dir=MODEL_DIR, num_threads=YAMNET_THREADS)
+        print("YAMNet model loaded successfully")
+    except Exception as e:
+        print(f"Error loading YAMNet model: {e}")
+        model = None
+
+# Micro-batching: concurrent requests share one YAMNet forward pass. Set
+# YAMNET_BATCHING=0 to call the model directly from each request thread.
+# With an inference service the batching happens there, across workers.
+YAMNET_BATCHING = os.getenv('YAMNET_BATCHING', '1') == '1'
+YAMNET_BATCH_MAX = int(os.getenv('YAMNET_BATCH_MAX', '8'))
+YAMNET_BATCH_WAIT_MS = float(os.getenv('YAMNET_BATCH_WAIT_MS', '10'))
+if model is not None and YAMNET_BATCHING and inference_client is None:
+    yamnet_batcher = YamnetBatcher(model, max_batch_size=YAMNET_BATCH_MAX, max_wait_ms=YAMNET_BATCH_WAIT_MS)
+    yamnet = yamnet_batcher.infer
+else:
+    yamnet_batcher = None
+    yamnet = model
 
 # Load class labels
 class_map = []
 try:
     url = 'https://raw.githubusercontent.com/tensorflow/models/master/research/audioset/yamnet/yamnet_class_map.csv'
-    if not os.path.exists('yamnet_class_map.csv'):
+    if not os.path.exists(CLASS_MAP_PATH) and not OFFLINE_MODELS:
         print("Downloading YAMNet class map...")
-        urllib.request.urlretrieve(url, 'yamnet_class_map.csv')
+        urllib.request.urlretrieve(url, CLASS_MAP_PATH)
     
-    with open('yamnet_class_map.csv') as f:
+    with open(CLASS_MAP_PATH) as f:
         reader = csv.DictReader(f)
         for row in reader:
             class_map.append(row['display_name'])
@@ -79,6 +266,505 @@ except Exception as e:
 danger_sounds = ["Scream", "Gunshot", "Explosion", "Shout", "Crying", "Fireworks"]
 keywords = ["help", "save me", "leave me", "don't touch", "Stay away"]
 
+# Optional danger head trained on our own clips (scripts/train_danger_head.py).
+# It scores the embeddings from the same YAMNet pass, and a clip whose best
+# patch reaches its threshold raises the alert like a danger class would.
+DANGER_HEAD_PATH = os.getenv('DANGER_HEAD', os.path.join(MODEL_DIR, 'danger_head.npz'))
+danger_head = None
+if os.path.exists(DANGER_HEAD_PATH):
+    try:
+        danger_head = DangerHead.load(DANGER_HEAD_PATH)
+        if os.getenv('DANGER_HEAD_THRESHOLD'):
+            danger_head.threshold = float(os.environ['DANGER_HEAD_THRESHOLD'])
+        print(f"Danger head loaded (threshold {danger_head.threshold:.2f})")
+    except Exception as e:
+        print(f"Error loading danger head: {e}")
+
+# Number of KaldiRecognizer objects shared by concurrent requests in this process.
+VOSK_POOL_SIZE = int(os.getenv('VOSK_POOL_SIZE', '4'))
+# VOSK_MODE=transcribe runs full large-vocabulary decoding; VOSK_MODE=keywords
+# restricts the recognizer to the keywords list plus an [unk] filler, which is
+# much cheaper and cannot mistake "helpful" for "help".
+VOSK_MODE = os.getenv('VOSK_MODE', 'transcribe')
+
+# Streaming detection: bytes read from the request body per iteration and the
+# per-window score a danger class must reach before an alert is emitted.
+STREAM_CHUNK_BYTES = 3200  # 100 ms of 16 kHz int16 PCM
+STREAM_DANGER_THRESHOLD = float(os.getenv('STREAM_DANGER_THRESHOLD', '0.2'))
+
+# Energy gate: RMS threshold for 30 ms frames to count as active, and how much
+# audio around each active run is still passed to Vosk.
+VAD_THRESHOLD = float(os.getenv('VAD_THRESHOLD', '0.01'))
+VAD_PAD_MS = int(os.getenv('VAD_PAD_MS', '300'))
+
+# Recordings longer than this are decoded and scored block by block so that
+# memory does not grow with their length.
+LONGFORM_SECONDS = float(os.getenv('LONGFORM_SECONDS', '120'))
+
+# =============== DETECTION PIPELINE ===============
+# Thread pool shared by all requests for the YAMNet and Vosk stages. Both
+# release the GIL while inferring, so one upload's stages overlap.
+DETECT_WORKERS = int(os.getenv('DETECT_WORKERS', '8'))
+detect_executor = ThreadPoolExecutor(max_workers=DETECT_WORKERS, thread_name_prefix="detect")
+gate_stats = GateStats()
+detections_total = metrics.registry.counter(
+    'detections_total', 'Analyzed uploads by outcome.', ('outcome',))
+
+# Detection results keyed by a hash of the uploaded bytes. RESULT_CACHE_DIR
+# enables an on-disk tier shared by all workers on the host. The version
+# string is part of the key so switching engines never serves stale results.
+result_cache = ResultCache(
+    max_entries=int(os.getenv('RESULT_CACHE_SIZE', '256')),
+    ttl=int(os.getenv('RESULT_CACHE_TTL', '3600')),
+    disk_dir=os.getenv('RESULT_CACHE_DIR') or None,
+)
+DANGER_HEAD_VERSION = f"{int(os.path.getmtime(DANGER_HEAD_PATH))}-{danger_head.threshold}" if danger_head else "none"
+RESULT_CACHE_VERSION = f"{YAMNET_BACKEND}-{VOSK_MODE}-{VAD_THRESHOLD}-{DANGER_HEAD_VERSION}"
+
+# Every analyzed upload's mean YAMNet embedding, for /incidents/<id>/similar.
+# EMBEDDING_STORE= (empty) keeps them in memory only.
+embedding_store = EmbeddingStore(os.getenv('EMBEDDING_STORE', os.path.join(evidence_store.root, 'embeddings.f16')) or None)
+
+def vosk_recognizers():
+    """Process-wide Vosk recognizer pool (loads the model on first use)"""
+    if inference_client is not None:
+        return inference_client.recognizers
+    grammar = keyword_grammar(keywords) if VOSK_MODE == 'keywords' else None
+    return get_recognizer_pool(VOSK_MODEL_PATH, size=VOSK_POOL_SIZE, allow_download=not OFFLINE_MODELS,
+                               grammar=grammar)
+
+def classify_sounds(wav_data):
+    """Run YAMNet and return the top-5 (label, score) results, their labels,
+    the clip's mean embedding and the danger head's score (None without a head)"""
+    if yamnet is None:
+        # Fallback if YAMNet model is not available
+        return [("Audio Analysis", "Model unavailable")], ["Unknown"], None, None
+    try:
+        with span('yamnet'):
+            scores, embeddings, spectrogram = yamnet(wav_data)
+        scores = np.asarray(scores)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        danger_score = danger_head.score(embeddings) if danger_head is not None else None
+        mean_scores = scores.mean(axis=0)
+        top_indices = top_k(mean_scores, 5)
+        results = [(class_map[i] if i < len(class_map) else f"Class_{i}", f"{mean_scores[i]*100:.2f}") for i in top_indices]
+        detected_labels = [class_map[i] if i < len(class_map) else f"Class_{i}" for i in top_indices]
+        return results, detected_labels, clip_embedding(embeddings), danger_score
+    except Exception as e:
+        print(f"Audio processing error: {e}")
+        return [("Audio Analysis", "Processing failed")], ["Unknown"], None, None
+
+def transcribe(wav_data, segments=None):
+    """Run Vosk over the waveform and return (transcript, keyword hits)
+
+    Only the (start, end) sample ranges in ``segments`` are decoded (the
+    whole clip by default), each as its own utterance. Keyword hits
+    (keyword, start, end, conf) are only produced in keywords mode; there the
+    transcript is just the spotted keywords.
+    """
+    if segments is None:
+        segments = [(0, len(wav_data))]
+    try:
+        vosk_pool = vosk_recognizers()
+    except Exception as e:
+        print(f"Failed to load Vosk model: {e}")
+        return "Speech recognition unavailable", []
+
+    try:
+        pcm = to_pcm16(wav_data)
+        results_stt = []
+        fed = 0
+        with span('vosk'), vosk_pool.recognizer() as rec:
+            for start, end in segments:
+                # Vosk timestamps count only the audio it was fed; shift them
+                # back onto the original clip's timeline.
+                shift = (start - fed) / 16000
+                segment_results = []
+                for chunk in pcm_chunks(pcm[start:end]):
+                    if accept_waveform(rec, chunk):
+                        segment_results.append(json.loads(rec.Result()))
+                segment_results.append(json.loads(rec.FinalResult()))
+                fed += end - start
+                for r in segment_results:
+                    for w in r.get("result", []):
+                        w["start"] += shift
+                        w["end"] += shift
+                results_stt.extend(segment_results)
+        if VOSK_MODE == 'keywords':
+            words = [w for r in results_stt for w in r.get("result", [])]
+            keyword_hits = find_keywords(words, keywords)
+            return " ".join(h["keyword"] for h in keyword_hits), keyword_hits
+        return " ".join([r.get("text", "") for r in results_stt if r.get("text")]), []
+    except Exception as e:
+        print(f"Speech recognition error: {e}")
+        return "Speech recognition failed", []
+
+SPEECH_FAILURES = ("Speech recognition unavailable", "Speech recognition failed")
+
+def is_danger_sound(detected_labels):
+    """True if any of the top YAMNet labels is a danger sound"""
+    return any(label in danger_sounds for label in detected_labels) if detected_labels else False
+
+def is_danger_embedding(danger_score):
+    """True if the danger head scored the clip at or above its threshold"""
+    return danger_head is not None and danger_score is not None and danger_score >= danger_head.threshold
+
+def is_danger_speech(speech_text):
+    """True if the transcript contains an emergency keyword"""
+    return any(k.lower() in speech_text.lower() for k in keywords) if speech_text else False
+
+def analyze_long_file(filepath, progress=None):
+    """Block-wise analyze_file for long recordings, in memory independent of their length
+
+    The file is read, resampled, scored by YAMNet and fed to Vosk one block
+    at a time. Besides a danger class in the top-5 mean scores, any single
+    patch scoring a danger class above STREAM_DANGER_THRESHOLD raises the
+    alert: a few seconds of screaming barely move the mean of a long recording.
+    Decoding and both engines are interleaved, so their progress events are
+    reported together once the last block is done.
+    """
+    try:
+        vosk_pool = vosk_recognizers()
+    except Exception as e:
+        print(f"Failed to load Vosk model: {e}")
+        vosk_pool = None
+
+    try:
+        with span('longform'), (vosk_pool.recognizer() if vosk_pool else contextlib.nullcontext()) as rec:
+            analyzer = LongformAnalyzer(yamnet, class_map, danger_sounds, recognizer=rec,
+                                        keep_words=VOSK_MODE == 'keywords', vad_threshold=VAD_THRESHOLD,
+                                        head=danger_head)
+            for block in decode_audio_blocks(filepath):
+                analyzer.feed(block)
+            summary = analyzer.finish()
+    except Exception as e:
+        print(f"Audio processing error: {e}")
+        detections_total.inc('failed')
+        return {'results': [["Audio Analysis", "Processing failed"]], 'speech_text': "Speech recognition failed",
+                'keyword_hits': [], 'skipped_fraction': None, 'alert': False, 'cacheable': False}
+
+    gate_stats.record(analyzer.samples, [(0, analyzer.active_samples)] if analyzer.active_samples else [])
+    if not analyzer.active_samples:
+        results = [("Silence", "100.00")]
+    elif yamnet is None:
+        results = [("Audio Analysis", "Model unavailable")]
+    else:
+        results = summary['results']
+
+    keyword_hits = []
+    if vosk_pool is None:
+        speech_text = "Speech recognition unavailable"
+    elif VOSK_MODE == 'keywords':
+        keyword_hits = find_keywords(summary['words'], keywords)
+        speech_text = " ".join(h["keyword"] for h in keyword_hits)
+    else:
+        speech_text = summary['speech_text']
+
+    if progress is not None:
+        progress(DECODED, seconds=summary['seconds'], skipped_fraction=summary['skipped_fraction'])
+        progress(SOUND_CLASSIFIED, results=[list(r) for r in results])
+        progress(TRANSCRIBED, speech_text=speech_text)
+
+    peak = summary['peak_danger']
+    with span('decision'):
+        alert = (is_danger_sound(summary['labels']) or is_danger_speech(speech_text)
+                 or is_danger_embedding(summary['danger_score'])
+                 or (peak is not None and peak['score'] >= STREAM_DANGER_THRESHOLD))
+    failed = yamnet is None or vosk_pool is None
+    detections_total.inc('alert' if alert else 'failed' if failed else 'safe')
+    return {
+        'results': [list(r) for r in results],
+        'speech_text': speech_text,
+        'keyword_hits': keyword_hits,
+        'skipped_fraction': summary['skipped_fraction'],
+        'peak_danger': peak,
+        'danger_score': round(summary['danger_score'], 4) if summary['danger_score'] is not None else None,
+        'embedding': summary['embedding'],
+        'alert': alert,
+        'cacheable': alert or not failed,
+    }
+
+def analyze_file(filepath, progress=None):
+    """Run the full detection pipeline on an audio file
+
+    Returns a JSON-serializable dict with the top-5 results, transcript,
+    keyword hits, fraction of audio skipped by the energy gate and the alert
+    decision. ``cacheable`` is False when an engine failed, so failures are
+    retried rather than remembered, and when an alert was raised before both
+    engines finished, so cache hits always carry the full result. Recordings
+    longer than LONGFORM_SECONDS go through analyze_long_file instead.
+    ``progress(stage, **data)`` is called as each stage finishes.
+    """
+    try:
+        long_recording = sf.info(filepath).duration > LONGFORM_SECONDS
+    except Exception:
+        long_recording = False
+    if long_recording:
+        return analyze_long_file(filepath, progress)
+    if progress is None:
+        progress = lambda stage, **data: None
+
+    results = None
+    speech_text = ""
+    keyword_hits = []
+    skipped_fraction = None
+    embedding = None
+    danger_score = None
+    alert = False
+    pending = ()
+
+    try:
+        # decode_audio, split so that read and resample are timed separately
+        with span('decode'):
+            frames, sr = sf.read(filepath, dtype='float32')
+            mono = downmix(frames)
+        with span('resample'):
+            wav_data = np.ascontiguousarray(resample(mono, sr), dtype=np.float32)
+    except Exception as e:
+        print(f"Audio processing error: {e}")
+        wav_data = None
+
+    if wav_data is not None:
+        with span('vad'):
+            segments = active_segments(wav_data, threshold=VAD_THRESHOLD, pad_ms=VAD_PAD_MS)
+        skipped_fraction = gate_stats.record(len(wav_data), segments)
+        progress(DECODED, seconds=round(len(wav_data) / 16000, 3), skipped_fraction=skipped_fraction)
+
+    if wav_data is None:
+        results = [("Audio Analysis", "Processing failed")]
+        speech_text = "Speech recognition failed"
+    elif not segments:
+        # Nothing above the energy gate: skip both engines.
+        results = [("Silence", "100.00")]
+    else:
+        # YAMNet and Vosk run side by side; whichever raises an alert
+        # first sends the user to /sos without waiting for the other.
+        # Each engine runs in a copy of this request's context so its span
+        # lands in the request's trace.
+        sound_future = detect_executor.submit(contextvars.copy_context().run, classify_sounds, wav_data)
+        speech_future = detect_executor.submit(contextvars.copy_context().run, transcribe, wav_data, segments)
+        pending = {sound_future, speech_future}
+        while pending and not alert:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if sound_future in done:
+                results, detected_labels, embedding, danger_score = sound_future.result()
+                progress(SOUND_CLASSIFIED, results=[list(r) for r in results])
+                with span('decision'):
+                    alert = is_danger_sound(detected_labels) or is_danger_embedding(danger_score)
+            if speech_future in done:
+                speech_text, keyword_hits = speech_future.result()
+                progress(TRANSCRIBED, speech_text=speech_text)
+                with span('decision'):
+                    alert = alert or is_danger_speech(speech_text)
+
+    failed = (results is not None and results[0][0] == "Audio Analysis") or speech_text in SPEECH_FAILURES
+    detections_total.inc('alert' if alert else 'failed' if failed else 'safe')
+    return {
+        'results': [list(r) for r in results or []],
+        'speech_text': speech_text,
+        'keyword_hits': keyword_hits,
+        'skipped_fraction': skipped_fraction,
+        'danger_score': round(danger_score, 4) if danger_score is not None else None,
+        'embedding': embedding,
+        'alert': alert,
+        # A short-circuited alert lacks the other engine's output.
+        'cacheable': (alert or not failed) and not pending,
+    }
+
+def analyze_upload(evidence_id, filepath, progress=None, location=None):
+    """analyze_file for a stored upload, answered from the result cache when possible
+
+    An alert with a client ``location`` is added to the incident heatmap,
+    and the clip's embedding to the similar-incident store.
+    """
+    # Retried uploads of the same clip are answered from the cache.
+    cache_key = f"{evidence_id}-{RESULT_CACHE_VERSION}"
+    analysis = result_cache.get(cache_key)
+    try:
+        if analysis is None:
+            analysis = analyze_file(filepath, progress)
+            embedding = analysis.pop('embedding', None)
+            if embedding is not None:
+                embedding_store.add(evidence_id, embedding, alert=analysis['alert'])
+            if analysis['cacheable']:
+                result_cache.put(cache_key, analysis)
+    finally:
+        # Release the upload's lease and compress the evidence only once the
+        # pipeline has finished reading it.
+        evidence_store.compact(evidence_id)
+    if analysis['alert'] and location is not None:
+        incident_heatmap.add(*location, incident=evidence_id, kind='upload')
+    return analysis
+
+# Uploads to /detect/jobs are analyzed in the background; the client follows
+# progress at /detect/jobs/<id> or its SSE stream. DETECT_JOB_QUEUE bounds the
+# jobs queued or running per process, beyond which uploads get a 503.
+detect_jobs = DetectJobs(
+    lambda progress, evidence_id, filepath, location: analyze_upload(evidence_id, filepath, progress, location),
+    workers=int(os.getenv('DETECT_JOB_WORKERS', '2')),
+    max_pending=int(os.getenv('DETECT_JOB_QUEUE', '32')),
+    ttl=int(os.getenv('DETECT_JOB_TTL', '600')),
+)
+
+# =============== SAFE ROUTING ===============
+# ROUTE_GRAPH points at a street network (.json or the .npz written by
+# StreetGraph.save / scripts/bench_routes.py --save). Without one, /route
+# answers 503. Routes are cached per snapped origin/destination and weight.
+ROUTE_SAFETY_WEIGHT = float(os.getenv('ROUTE_SAFETY_WEIGHT', '4'))
+ROUTE_MAX_SNAP_M = float(os.getenv('ROUTE_MAX_SNAP_M', '500'))
+street_graph = None
+if os.getenv('ROUTE_GRAPH'):
+    try:
+        street_graph = StreetGraph.load(os.environ['ROUTE_GRAPH'],
+                                        cache_size=int(os.getenv('ROUTE_CACHE_SIZE', '1024')),
+                                        landmarks=int(os.getenv('ROUTE_LANDMARKS', '8')))
+        print(f"Street graph loaded: {street_graph.num_nodes} nodes, {street_graph.num_edges} edges")
+    except Exception as e:
+        print(f"Error loading street graph: {e}")
+
+def parse_point(value):
+    """'lat,lon' query parameter as a (lat, lon) pair of floats"""
+    lat, lon = (float(x) for x in value.split(','))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"{value} is not a valid lat,lon")
+    return lat, lon
+
+# =============== INCIDENT HEATMAP ===============
+# Alerts sent with the client's lat/lon feed a time-decayed tiled grid served
+# at /heatmap. HEATMAP_LOG shares it between workers and across restarts.
+incident_heatmap = IncidentHeatmap(
+    cell_m=float(os.getenv('HEATMAP_CELL_M', '100')),
+    half_life=float(os.getenv('HEATMAP_HALF_LIFE_HOURS', '168')) * 3600,
+    max_tiles=int(os.getenv('HEATMAP_MAX_TILES', '64')),
+    log_path=os.getenv('HEATMAP_LOG') or None,
+)
+
+def client_location():
+    """The request's optional ``lat``/``lon`` form or query values, or None"""
+    try:
+        return parse_point(f"{request.values['lat']},{request.values['lon']}")
+    except (KeyError, ValueError):
+        return None
+
+# =============== WARM-UP ===============
+# Engines are loaded and run once on silence in the background so the first
+# real request does not pay for graph tracing or Vosk model loading.
+# /healthz/ready only reports ready once both have completed.
+readiness = Readiness(['yamnet', 'vosk'])
+
+def warm_up_engines():
+    """Run one silent inference through YAMNet and Vosk"""
+    silence = np.zeros(16000, dtype=np.float32)
+    try:
+        if yamnet is None:
+            raise RuntimeError("YAMNet model unavailable")
+        yamnet(silence)
+        readiness.mark('yamnet', READY)
+    except Exception as e:
+        print(f"YAMNet warm-up failed: {e}")
+        readiness.mark('yamnet', FAILED, str(e))
+
+    try:
+        with vosk_recognizers().recognizer() as rec:
+            for chunk in pcm_chunks(to_pcm16(silence)):
+                accept_waveform(rec, chunk)
+            rec.FinalResult()
+        readiness.mark('vosk', READY)
+    except Exception as e:
+        print(f"Vosk warm-up failed: {e}")
+        readiness.mark('vosk', FAILED, str(e))
+
+def warm_up_until_ready(retry_seconds=2.0):
+    """Warm up; with an inference service, keep retrying until it is reachable"""
+    warm_up_engines()
+    while inference_client is not None and not readiness.is_ready():
+        time.sleep(retry_seconds)
+        warm_up_engines()
+
+if os.getenv('WARMUP', '1') == '1':
+    threading.Thread(target=warm_up_until_ready, name="warmup", daemon=True).start()
+
+# =============== METRICS ===============
+# Request-level counters and timings, plus gauges read from the engines and
+# caches at scrape time. METRICS=0 turns all of it off; METRICS_TRACE_LOG=1
+# prints each request's stage spans as a JSON line.
+http_requests_total = metrics.registry.counter(
+    'http_requests_total', 'HTTP requests by endpoint and status.', ('endpoint', 'method', 'status'))
+http_request_seconds = metrics.registry.histogram(
+    'http_request_seconds', 'HTTP request latency by endpoint (until the response starts).', ('endpoint',))
+http_in_flight = metrics.registry.gauge('http_requests_in_flight', 'HTTP requests being handled.', ('endpoint',))
+
+metrics.registry.gauge(
+    'model_load_state', 'Engine load state (1 for the current state).', ('engine', 'state'),
+    fn=lambda: {(engine, state): int(entry['status'] == state)
+                for engine, entry in readiness.snapshot().items() for state in (LOADING, READY, FAILED)})
+metrics.registry.gauge(
+    'result_cache_entries', 'Detection results held in memory.',
+    fn=lambda: {(): result_cache.stats()['entries']})
+metrics.registry.counter(
+    'result_cache_lookups_total', 'Result cache lookups by outcome.', ('result',),
+    fn=lambda: {k: v for k, v in result_cache.stats().items() if k in ('memory_hits', 'disk_hits', 'misses')})
+metrics.registry.gauge(
+    'evidence_store_bytes', 'Disk used by stored evidence.', fn=lambda: {(): evidence_store.stats()['usage_bytes']})
+metrics.registry.gauge(
+    'evidence_store_blobs', 'Evidence clips on disk.', fn=lambda: {(): evidence_store.stats()['blobs']})
+metrics.registry.gauge(
+    'chat_sessions_active', 'Chat sessions held in memory.', fn=lambda: {(): chat_sessions.stats()['sessions']})
+metrics.registry.gauge(
+    'chat_sessions_memory_bytes', 'Memory held by chat session history.',
+    fn=lambda: {(): chat_sessions.stats()['memory_bytes']})
+metrics.registry.counter(
+    'chat_messages_total', 'Chat messages by routed mode.', ('mode',), fn=lambda: chat_router.stats())
+metrics.registry.gauge(
+    'vosk_recognizers_in_use', 'Vosk recognizers checked out, per pool.', ('pool',),
+    fn=lambda: {pool: s['in_use'] for pool, s in pool_stats().items()})
+metrics.registry.gauge(
+    'yamnet_batcher_pending', 'Clips waiting for a YAMNet batch.',
+    fn=lambda: {(): yamnet_batcher.stats()['pending']} if yamnet_batcher is not None else {})
+metrics.registry.gauge(
+    'detect_jobs_pending', 'Detection jobs queued or running.', fn=lambda: {(): detect_jobs.stats()['pending']})
+metrics.registry.counter(
+    'detect_jobs_total', 'Detection jobs by outcome.', ('outcome',),
+    fn=lambda: {k: v for k, v in detect_jobs.stats().items() if k in ('completed', 'failed', 'rejected')})
+metrics.registry.counter(
+    'route_queries_total', 'Route queries by whether the route cache answered them.', ('result',),
+    fn=lambda: {k: v for k, v in street_graph.stats().items() if k in ('cache_hits', 'cache_misses')}
+    if street_graph is not None else {})
+metrics.registry.counter(
+    'incident_heatmap_incidents_total', 'Incidents recorded on the heatmap.',
+    fn=lambda: {(): incident_heatmap.stats()['incidents']})
+metrics.registry.gauge(
+    'embedding_store_clips', 'Clip embeddings in the similar-incident store.',
+    fn=lambda: {(): embedding_store.stats()['clips']})
+metrics.registry.gauge(
+    'sos_dispatch_pending', 'SOS messages queued or waiting to retry.',
+    fn=lambda: {(): sos_dispatcher.stats()['pending']})
+metrics.registry.gauge(
+    'sos_dispatches', 'Tracked SOS dispatches by status.', ('status',),
+    fn=lambda: sos_dispatcher.stats()['by_status'])
+
+@app.before_request
+def start_request_metrics():
+    if not metrics.ENABLED:
+        return
+    g.metrics_start = time.perf_counter()
+    g.metrics_endpoint = request.endpoint or 'unknown'
+    http_in_flight.inc(g.metrics_endpoint)
+    g.trace_token = metrics.start_trace(g.metrics_endpoint)
+
+@app.after_request
+def record_request_metrics(response):
+    if metrics.ENABLED and 'metrics_start' in g:
+        http_request_seconds.observe(time.perf_counter() - g.metrics_start, g.metrics_endpoint)
+        http_requests_total.inc(g.metrics_endpoint, request.method, str(response.status_code))
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if metrics.ENABLED and 'metrics_start' in g:
+        http_in_flight.dec(g.metrics_endpoint)
+        metrics.end_trace(g.trace_token, endpoint=g.metrics_endpoint)
+
 # =============== ROUTES ====================
 
 @app.route('/')
@@ -97,230 +783,428 @@ def detect():
     results = None
     alert = False
     speech_text = ""
+    keyword_hits = []
+    skipped_fraction = None
     filename = None
     
     if request.method == 'POST':
         file = request.files['file']
         if file:
-            # Save uploaded file for evidence
-            filename = file.filename
-            filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-            file.save(filepath)
-            
-            # --- YAMNet ---
-            try:
-                wav_data, sr = sf.read(filepath)
-                if len(wav_data.shape) > 1:
-                    wav_data = np.mean(wav_data, axis=1)
-                if sr != 16000:
-                    wav_data = librosa.resample(wav_data, orig_sr=sr, target_sr=16000)
-                    sr = 16000
-                wav_data = tf.convert_to_tensor(wav_data, dtype=tf.float32)
-                
-                if model is not None:
-                    scores, embeddings, spectrogram = model(wav_data)
-                    scores = scores.numpy()
-                    mean_scores = scores.mean(axis=0)
-                    top_indices = mean_scores.argsort()[-5:][::-1]
-                    results = [(class_map[i] if i < len(class_map) else f"Class_{i}", f"{mean_scores[i]*100:.2f}") for i in top_indices]
-                    detected_labels = [class_map[i] if i < len(class_map) else f"Class_{i}" for i in top_indices]
-                else:
-                    # Fallback if YAMNet model is not available
-                    results = [("Audio Analysis", "Model unavailable")]
-                    detected_labels = ["Unknown"]
-                    
-            except Exception as e:
-                print(f"Audio processing error: {e}")
-                results = [("Audio Analysis", "Processing failed")]
-                detected_labels = ["Unknown"]
-            
-            # --- Vosk Speech-to-Text ---
-            speech_text = ""
+            # Save uploaded file for evidence, named by the hash of its bytes
             try:
-                sf.write("temp_pcm.wav", wav_data.numpy(), 16000, subtype='PCM_16')
-                wf = wave.open("temp_pcm.wav", "rb")
-                vosk_model_path = "vosk-model-small-en-us-0.15"
-                
-                # Check if model exists, if not try to download it
-                if not os.path.exists(vosk_model_path):
-                    print("Vosk model not found, attempting to download...")
-                    import zipfile
-                    import requests
-                    try:
-                        vosk_url = "https://alphacephei.com/vosk/models/vosk-model-small-en-us-0.15.zip"
-                        r = requests.get(vosk_url, timeout=30)
-                        with open("vosk_model.zip", "wb") as f:
-                            f.write(r.content)
-                        with zipfile.ZipFile("vosk_model.zip", "r") as zip_ref:
-                            zip_ref.extractall(".")
-                        print("Vosk model downloaded successfully")
-                    except Exception as e:
-                        print(f"Failed to download Vosk model: {e}")
-                        speech_text = "Speech recognition unavailable"
-                        wf.close()
-                        try:
-                            os.remove("temp_pcm.wav")
-                        except:
-                            pass
-                        # Continue without speech recognition
-                        yamnet_alert = any(label in danger_sounds for label in detected_labels)
-                        stt_alert = False  # No speech recognition available
-                        if yamnet_alert or stt_alert:
-                            alert = True
-                        if alert:
-                            return redirect(url_for('sos', filename=filename))
-                        return render_template('detect.html', results=results, alert=alert, speech_text=speech_text)
-                
-                # Load Vosk model
-                vosk_model = Model(vosk_model_path)
-                rec = KaldiRecognizer(vosk_model, 16000)
-                results_stt = []
-                
-                while True:
-                    data = wf.readframes(4000)
-                    if len(data) == 0:
-                        break
-                    if rec.AcceptWaveform(data):
-                        results_stt.append(json.loads(rec.Result()))
-                final = json.loads(rec.FinalResult())
-                results_stt.append(final)
-                speech_text = " ".join([r.get("text", "") for r in results_stt])
-                wf.close()
-                
-            except Exception as e:
-                print(f"Speech recognition error: {e}")
-                speech_text = "Speech recognition failed"
-                try:
-                    wf.close()
-                except:
-                    pass
-            
-            # Determine if alert should be triggered
-            yamnet_alert = any(label in danger_sounds for label in detected_labels) if detected_labels else False
-            stt_alert = any(k in speech_text.lower() for k in keywords) if speech_text else False
-            
-            # If both models failed, provide a manual option
-            if not results or results[0][0] == "Audio Analysis":
-                # Show manual analysis option
-                pass
-            else:
-                if yamnet_alert or stt_alert:
-                    alert = True
+                filename, filepath = evidence_store.put(file.stream, file.filename)
+            except EvidenceTooLarge as e:
+                return jsonify({'error': str(e)}), 413
+
+            analysis = analyze_upload(filename, filepath, location=client_location())
+
+            results = analysis['results']
+            speech_text = analysis['speech_text']
+            keyword_hits = analysis['keyword_hits']
+            skipped_fraction = analysis['skipped_fraction']
+            alert = analysis['alert']
             
-            # Clean up temporary files
-            try:
-                os.remove("temp_pcm.wav")
-            except Exception:
-                pass
-                
             if alert:
                 return redirect(url_for('sos', filename=filename))
     
-    return render_template('detect.html', results=results, alert=alert, speech_text=speech_text)
+    return render_template('detect.html', results=results, alert=alert, speech_text=speech_text,
+                           keyword_hits=keyword_hits, skipped_fraction=skipped_fraction)
 
-@app.route('/sos')
-@app.route('/sos/<filename>')
-def sos(filename=None):
-    """SOS page with emergency alert and WhatsApp button"""
-    return render_template('sos.html', filename=filename)
+@app.route('/detect/stream', methods=['POST'])
+def detect_stream():
+    """Streaming audio detection over a chunked POST of raw 16 kHz int16 PCM.
 
-@app.route('/send_sos/<filename>')
-def send_sos(filename):
-    """Send WhatsApp SOS message"""
-    message = client.messages.create(
-        body="🚨 SOS Alert! The girl is in danger!",
-        from_=twilio_whatsapp,
-        to=my_whatsapp
-    )
-    return f"<h2>✅ SOS Sent! SID: {message.sid}</h2>"
+    Responds with newline-delimited JSON events: an ``alert`` event as soon as a
+    danger sound or keyword is detected, followed by a final ``summary``.
+    ``?lat=&lon=`` places the alert on the incident heatmap.
+    """
+    try:
+        vosk_pool = vosk_recognizers()
+    except Exception as e:
+        print(f"Failed to load Vosk model: {e}")
+        vosk_pool = None
+    sos_url = url_for('sos')
+    location = client_location()
 
-@app.route('/chatbot')
-def chatbot():
-    """Mental health chatbot page"""
-    return render_template('chatbot.html')
+    def on_alert(event):
+        event["redirect"] = sos_url
+        if location is not None:
+            incident_heatmap.add(*location, kind='stream')
 
-@app.route('/chat', methods=['POST'])
-def chat():
-    """Chatbot API endpoint"""
-    try:
-        user_message = request.json.get('message', '')
-        
-        if not user_message:
-            return jsonify({'error': 'No message provided'}), 400
-        
-        # Mental health focused system prompt
-        system_prompt = """You are Cosmic Crisis AI Bestie — a proactive safety and emotional support chatbot.
-Your mission: protect, comfort, and guide users in unsafe or stressful situations.
+    def run(detector):
+        while True:
+            chunk = request.stream.read(STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            for event in detector.feed(chunk):
+                if event["event"] == "alert":
+                    on_alert(event)
+                yield json.dumps(event) + "\n"
+            if detector.alert is not None:
+                break
+        for event in detector.finish():
+            if event["event"] == "alert":
+                on_alert(event)
+            yield json.dumps(event) + "\n"
 
-⚡ Response Limits:
+    def generate():
+        if vosk_pool is None:
+            yield from run(StreamingDetector(yamnet, class_map, danger_sounds, keywords,
+                                             threshold=STREAM_DANGER_THRESHOLD))
+            return
+        with vosk_pool.recognizer() as rec:
+            yield from run(StreamingDetector(yamnet, class_map, danger_sounds, keywords,
+                                             recognizer=rec, threshold=STREAM_DANGER_THRESHOLD))
 
-Only respond to: safety concerns, emotional trauma, mental health stress, or greetings (hi/hello/check-in).
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
-For unrelated topics (coding, math, random questions), politely decline:
-“I’m designed specifically for emotional safety, trauma support, and mental health. I can’t answer that.”
+@app.route('/detect/jobs', methods=['POST'])
+def detect_job_submit():
+    """Store an upload and queue its analysis; returns 202 with the job ID at once"""
+    file = request.files.get('file')
+    if not file:
+        return jsonify({'error': 'No file provided'}), 400
+    try:
+        evidence_id, filepath = evidence_store.put(file.stream, file.filename)
+    except EvidenceTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    try:
+        job_id = detect_jobs.submit(evidence_id, filepath, client_location(), evidence_id=evidence_id)
+    except JobQueueFull as e:
+        evidence_store.compact(evidence_id)
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    return jsonify({
+        'job_id': job_id,
+        'status_url': url_for('detect_job_status', job_id=job_id),
+        'events_url': url_for('detect_job_events', job_id=job_id),
+    }), 202
 
-Modes of Response
+def job_view(job):
+    """Job record as returned to clients, with the SOS redirect once it alerts"""
+    if job['result'] is not None:
+        job['result'] = {k: v for k, v in job['result'].items() if k != 'cacheable'}
+        if job['result']['alert']:
+            job['redirect'] = url_for('sos', filename=job['evidence_id'])
+    return job
 
-[SAFETY MODE]
+@app.route('/detect/jobs/<job_id>')
+def detect_job_status(job_id):
+    """Current stage, progress events and (once decided) the result of a detection job"""
+    job = detect_jobs.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job ID'}), 404
+    return jsonify(job_view(job))
 
-Triggered by: danger/fear words → "unsafe", "help now", "track me", "alert guardians".
+@app.route('/detect/jobs/<job_id>/events')
+def detect_job_events(job_id):
+    """Progress of a detection job as server-sent events
 
-Clear, direct steps: SOS, share location, move to safe spot.
+    Emits one ``event: progress`` per stage, replaying any already passed,
+    then ``event: done`` with the final job record. Comment lines keep idle
+    connections open. ``Last-Event-ID`` resumes after a reconnect.
+    """
+    if detect_jobs.status(job_id) is None:
+        return jsonify({'error': 'Unknown or expired job ID'}), 404
+    since = request.headers.get('Last-Event-ID', '')
+    since = int(since) if since.isdigit() else 0
 
-Calm but firm.
+    def generate():
+        seen = since
+        while True:
+            polled = detect_jobs.events(job_id, since=seen)
+            if polled is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Job expired'})}\n\n"
+                return
+            events, finished = polled
+            for event in events:
+                seen += 1
+                yield f"id: {seen}\nevent: progress\ndata: {json.dumps(event)}\n\n"
+            if finished:
+                job = detect_jobs.status(job_id)
+                if job is not None:
+                    yield f"event: done\ndata: {json.dumps(job_view(job))}\n\n"
+                return
+            if not events:
+                yield ": keep-alive\n\n"
 
-30–50 words only.
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-Example:
+@app.route('/route')
+def safe_route():
+    """Safest walking route between ?from=lat,lon and ?to=lat,lon
 
-"SOS activated. Stay visible, move toward lighted areas. Sharing your location now with trusted contacts. Breathe steady — help is on the way."
+    ``safety_weight`` (default ROUTE_SAFETY_WEIGHT) sets how many extra metres
+    are worth avoiding an unsafe one; 0 gives the shortest route.
+    """
+    if street_graph is None:
+        return jsonify({'error': 'No street graph is configured'}), 503
+    try:
+        origin = parse_point(request.args['from'])
+        destination = parse_point(request.args['to'])
+        safety_weight = float(request.args.get('safety_weight', ROUTE_SAFETY_WEIGHT))
+        if not 0 <= safety_weight <= 100:
+            raise ValueError("safety_weight must be between 0 and 100")
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': f'Expected from=lat,lon and to=lat,lon: {e}'}), 400
 
-[SUPPORT MODE]
+    source, source_snap = street_graph.nearest(*origin)
+    target, target_snap = street_graph.nearest(*destination)
+    if max(source_snap, target_snap) > ROUTE_MAX_SNAP_M:
+        return jsonify({'error': f'No street within {ROUTE_MAX_SNAP_M:.0f} m of the requested points'}), 404
+    try:
+        with span('route'):
+            route = street_graph.route(source, target, safety_weight)
+    except RouteNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    route['snap_m'] = [round(source_snap, 1), round(target_snap, 1)]
+    return jsonify(route)
 
-Triggered by: stress/emotion words → "scared", "anxious", "lonely", "worthless".
+@app.route('/heatmap')
+def heatmap():
+    """Decayed incident scores in ?bbox=west,south,east,north, one entry per non-empty tile
 
-Validate feelings + give one coping method (breathing, grounding, affirmation).
+    Each tile lists ``[row, col, score]`` for its non-empty cells; cell
+    (row, col) spans ``cell_deg`` degrees north and the tile's
+    ``cell_lon_deg`` east of (south + row * cell_deg, west + col *
+    cell_lon_deg). ``level`` picks a zoom level instead of the finest one
+    that fits HEATMAP_MAX_TILES tiles.
+    """
+    try:
+        west, south, east, north = (float(x) for x in request.args['bbox'].split(','))
+        if not (-90 <= south <= north <= 90 and -180 <= west <= east <= 180):
+            raise ValueError("expected west,south,east,north with south <= north and west <= east")
+        level = request.args.get('level', type=int)
+        if level is not None and not 0 <= level < incident_heatmap.levels:
+            raise ValueError(f"level must be between 0 and {incident_heatmap.levels - 1}")
+        with span('heatmap'):
+            return jsonify(incident_heatmap.query(south, west, north, east, level=level))
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': f'Expected bbox=west,south,east,north: {e}'}), 400
 
-Warm, empathetic, short.
+@app.route('/incidents/<evidence_id>/similar')
+def similar_incidents(evidence_id):
+    """Past uploads whose YAMNet embedding is closest to this one's (?k=, default 5)
 
-Example:
+    Only similarity, alert flag and time are returned. Evidence IDs are the
+    sole access token for other people's recordings at /evidence/<id>, so
+    they never leave this route.
+    """
+    embedding = embedding_store.get(evidence_id)
+    if embedding is None:
+        return jsonify({'error': 'Unknown incident'}), 404
+    k = min(max(request.args.get('k', 5, type=int), 1), 50)
+    with span('similar'):
+        similar = embedding_store.similar(embedding, k=k, exclude=evidence_id)
+    return jsonify({'incident': evidence_id,
+                    'similar': [{key: incident[key] for key in ('similarity', 'alert', 't')} for incident in similar]})
 
-"I hear your fear. Let’s slow down: inhale 4, hold 4, exhale 6. Repeat twice. You are safe with me in this moment."
+@app.route('/sos')
+@app.route('/sos/<filename>')
+def sos(filename=None):
+    """SOS page with emergency alert and WhatsApp button
 
-[FRIENDLY MODE]
+    ``filename`` is an evidence ID; the audio player is only shown while the
+    store still holds that clip.
+    """
+    evidence_path = evidence_store.resolve(filename) if filename else None
+    return render_template('sos.html', filename=filename,
+                           evidence_url=url_for('evidence', evidence_id=filename) if evidence_path else None,
+                           evidence_type=evidence_store.mimetype(evidence_path) if evidence_path else None)
 
-Triggered by: casual greetings/tips → "hi", "motivate me", "check in".
+@app.route('/evidence/<evidence_id>')
+def evidence(evidence_id):
+    """Serve a stored evidence clip in whatever format it is currently kept"""
+    path = evidence_store.resolve(evidence_id)
+    if path is None:
+        return jsonify({'error': 'Unknown or expired evidence ID'}), 404
+    return send_file(path, mimetype=evidence_store.mimetype(path), conditional=True)
 
-Positive, light, uplifting, short.
+@app.route('/send_sos/<filename>')
+def send_sos(filename):
+    """Queue a WhatsApp SOS message and return immediately with its dispatch ID
 
-Example:
+    Repeat taps for the same incident (the evidence file, or an explicit
+    ?incident= ID) reuse the first dispatch instead of sending again. Without
+    Twilio credentials nothing is queued and the page says so.
+    """
+    # Never tell someone in danger that help is on the way when nothing can be sent.
+    if not twilio_sender.configured:
+        return ("<h2>❌ SOS could not be sent: WhatsApp alerts are not configured on this server.</h2>"
+                "<p>Call emergency services (911, 999, 112) directly.</p>"), 503
+    incident = request.args.get('incident') or filename
+    dispatch = sos_dispatcher.submit(incident, "🚨 SOS Alert! The girl is in danger!")
+    status_url = url_for('send_sos_status', dispatch_id=dispatch['id'])
+    status_link = f"<p><a href=\"{status_url}\">Delivery status</a></p>"
+    if dispatch['status'] == SOS_SENT:
+        return f"<h2>✅ SOS delivered. Dispatch ID: {dispatch['id']}</h2>{status_link}"
+    if dispatch['duplicate']:
+        return f"<h2>⏳ SOS for this incident is already being sent (not yet confirmed). Dispatch ID: {dispatch['id']}</h2>{status_link}"
+    return f"<h2>⏳ SOS queued, not yet confirmed as delivered. Dispatch ID: {dispatch['id']}</h2>{status_link}"
 
-"Hey, friend 🌸. I’m here with you. You’ve got this — let’s keep moving forward together."
+@app.route('/send_sos/status/<dispatch_id>')
+def send_sos_status(dispatch_id):
+    """Delivery status of a queued SOS message"""
+    dispatch = sos_dispatcher.status(dispatch_id)
+    if dispatch is None:
+        return jsonify({'error': 'Unknown dispatch ID'}), 404
+    dispatch.pop('body', None)
+    return jsonify(dispatch)
 
-Rules
+@app.route('/chatbot')
+def chatbot():
+    """Mental health chatbot page"""
+    return render_template('chatbot.html')
 
-Always 30–50 words.
 
-Emergency → actionable steps only.
+# Rolling per-session history, trimmed to CHAT_HISTORY_TOKENS / CHAT_MAX_TURNS
+# and evicted after CHAT_SESSION_TTL idle seconds or beyond CHAT_MAX_SESSIONS.
+chat_sessions = ChatSessionStore(
+    max_sessions=int(os.getenv('CHAT_MAX_SESSIONS', '1000')),
+    idle_ttl=int(os.getenv('CHAT_SESSION_TTL', '1800')),
+    token_budget=int(os.getenv('CHAT_HISTORY_TOKENS', '2000')),
+    max_turns=int(os.getenv('CHAT_MAX_TURNS', '20')),
+)
 
-Emotional support → empathy + one grounding action.
+# Messages in SAFETY, FRIENDLY or OFF-TOPIC mode never reach Gemini.
+chat_router = ChatRouter()
 
-Friendly → warm and short.
+# Server-side time-to-first-token of streamed replies, in milliseconds.
+chat_ttft_ms = deque(maxlen=1024)
 
-Anything off-topic → politely decline...."""
+@app.route('/chat', methods=['POST'])
+def chat():
+    """Chatbot API endpoint"""
+    try:
+        user_message = request.json.get('message', '')
         
-        # Combine system prompt with user message
-        full_prompt = f"{system_prompt}\n\nUser: {user_message}\n\nMindCare:"
+        if not user_message:
+            return jsonify({'error': 'No message provided'}), 400
+        
+        session = chat_sessions.get(request.json.get('session_id'))
         
-        # Generate response using Gemini
-        response = gemini_model.generate_content(full_prompt)
-        bot_response = response.text
+        # Safety, greeting and off-topic messages are answered locally
+        mode, local_reply = chat_router.route(user_message)
+        if local_reply is not None:
+            session.add_exchange(user_message, local_reply)
+            return jsonify({'response': local_reply, 'mode': mode, 'session_id': session.id})
         
-        return jsonify({'response': bot_response})
+        # Generate response using Gemini, with this session's recent history
+        with span('gemini'):
+            response = gemini_model.generate_content(session.contents(user_message))
+            bot_response = response.text
+        session.add_exchange(user_message, bot_response)
+        
+        return jsonify({'response': bot_response, 'mode': mode, 'session_id': session.id})
     
     except Exception as e:
         return jsonify({'error': f'Error generating response: {str(e)}'}), 500
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Chatbot API endpoint streaming the reply as server-sent events
+
+    Emits ``data: {"token": ...}`` events as Gemini generates text, then an
+    ``event: done`` carrying the time-to-first-token and total time.
+    """
+    user_message = (request.json or {}).get('message', '')
+    if not user_message:
+        return jsonify({'error': 'No message provided'}), 400
+    session = chat_sessions.get(request.json.get('session_id'))
+
+    mode, local_reply = chat_router.route(user_message)
+    if local_reply is not None:
+        session.add_exchange(user_message, local_reply)
+        done = {'ttft_ms': 0.0, 'total_ms': 0.0, 'mode': mode, 'session_id': session.id}
+        local_events = (f"data: {json.dumps({'token': local_reply, 'mode': mode})}\n\n"
+                        f"event: done\ndata: {json.dumps(done)}\n\n")
+        return Response(local_events, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+    if gemini_model is None:
+        return jsonify({'error': 'Chatbot is not configured'}), 503
+
+    def generate():
+        start = time.perf_counter()
+        ttft = None
+        reply = []
+        try:
+            with span('gemini'):
+                for chunk in gemini_model.generate_content(session.contents(user_message), stream=True):
+                    text = chunk.text
+                    if not text:
+                        continue
+                    reply.append(text)
+                    if ttft is None:
+                        ttft = (time.perf_counter() - start) * 1000
+                        chat_ttft_ms.append(ttft)
+                    yield f"data: {json.dumps({'token': text})}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': f'Error generating response: {str(e)}'})}\n\n"
+            return
+        session.add_exchange(user_message, "".join(reply))
+        total = (time.perf_counter() - start) * 1000
+        done = {'ttft_ms': round(ttft, 1) if ttft is not None else None, 'total_ms': round(total, 1),
+                'mode': mode, 'session_id': session.id}
+        yield f"event: done\ndata: {json.dumps(done)}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/chat/sessions')
+def chat_session_metrics():
+    """Per-session memory and prompt-size metrics, least recently used first
+
+    Sessions are listed without their IDs, which are the only key to a
+    session's history, and without message content.
+    """
+    return jsonify({
+        'system_instruction_tokens': estimate_tokens(CHAT_SYSTEM_PROMPT),
+        'sessions': chat_sessions.sessions(),
+    })
+
+@app.route('/healthz')
+def healthz():
+    """Liveness probe"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/healthz/ready')
+def healthz_ready():
+    """Readiness probe: 200 only once every engine is loaded and warm"""
+    ready = readiness.is_ready()
+    return jsonify({'ready': ready, 'engines': readiness.snapshot()}), (200 if ready else 503)
+
+@app.route('/stats')
+def stats():
+    """Runtime statistics for the detection engines"""
+    return jsonify({
+        'vosk_pools': pool_stats(),
+        'yamnet_batcher': yamnet_batcher.stats() if yamnet_batcher is not None else None,
+        'energy_gate': gate_stats.stats(),
+        'result_cache': result_cache.stats(),
+        'evidence_store': evidence_store.stats(),
+        'detect_jobs': detect_jobs.stats(),
+        'sos_dispatch': sos_dispatcher.stats(),
+        'street_graph': street_graph.stats() if street_graph is not None else None,
+        'incident_heatmap': incident_heatmap.stats(),
+        'embedding_store': embedding_store.stats(),
+        'danger_head': {'threshold': danger_head.threshold, 'path': DANGER_HEAD_PATH} if danger_head else None,
+        'inference_service': inference_client.stats() if inference_client is not None else None,
+        'chat_router': chat_router.stats(),
+        'chat_sessions': chat_sessions.stats(),
+        'chat_stream': {
+            'streams': len(chat_ttft_ms),
+            'ttft_ms_p50': round(float(np.percentile(chat_ttft_ms, 50)), 1) if chat_ttft_ms else None,
+            'ttft_ms_p99': round(float(np.percentile(chat_ttft_ms, 99)), 1) if chat_ttft_ms else None,
+        },
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text-format metrics"""
+    if not metrics.ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/crisis-resources')
 def crisis_resources():
     """Crisis resources API endpoint"""
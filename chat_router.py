@@ -0,0 +1,117 @@
+"""Local intent router in front of the Gemini chatbot.
+
+Each message is classified into one of the system prompt's modes with
+precompiled keyword tables. SAFETY, FRIENDLY and OFF-TOPIC messages are
+answered from fixed response sets straight away, with no network call.
+Emergency replies therefore stay instant even when Gemini is slow or
+unreachable. Only SUPPORT messages, and anything the tables do not
+recognise, go to the LLM. OFF-TOPIC only matches unambiguous requests: a
+distressed user wrongly declined costs far more than one extra LLM call.
+"""
+import random
+import re
+import threading
+
+SAFETY = "SAFETY"
+SUPPORT = "SUPPORT"
+FRIENDLY = "FRIENDLY"
+OFF_TOPIC = "OFF-TOPIC"
+
+
+def _words(*phrases):
+    """Compile phrases into one case-insensitive, word-bounded alternation."""
+    alternation = "|".join(re.escape(p).replace(r"\ ", r"\s+") for p in phrases)
+    return re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE)
+
+
+SAFETY_PATTERN = _words(
+    "unsafe", "help now", "help me now", "track me", "alert guardians", "alert my guardians",
+    "in danger", "emergency", "sos", "being followed", "following me", "someone is following",
+    "chasing me", "attacked", "attacking me", "kidnap", "kidnapped", "call police", "call the police",
+    "not safe", "save me", "leave me alone", "stay away",
+    "hit me", "hits me", "hitting me", "hurt me", "hurts me", "hurting me", "beat me", "beats me",
+    "beating me", "raped", "rape", "assaulted", "sexually assaulted",
+)
+SUPPORT_PATTERN = _words(
+    "scared", "afraid", "anxious", "anxiety", "panic", "lonely", "alone", "worthless", "sad",
+    "depressed", "stressed", "stress", "hopeless", "overwhelmed", "cry", "crying", "hurt", "trauma",
+    "nightmare", "can't sleep", "suicide", "kill myself", "harm myself", "end it all",
+)
+# Greetings only count as FRIENDLY when they are the whole message.
+GREETING_PATTERN = re.compile(
+    r"^\s*(?:hi+|hello+|hey+|hiya|yo|namaste|good\s+(?:morning|afternoon|evening|night))"
+    r"(?:\s+(?:there|friend|bestie|mindcare))?\s*[!.?\s]*$",
+    re.IGNORECASE,
+)
+FRIENDLY_PATTERN = _words("motivate me", "check in", "check-in", "safety tips", "safety tip", "cheer me up")
+# Words like "solve", "function" or "program" are not enough on their own:
+# "I can't function" or "I can't solve anything" are calls for support.
+OFF_TOPIC_PATTERN = _words(
+    "capital of", "write code", "write some code", "write a program", "write a function",
+    "write a script", "python code", "javascript code", "sql query", "html code", "debug my code",
+    "fix my code",
+    "solve this equation", "solve the equation", "derivative of", "integral of", "do my homework",
+    "recipe for", "weather forecast", "stock price", "bitcoin price", "crypto price",
+    "football score", "cricket score",
+)
+
+SAFETY_REPLIES = (
+    "SOS mode: stay visible and move toward a lit, busy place now. Use the SOS button to alert "
+    "your trusted contacts and share your live location. If you are in immediate danger, call 112. "
+    "Breathe steady — help is on the way.",
+    "I'm with you. Get to a public, well-lit spot or a shop and stay near people. Tap SOS to send "
+    "your location to your guardians right now, and call 112 if anyone approaches you. Keep your "
+    "phone in hand.",
+    "Act now: head toward people and light, keep your phone unlocked, and press SOS so your "
+    "contacts get your location. Call 112 or 100 for police if you feel threatened. Stay calm and "
+    "keep moving to safety.",
+)
+FRIENDLY_REPLIES = (
+    "Hey, friend 🌸. I'm here with you. You've got this — let's keep moving forward together. "
+    "Tell me how you're feeling today, or ask me for a quick safety tip whenever you need one.",
+    "Hi there 💜 Glad you checked in. Walking confident is your best armor, and I'm right here if "
+    "anything feels off. What's on your mind today? I'm listening, always.",
+    "Hello! 🌟 You showed up for yourself today, and that matters. Share your location with someone "
+    "you trust when you head out, and remember I'm one message away whenever you need me.",
+)
+OFF_TOPIC_REPLY = (
+    "I'm designed specifically for emotional safety, trauma support, and mental health. I can't "
+    "answer that."
+)
+
+
+class ChatRouter:
+    """Classifies chat messages and answers the non-LLM modes locally."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {SAFETY: 0, SUPPORT: 0, FRIENDLY: 0, OFF_TOPIC: 0}
+
+    def classify(self, message):
+        """Map a message to SAFETY, SUPPORT, FRIENDLY or OFF-TOPIC."""
+        if SAFETY_PATTERN.search(message):
+            return SAFETY
+        if SUPPORT_PATTERN.search(message):
+            return SUPPORT
+        if GREETING_PATTERN.match(message) or FRIENDLY_PATTERN.search(message):
+            return FRIENDLY
+        if OFF_TOPIC_PATTERN.search(message):
+            return OFF_TOPIC
+        return SUPPORT
+
+    def route(self, message):
+        """Return ``(mode, reply)``; ``reply`` is None when the LLM should answer."""
+        mode = self.classify(message)
+        with self._lock:
+            self.counts[mode] += 1
+        if mode == SAFETY:
+            return mode, random.choice(SAFETY_REPLIES)
+        if mode == FRIENDLY:
+            return mode, random.choice(FRIENDLY_REPLIES)
+        if mode == OFF_TOPIC:
+            return mode, OFF_TOPIC_REPLY
+        return mode, None
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
@@ -0,0 +1,117 @@
+"""Server-side chat sessions with bounded, token-budgeted history.
+
+Each session keeps a rolling window of user and model turns in the
+``contents`` format ``generate_content`` expects. The oldest turns are dropped
+once the window exceeds ``token_budget`` (estimated at ~4 characters per
+token) or ``max_turns``. Sessions are evicted least-recently-used beyond
+``max_sessions`` and after ``idle_ttl`` seconds without a message.
+"""
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+def estimate_tokens(text):
+    """Cheap token estimate used for budgeting (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+class ChatSession:
+    def __init__(self, session_id, token_budget, max_turns):
+        self.id = session_id
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.turns = []
+        self.tokens = 0
+        self.created = time.time()
+        self.last_used = self.created
+        self.requests = 0
+        self.prompt_tokens_total = 0
+
+    def contents(self, user_message):
+        """History plus the new user message, ready for ``generate_content``."""
+        contents = [{"role": t["role"], "parts": [t["text"]]} for t in self.turns]
+        contents.append({"role": "user", "parts": [user_message]})
+        self.requests += 1
+        self.prompt_tokens_total += self.tokens + estimate_tokens(user_message)
+        return contents
+
+    def add_exchange(self, user_message, reply):
+        for role, text in (("user", user_message), ("model", reply)):
+            tokens = estimate_tokens(text)
+            self.turns.append({"role": role, "text": text, "tokens": tokens})
+            self.tokens += tokens
+        # Drop whole exchanges from the front so the window starts on a user turn.
+        while self.turns and (self.tokens > self.token_budget or len(self.turns) > self.max_turns):
+            for _ in range(min(2, len(self.turns))):
+                self.tokens -= self.turns.pop(0)["tokens"]
+
+    def memory_bytes(self):
+        return sum(sys.getsizeof(t["text"]) for t in self.turns)
+
+    def metrics(self):
+        # No session ID: it is the only key to the session's history.
+        return {
+            "turns": len(self.turns),
+            "history_tokens": self.tokens,
+            "memory_bytes": self.memory_bytes(),
+            "requests": self.requests,
+            "avg_prompt_tokens": round(self.prompt_tokens_total / self.requests, 1) if self.requests else 0.0,
+            "idle_seconds": round(time.time() - self.last_used, 1),
+        }
+
+
+class ChatSessionStore:
+    """LRU + idle-TTL store of ``ChatSession`` objects."""
+
+    def __init__(self, max_sessions=1000, idle_ttl=1800, token_budget=2000, max_turns=20):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def get(self, session_id=None):
+        """Return the session for ``session_id``, creating a new one if unknown or expired."""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = ChatSession(uuid.uuid4().hex, self.token_budget, self.max_turns)
+                self._sessions[session.id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+            self._sessions.move_to_end(session.id)
+            session.last_used = now
+            return session
+
+    def _expire(self, now):
+        # Sessions are in least-recently-used order, so expired ones are at the front.
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_used < self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+    def sessions(self):
+        with self._lock:
+            self._expire(time.time())
+            return [s.metrics() for s in self._sessions.values()]
+
+    def stats(self):
+        metrics = self.sessions()
+        return {
+            "sessions": len(metrics),
+            "max_sessions": self.max_sessions,
+            "evicted": self.evicted,
+            "memory_bytes": sum(m["memory_bytes"] for m in metrics),
+            "history_tokens": sum(m["history_tokens"] for m in metrics),
+            "token_budget": self.token_budget,
+        }
@@ -0,0 +1,153 @@
+"""Background detection jobs with progress events.
+
+A POST to ``/detect`` holds its worker for the whole decode, YAMNet and Vosk
+run. ``/detect/jobs`` only stores the upload and queues a job, then returns
+its ID. Jobs run on a small fixed pool; at most ``max_pending`` may be queued
+or running, and beyond that ``submit`` raises ``JobQueueFull`` so the route
+can answer 503 instead of queueing without bound. Each job keeps an ordered
+list of progress events:
+
+    queued -> decoded -> sound-classified -> transcribed -> decided
+
+A stage may be missing. Silent clips skip both engines, an early alert does
+not wait for the other engine, and cached results go straight to
+``decided``. A job that raises ends with ``failed``. Clients poll ``status``
+or block in ``events`` for anything newer than the last event they saw.
+Finished jobs are forgotten after ``ttl`` seconds.
+"""
+import contextvars
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+QUEUED = "queued"
+DECODED = "decoded"
+SOUND_CLASSIFIED = "sound-classified"
+TRANSCRIBED = "transcribed"
+DECIDED = "decided"
+FAILED = "failed"
+
+FINISHED = (DECIDED, FAILED)
+
+
+class JobQueueFull(Exception):
+    """``max_pending`` jobs are already queued or running."""
+
+
+class DetectJobs:
+    """Runs ``run(progress, *args)`` per job and records the events it reports."""
+
+    def __init__(self, run, workers=2, max_pending=32, ttl=600):
+        self.run = run
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="detect-job")
+
+    def submit(self, *args, **fields):
+        """Queue a job and return its ID; extra ``fields`` are kept on the job record."""
+        now = time.time()
+        with self._cond:
+            self._expire(now)
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise JobQueueFull(f"{self._pending} detection jobs already pending")
+            job = dict(fields, id=uuid.uuid4().hex, status=QUEUED, result=None, error=None,
+                       created_at=now, finished_at=None, events=[{"stage": QUEUED, "ms": 0.0}])
+            self._jobs[job["id"]] = job
+            self._pending += 1
+            self.submitted += 1
+        # Fresh context per job so its spans are traced on their own.
+        self._executor.submit(contextvars.Context().run, self._run, job, args)
+        return job["id"]
+
+    def status(self, job_id):
+        """Snapshot of a job, or None if unknown or expired."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job is not None else None
+
+    def events(self, job_id, since=0, timeout=15):
+        """Events after the first ``since``, waiting up to ``timeout`` for a new one.
+
+        Returns ``(events, finished)``, or None if the job is unknown.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return None
+                finished = job["status"] in FINISHED
+                remaining = deadline - time.monotonic()
+                if len(job["events"]) > since or finished or remaining <= 0:
+                    return [dict(e) for e in job["events"][since:]], finished
+                self._cond.wait(remaining)
+
+    def stats(self):
+        with self._cond:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "by_status": counts,
+            }
+
+    def _run(self, job, args):
+        token = metrics.start_trace("detect_job")
+        try:
+            result = self.run(lambda stage, **data: self._progress(job, stage, data), *args)
+        except Exception as e:
+            print(f"Detection job {job['id']} failed: {e}")
+            self._finish(job, FAILED, error=str(e))
+        else:
+            self._finish(job, DECIDED, result=result)
+        finally:
+            metrics.end_trace(token, job=job["id"])
+
+    def _progress(self, job, stage, data):
+        with self._cond:
+            event = dict(data, stage=stage, ms=round((time.time() - job["created_at"]) * 1000, 3))
+            job["events"].append(event)
+            job["status"] = stage
+            self._cond.notify_all()
+
+    def _finish(self, job, stage, result=None, error=None):
+        with self._cond:
+            job["result"] = result
+            job["error"] = error
+            job["finished_at"] = time.time()
+            job["events"].append({"stage": stage, "ms": round((job["finished_at"] - job["created_at"]) * 1000, 3)})
+            job["status"] = stage
+            self._pending -= 1
+            if stage == DECIDED:
+                self.completed += 1
+            else:
+                self.failed += 1
+            self._cond.notify_all()
+
+    def _expire(self, now):
+        for job_id, job in list(self._jobs.items()):
+            if job["finished_at"] is not None and now - job["finished_at"] > self.ttl:
+                del self._jobs[job_id]
+
+    @staticmethod
+    def _snapshot(job):
+        snapshot = {k: v for k, v in job.items() if k != "events"}
+        snapshot["events"] = [dict(e) for e in job["events"]]
+        return snapshot
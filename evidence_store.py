@@ -0,0 +1,295 @@
+"""Content-addressed store for uploaded audio evidence.
+
+Uploads used to be saved under their client-supplied names in
+``static/uploads``. Two clips with the same name overwrote each other, and
+every file stayed there forever as uncompressed WAV. Here the upload is
+copied in chunks to a temporary file in the store, with a size cap, while it
+is hashed. It is then renamed to ``blobs/<xx>/<sha256><ext>``, so a re-upload
+of the same clip costs no extra space. Each ``put`` holds a lease on its blob
+until the matching ``compact``; once no lease is left, uncompressed audio is
+transcoded to FLAC (at the source bit depth) or Opus in the background. A
+retention pass deletes blobs stored more than ``max_age`` ago and, oldest
+access first, blobs beyond ``quota_bytes`` (sparing any touched within
+``grace`` seconds). The file's mtime records when it was stored and its atime
+when it was last accessed.
+"""
+import glob
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+from models.resample import resample
+
+CHUNK_SIZE = 65536
+# Formats worth transcoding; anything else is already compressed.
+UNCOMPRESSED = (".wav", ".aif", ".aiff")
+AUDIO_EXTENSIONS = (".wav", ".aif", ".aiff", ".flac", ".ogg", ".opus", ".mp3", ".m4a", ".webm")
+MIMETYPES = {
+    ".wav": "audio/wav", ".aif": "audio/aiff", ".aiff": "audio/aiff", ".flac": "audio/flac",
+    ".ogg": "audio/ogg", ".opus": "audio/ogg", ".mp3": "audio/mpeg", ".m4a": "audio/mp4",
+    ".webm": "audio/webm",
+}
+# The subtype is None for FLAC: it follows the source (see _flac_subtype).
+CODECS = {"flac": (".flac", "FLAC", None), "opus": (".opus", "OGG", "OPUS")}
+FLAC_SUBTYPES = ("PCM_S8", "PCM_16", "PCM_24")
+# libsndfile's Opus encoder only takes these rates.
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+EVIDENCE_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _flac_subtype(source):
+    """FLAC subtype keeping the source's bit depth; float and 32-bit audio get 24-bit."""
+    return source if source in FLAC_SUBTYPES else "PCM_24"
+
+
+class EvidenceTooLarge(Exception):
+    """The upload exceeded the store's ``max_bytes`` cap."""
+
+
+class EvidenceStore:
+    """Blobs named by SHA-256 under ``root``, with a size cap, transcoding and retention."""
+
+    def __init__(self, root, max_bytes=25 * 2**20, quota_bytes=2 * 2**30, max_age=30 * 86400,
+                 codec="flac", prune_every=50, grace=300):
+        if codec not in CODECS and codec != "none":
+            raise ValueError(f"Unknown evidence codec {codec!r}; expected flac, opus or none")
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.tmp_dir = os.path.join(root, "tmp")
+        self.max_bytes = max_bytes
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        self.codec = codec
+        self.prune_every = prune_every
+        # Blobs touched this recently are never evicted for quota, so a clip
+        # is not deleted while it is still being analyzed or played back.
+        self.grace = grace
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # Evidence ID -> puts not yet followed by compact(); leased blobs are
+        # never transcoded or pruned, since a request may still be reading them.
+        self._leases = {}
+        # One background thread: transcodes and retention passes never compete
+        # with request threads for more than one core.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="evidence")
+        self._puts = 0
+        self.stored = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.bytes_received = 0
+        self.bytes_written = 0
+        self.transcoded = 0
+        self.transcode_saved_bytes = 0
+        self.evicted = 0
+        self.usage_bytes = 0
+        self.blobs = 0
+        self._executor.submit(self.prune)
+
+    def put(self, stream, filename=""):
+        """Stream ``stream`` into the store and return ``(evidence_id, path)``.
+
+        Raises ``EvidenceTooLarge`` once more than ``max_bytes`` have been read;
+        the partial file is removed. The blob stays leased, and so at ``path``,
+        until ``compact(evidence_id)`` is called.
+        """
+        ext = os.path.splitext(filename)[1].lower()
+        if ext not in AUDIO_EXTENSIONS:
+            ext = ".bin"
+        digest = hashlib.sha256()
+        size = 0
+        tmp = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        try:
+            with open(tmp, "wb") as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        with self._lock:
+                            self.rejected += 1
+                        raise EvidenceTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    out.write(chunk)
+            evidence_id = digest.hexdigest()
+            # Resolving and leasing under the lock keeps a transcode from
+            # swapping the blob out between the two.
+            with self._lock:
+                existing = self._resolve(evidence_id)
+                if existing is not None:
+                    os.remove(tmp)
+                    self._lease(evidence_id)
+                    self.deduplicated += 1
+                    self.bytes_received += size
+                    return evidence_id, existing
+                path = self._blob_path(evidence_id, ext)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+                self._lease(evidence_id)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        with self._lock:
+            self.stored += 1
+            self.blobs += 1
+            self.usage_bytes += size
+            self.bytes_received += size
+            self.bytes_written += size
+            self._puts += 1
+            prune = self._puts % self.prune_every == 0 or self.usage_bytes > self.quota_bytes
+        if prune:
+            self._executor.submit(self.prune)
+        return evidence_id, path
+
+    def resolve(self, evidence_id):
+        """Current path of a blob, or None if unknown or evicted. Marks it as accessed."""
+        with self._lock:
+            return self._resolve(evidence_id)
+
+    def _resolve(self, evidence_id):
+        if not EVIDENCE_ID.match(evidence_id or ""):
+            return None
+        matches = glob.glob(self._blob_path(evidence_id, ".*"))
+        if not matches:
+            return None
+        # A transcode may briefly leave both versions; prefer the compressed one.
+        path = min(matches, key=lambda p: os.path.splitext(p)[1] in UNCOMPRESSED)
+        try:
+            # Only the atime moves; the mtime still says when it was stored.
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except OSError:
+            return None
+        return path
+
+    def _lease(self, evidence_id):
+        self._leases[evidence_id] = self._leases.get(evidence_id, 0) + 1
+
+    @staticmethod
+    def mimetype(path):
+        return MIMETYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+
+    def compact(self, evidence_id):
+        """Release a ``put``'s lease and transcode the blob in the background once none is left."""
+        with self._lock:
+            leases = self._leases.get(evidence_id, 0) - 1
+            if leases > 0:
+                self._leases[evidence_id] = leases
+                return
+            self._leases.pop(evidence_id, None)
+        if self.codec != "none":
+            self._executor.submit(self._transcode, evidence_id)
+
+    def _blob_path(self, evidence_id, ext):
+        return os.path.join(self.blob_dir, evidence_id[:2], evidence_id + ext)
+
+    def _transcode(self, evidence_id):
+        path = self.resolve(evidence_id)
+        if path is None or os.path.splitext(path)[1] not in UNCOMPRESSED:
+            return
+        ext, fmt, subtype = CODECS[self.codec]
+        target = self._blob_path(evidence_id, ext)
+        tmp = os.path.join(self.tmp_dir, uuid.uuid4().hex + ext)
+        try:
+            if subtype is None:
+                subtype = _flac_subtype(sf.info(path).subtype)
+            data, sr = sf.read(path, dtype="float32", always_2d=True)
+            if self.codec == "opus" and sr not in OPUS_RATES:
+                channels = [resample(data[:, c], sr, 48000) for c in range(data.shape[1])]
+                data = np.stack(channels, axis=1)
+                sr = 48000
+            sf.write(tmp, data, sr, format=fmt, subtype=subtype)
+            stat = os.stat(path)
+            before, after = stat.st_size, os.path.getsize(tmp)
+            if after >= before:
+                os.remove(tmp)
+                return
+            # The compressed copy keeps the original's stored/accessed times.
+            os.utime(tmp, (stat.st_atime, stat.st_mtime))
+            with self._lock:
+                if self._leases.get(evidence_id):
+                    # A duplicate upload resolved the original meanwhile; its
+                    # compact() will transcode again once it is done.
+                    os.remove(tmp)
+                    return
+                os.replace(tmp, target)
+                os.remove(path)
+        except Exception as e:
+            print(f"Evidence transcode error for {evidence_id}: {e}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        with self._lock:
+            self.transcoded += 1
+            self.transcode_saved_bytes += before - after
+            self.bytes_written += after
+            self.usage_bytes -= before - after
+
+    def prune(self):
+        """Delete expired blobs, then least recently accessed ones until under quota."""
+        now = time.time()
+        blobs = []
+        usage = 0
+        evicted = 0
+        pinned = 0
+        with self._lock:
+            leased = set(self._leases)
+        try:
+            for path in glob.glob(os.path.join(self.blob_dir, "*", "*")):
+                stat = os.stat(path)
+                if os.path.basename(path).split(".")[0] in leased:
+                    usage += stat.st_size
+                    pinned += 1
+                    continue
+                if now - stat.st_mtime > self.max_age:
+                    os.remove(path)
+                    evicted += 1
+                    continue
+                blobs.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+                usage += stat.st_size
+            blobs.sort()
+            while blobs and usage > self.quota_bytes and now - blobs[0][0] > self.grace:
+                _, size, path = blobs.pop(0)
+                os.remove(path)
+                usage -= size
+                evicted += 1
+            # Temp files older than an hour are left over from crashed uploads.
+            for name in os.listdir(self.tmp_dir):
+                path = os.path.join(self.tmp_dir, name)
+                if now - os.path.getmtime(path) > 3600:
+                    os.remove(path)
+        except OSError as e:
+            print(f"Evidence prune error: {e}")
+        with self._lock:
+            self.evicted += evicted
+            self.usage_bytes = usage
+            self.blobs = len(blobs) + pinned
+
+    def stats(self):
+        with self._lock:
+            return {
+                "blobs": self.blobs,
+                "usage_bytes": self.usage_bytes,
+                "leased": len(self._leases),
+                "quota_bytes": self.quota_bytes,
+                "max_bytes": self.max_bytes,
+                "codec": self.codec,
+                "stored": self.stored,
+                "deduplicated": self.deduplicated,
+                "rejected": self.rejected,
+                "transcoded": self.transcoded,
+                "transcode_saved_bytes": self.transcode_saved_bytes,
+                "evicted": self.evicted,
+                # Bytes written to disk per byte received; dedup and
+                # transcoding pull it below 1 over time.
+                "write_amplification": round(self.bytes_written / self.bytes_received, 4)
+                if self.bytes_received else 0.0,
+            }
@@ -0,0 +1,218 @@
+"""Time-decayed incident heatmap on a tiled lat/lon grid.
+
+Alerts raised by the detection routes used to be forgotten after the redirect
+to ``/sos``. When the client sends its coordinates, each alert is now added
+to a grid of ``cell_m`` cells, grouped into tiles of ``tile_cells`` x
+``tile_cells`` cells. Cells are ``cell_m`` tall everywhere; their width in
+degrees of longitude is scaled by 1 / cos(latitude) at the centre of their
+row of tiles, so they stay close to ``cell_m`` wide away from the equator.
+There are ``levels`` zoom levels, each doubling the cell size. Adding an
+incident touches one cell per level. A ``bbox`` query picks the finest level
+at which the box spans at most ``max_tiles`` tiles, and then reads each of
+those tiles as one small array. No work depends on the number of incidents
+recorded.
+
+Scores decay exponentially with ``half_life``. Rewriting every cell as time
+passes would be too costly, so each increment is stored scaled by
+``2 ** ((t - epoch) / half_life)``. Reads scale back by the current factor.
+When the factor grows large, every tile is rebased onto a new epoch once,
+and tiles that have decayed to nothing are dropped.
+
+With ``log_path`` each incident is also appended as a JSON line. Every
+process that shares the file tails it before answering, so all gunicorn
+workers see the same map, and the map survives restarts. ``incident`` IDs
+(the evidence hash) keep retried uploads from counting twice.
+"""
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+METRES_PER_DEGREE = 111_320
+# Rebase once increments reach 2**REBASE_AFTER half-lives past the epoch.
+REBASE_AFTER = 32
+# Cells below this decayed score are left out of responses.
+MIN_SCORE = 1e-3
+# Keeps longitude cells finite in the tile rows at the poles.
+MIN_COS_LAT = 0.01
+
+
+class IncidentHeatmap:
+    """Tiled multi-level grid of exponentially decaying incident scores."""
+
+    def __init__(self, cell_m=100, tile_cells=16, levels=13, half_life=7 * 86400, max_tiles=64,
+                 log_path=None, max_incident_ids=10000):
+        self.cell_deg = cell_m / METRES_PER_DEGREE
+        self.tile_cells = tile_cells
+        self.levels = levels
+        self.half_life = half_life
+        self.max_tiles = max_tiles
+        self.log_path = log_path
+        self.max_incident_ids = max_incident_ids
+        self._lock = threading.Lock()
+        self._tiles = {}
+        self._epoch = time.time()
+        self._incident_ids = OrderedDict()
+        self._log_offset = 0
+        self.incidents = 0
+        self.duplicates = 0
+        self.rebases = 0
+        with self._lock:
+            self._sync()
+
+    def add(self, lat, lon, weight=1.0, incident=None, kind="detection", t=None):
+        """Record an incident at (lat, lon); returns False if ``incident`` was already recorded."""
+        event = {"t": round(time.time() if t is None else t, 3), "lat": round(float(lat), 6),
+                 "lon": round(float(lon), 6), "w": float(weight), "id": incident, "kind": kind}
+        with self._lock:
+            if self.log_path is None:
+                return self._apply(event)
+            # One short O_APPEND write per line, so concurrent writers never interleave.
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(event) + "\n")
+            before = self.incidents
+            self._sync()
+            return self.incidents > before
+
+    def _sync(self):
+        """Apply lines other processes (or we) appended to the log since the last call."""
+        if self.log_path is None:
+            return
+        try:
+            with open(self.log_path, "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # A line still being written is picked up next time.
+        end = data.rfind(b"\n") + 1
+        self._log_offset += end
+        for line in data[:end].splitlines():
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                continue
+
+    def _apply(self, event):
+        if event.get("id") is not None:
+            if event["id"] in self._incident_ids:
+                self.duplicates += 1
+                return False
+            self._incident_ids[event["id"]] = None
+            if len(self._incident_ids) > self.max_incident_ids:
+                self._incident_ids.popitem(last=False)
+        exponent = (event["t"] - self._epoch) / self.half_life
+        if exponent > REBASE_AFTER:
+            self._rebase(event["t"])
+            exponent = 0.0
+        value = event["w"] * 2.0 ** exponent
+        for level in range(self.levels):
+            row, col = self._cell(event["lat"], event["lon"], level)
+            key = (level, row // self.tile_cells, col // self.tile_cells)
+            tile = self._tiles.get(key)
+            if tile is None:
+                tile = self._tiles[key] = np.zeros((self.tile_cells, self.tile_cells))
+            tile[row % self.tile_cells, col % self.tile_cells] += value
+        self.incidents += 1
+        return True
+
+    def _rebase(self, t):
+        factor = 2.0 ** (-(t - self._epoch) / self.half_life)
+        for key, tile in list(self._tiles.items()):
+            tile *= factor
+            if tile.max() < MIN_SCORE:
+                del self._tiles[key]
+        self._epoch = t
+        self.rebases += 1
+
+    def _cell(self, lat, lon, level):
+        row = int(math.floor((lat + 90.0) / (self.cell_deg * 2 ** level)))
+        return row, self._col(lon, row // self.tile_cells, level)
+
+    def _col(self, lon, tile_row, level):
+        return int(math.floor((lon + 180.0) / self._lon_size(tile_row, level)))
+
+    def _lon_size(self, tile_row, level):
+        """Cell width in degrees of longitude in one row of tiles."""
+        size = self.cell_deg * 2 ** level
+        centre = min(90.0, (tile_row + 0.5) * self.tile_cells * size - 90.0)
+        return size / max(math.cos(math.radians(centre)), MIN_COS_LAT)
+
+    def _decay(self, now):
+        return 2.0 ** (-(now - self._epoch) / self.half_life)
+
+    def score_at(self, lat, lon, now=None):
+        """Decayed score of the finest cell containing (lat, lon)."""
+        with self._lock:
+            self._sync()
+            row, col = self._cell(lat, lon, 0)
+            tile = self._tiles.get((0, row // self.tile_cells, col // self.tile_cells))
+            if tile is None:
+                return 0.0
+            return float(tile[row % self.tile_cells, col % self.tile_cells]) * self._decay(
+                time.time() if now is None else now)
+
+    def query(self, south, west, north, east, level=None, now=None):
+        """Non-empty cells of every tile overlapping the box, at the finest level that fits ``max_tiles``.
+
+        Raises ValueError if the box spans more than ``max_tiles`` tiles at
+        ``level`` (or at the coarsest level when none is given).
+        """
+        now = time.time() if now is None else now
+        levels = range(self.levels) if level is None else (level,)
+        for level in levels:
+            tile_range = self._tile_range(south, west, north, east, level)
+            if tile_range is not None:
+                break
+        else:
+            raise ValueError(f"Box spans more than {self.max_tiles} tiles; zoom in")
+        with self._lock:
+            self._sync()
+            decay = self._decay(now)
+            size = self.cell_deg * 2 ** level
+            tiles = []
+            for tile_row, tile_col in tile_range:
+                tile = self._tiles.get((level, tile_row, tile_col))
+                if tile is None:
+                    continue
+                scores = tile * decay
+                rows, cols = np.nonzero(scores >= MIN_SCORE)
+                if not len(rows):
+                    continue
+                lon_size = self._lon_size(tile_row, level)
+                tiles.append({
+                    "tile": [level, tile_row, tile_col],
+                    "south": round(tile_row * self.tile_cells * size - 90.0, 6),
+                    "west": round(tile_col * self.tile_cells * lon_size - 180.0, 6),
+                    "cell_lon_deg": lon_size,
+                    "cells": [[int(r), int(c), round(float(scores[r, c]), 4)] for r, c in zip(rows, cols)],
+                })
+        return {"level": level, "cell_deg": size, "tile_cells": self.tile_cells,
+                "half_life_s": self.half_life, "tiles": tiles}
+
+    def _tile_range(self, south, west, north, east, level):
+        row0, _ = self._cell(south, west, level)
+        row1, _ = self._cell(north, east, level)
+        tiles = []
+        # Cell widths differ between rows of tiles, so each row has its own columns.
+        for r in range(row0 // self.tile_cells, row1 // self.tile_cells + 1):
+            col0 = self._col(west, r, level) // self.tile_cells
+            col1 = self._col(east, r, level) // self.tile_cells
+            tiles.extend((r, c) for c in range(col0, col1 + 1))
+            if len(tiles) > self.max_tiles:
+                return None
+        return tiles
+
+    def stats(self):
+        with self._lock:
+            return {
+                "incidents": self.incidents,
+                "duplicates": self.duplicates,
+                "tiles": len(self._tiles),
+                "memory_bytes": sum(tile.nbytes for tile in self._tiles.values()),
+                "rebases": self.rebases,
+                "half_life_s": self.half_life,
+            }
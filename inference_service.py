@@ -0,0 +1,396 @@
+"""Optional out-of-process YAMNet and Vosk shared by every web worker.
+
+Normally each gunicorn worker imports TensorFlow, loads YAMNet and Vosk and
+runs its own TF thread pool, so model memory grows with the worker count.
+With ``INFERENCE_SOCKET`` set, the app instead talks to one long-lived
+service process that owns both engines:
+
+    INFERENCE_SOCKET=/tmp/cosmic-inference.sock python inference_service.py
+    INFERENCE_SOCKET=/tmp/cosmic-inference.sock gunicorn app:app -w 8
+
+Every worker writes audio into its own shared-memory ring (``models.shm_ring``)
+and sends only offsets over a ``multiprocessing.connection`` Unix socket.
+Replies come back on the same socket. The service runs requests from all
+workers on one thread pool, so YAMNet micro-batching now spans workers.
+
+``InferenceClient.yamnet`` has the backend contract and
+``InferenceClient.recognizers`` the ``RecognizerPool`` interface, so
+``detect()``, the streaming and long-recording paths and warm-up run
+unchanged against the service.
+"""
+import atexit
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from models.shm_ring import RingReader, ShmRing
+
+DEFAULT_RING_BYTES = 64 * 2**20
+# Backoff between attempts to open a recognizer while the service's pool is busy.
+OPEN_RETRY_MIN = 0.01
+OPEN_RETRY_MAX = 0.2
+
+
+class InferenceUnavailable(Exception):
+    """The inference service could not be reached or the call failed there."""
+
+
+class ConnectionLost(InferenceUnavailable):
+    """The connection dropped before the service replied."""
+
+
+class InferenceClient:
+    """Per-worker connection to the inference service.
+
+    The ring and the socket are created lazily, and again after a fork or a
+    dropped connection, so the service may start after the web workers and
+    may be restarted under them.
+    """
+
+    def __init__(self, address, ring_bytes=DEFAULT_RING_BYTES, authkey=None, timeout=60):
+        self.address = address
+        self.ring_bytes = ring_bytes
+        self.authkey = authkey
+        self.timeout = timeout
+        self.recognizers = RemoteRecognizerPool(self)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+        self._ring = None
+        self._pending = {}
+        self._ids = itertools.count()
+        self.calls = 0
+        self.failures = 0
+        self.reconnects = 0
+        self.ring_resets = 0
+        self._rtt_total = 0.0
+
+    def _connect(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked (e.g. gunicorn --preload): never share the parent's ring or socket.
+                self._pid = os.getpid()
+                self._conn = None
+                self._new_ring()
+                self._send_lock = threading.Lock()
+            if self._conn is None:
+                try:
+                    conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+                    conn.send((None, "attach", (self._ring.name,), None))
+                except OSError as e:
+                    raise InferenceUnavailable(f"Inference service at {self.address} unreachable: {e}")
+                self._conn = conn
+                self.reconnects += 1
+                threading.Thread(target=self._read_replies, args=(conn,), daemon=True,
+                                 name="inference-replies").start()
+            return self._conn, self._ring
+
+    def _new_ring(self):
+        self._ring = ShmRing(self.ring_bytes)
+        atexit.register(self._close_ring, self._ring, self._pid)
+
+    def _reset(self, ring):
+        """Replace ``ring`` after a call that wrote to it went unanswered.
+
+        The service may still be reading that call's region, so it is never
+        released for reuse. Unlinking the ring only drops its name; both
+        processes keep their mappings until they close them. The new ring is
+        attached over the live connection (or by the next connect). Requests
+        name the ring they wrote to, so those still in flight on the old one
+        are read from it.
+        """
+        with self._lock:
+            if self._ring is not ring:
+                return
+            ring.unlink()
+            self._new_ring()
+            self.ring_resets += 1
+            if self._conn is not None:
+                try:
+                    with self._send_lock:
+                        self._conn.send((None, "attach", (self._ring.name,), None))
+                except OSError:
+                    self._conn = None
+
+    @staticmethod
+    def _close_ring(ring, pid):
+        # atexit handlers survive fork; only the creating process unlinks.
+        if os.getpid() == pid:
+            ring.close()
+
+    def _read_replies(self, conn):
+        while True:
+            try:
+                req_id, ok, payload = conn.recv()
+            except (EOFError, OSError):
+                break
+            future = self._pending.pop(req_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(InferenceUnavailable(payload))
+        with self._lock:
+            if self._conn is conn:
+                self._conn = None
+        for req_id in list(self._pending):
+            future = self._pending.pop(req_id, None)
+            if future is not None and not future.done():
+                future.set_exception(ConnectionLost("Connection to the inference service was lost"))
+
+    def call(self, op, *args, audio=None):
+        """Run ``op`` in the service; ``audio`` is passed through the ring."""
+        conn, ring = self._connect()
+        offset = None
+        if audio is not None:
+            offset, nbytes = ring.write(audio, timeout=self.timeout)
+            args = (offset, nbytes) + args
+        req_id = next(self._ids)
+        future = Future()
+        self._pending[req_id] = future
+        start = time.perf_counter()
+        try:
+            with self._send_lock:
+                # The ring is named per request: a concurrent _reset may
+                # attach a new one between our write and this send.
+                conn.send((req_id, op, args, ring.name))
+            return future.result(timeout=self.timeout)
+        except Exception as e:
+            self._pending.pop(req_id, None)
+            self.failures += 1
+            if isinstance(e, InferenceUnavailable):
+                raise
+            raise InferenceUnavailable(f"Inference call {op} failed: {e}")
+        finally:
+            if offset is not None:
+                # The service only reads the region while handling the call,
+                # so it is free once the call is answered. Without an answer
+                # (timeout, lost connection) it may still be read.
+                if future.done() and not isinstance(future.exception(), ConnectionLost):
+                    ring.release(offset)
+                else:
+                    self._reset(ring)
+            self.calls += 1
+            self._rtt_total += time.perf_counter() - start
+
+    def yamnet(self, waveform):
+        """YAMNet backend contract: ``(scores, embeddings, spectrogram)``."""
+        waveform = np.ascontiguousarray(waveform, dtype=np.float32)
+        scores, embeddings = self.call("yamnet", audio=waveform)
+        return scores, embeddings, np.zeros((0, 64), dtype=np.float32)
+
+    def stats(self):
+        service = None
+        try:
+            service = self.call("stats")
+        except InferenceUnavailable as e:
+            service = {"error": str(e)}
+        return {
+            "address": self.address,
+            "connected": self._conn is not None,
+            "calls": self.calls,
+            "failures": self.failures,
+            "connects": self.reconnects,
+            "ring_resets": self.ring_resets,
+            "rtt_avg_ms": round(self._rtt_total / self.calls * 1000, 3) if self.calls else 0.0,
+            "ring": self._ring.stats() if self._ring is not None else None,
+            "service": service,
+        }
+
+
+class RemoteRecognizer:
+    """KaldiRecognizer proxy; every method is one round trip to the service."""
+
+    def __init__(self, client, rec_id):
+        self.client = client
+        self.rec_id = rec_id
+
+    def AcceptWaveform(self, data):
+        return self.client.call("accept", self.rec_id, audio=data)
+
+    def Result(self):
+        return self.client.call("result", self.rec_id)
+
+    def PartialResult(self):
+        return self.client.call("partial", self.rec_id)
+
+    def FinalResult(self):
+        return self.client.call("final", self.rec_id)
+
+
+class RemoteRecognizerPool:
+    """``RecognizerPool`` interface backed by the service's pool."""
+
+    def __init__(self, client):
+        self.client = client
+
+    @contextmanager
+    def recognizer(self, timeout=30):
+        """Borrow one of the service's recognizers; raises ``queue.Empty`` after ``timeout`` seconds.
+
+        The service never blocks waiting for one, which would tie up a
+        thread the releasing calls need; the client polls with backoff.
+        """
+        deadline = time.monotonic() + timeout
+        delay = OPEN_RETRY_MIN
+        while True:
+            rec_id = self.client.call("open")
+            if rec_id is not None:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise queue.Empty
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, OPEN_RETRY_MAX)
+        try:
+            yield RemoteRecognizer(self.client, rec_id)
+        finally:
+            try:
+                self.client.call("close", rec_id)
+            except InferenceUnavailable:
+                # The service drops a lost connection's recognizers itself.
+                pass
+
+    def stats(self):
+        return self.client.call("stats").get("vosk")
+
+
+# =============== SERVICE ===============
+
+class _Session:
+    """One connected web worker: its ring and the recognizers it has open."""
+
+    def __init__(self, conn, engines, executor):
+        self.conn = conn
+        self.engines = engines
+        self.executor = executor
+        self.readers = {}
+        self.send_lock = threading.Lock()
+        self.recognizers = {}
+        self.rec_ids = itertools.count()
+
+    def run(self):
+        try:
+            while True:
+                try:
+                    req_id, op, args, ring = self.conn.recv()
+                except (EOFError, OSError):
+                    break
+                if op == "attach":
+                    # A client replaces its ring when a call timed out; requests
+                    # still in flight name the old one, which stays mapped.
+                    self.readers[args[0]] = RingReader(args[0])
+                    continue
+                self.executor.submit(self._handle, self.readers.get(ring), req_id, op, args)
+        finally:
+            for stack, _ in list(self.recognizers.values()):
+                stack.close()
+            self.recognizers.clear()
+            for reader in self.readers.values():
+                reader.close()
+            self.conn.close()
+
+    def _handle(self, reader, req_id, op, args):
+        try:
+            reply = (req_id, True, getattr(self, f"op_{op}")(reader, *args))
+        except Exception as e:
+            reply = (req_id, False, f"{type(e).__name__}: {e}")
+        try:
+            with self.send_lock:
+                self.conn.send(reply)
+        except OSError:
+            pass
+
+    def op_yamnet(self, reader, offset, nbytes):
+        model = self.engines.yamnet
+        if model is None:
+            raise RuntimeError("YAMNet is not loaded in the inference service")
+        # Zero-copy view of the worker's ring; valid until we reply.
+        scores, embeddings, _ = model(reader.view(offset, nbytes, np.float32))
+        return np.asarray(scores, dtype=np.float32), np.asarray(embeddings, dtype=np.float32)
+
+    def op_open(self, reader):
+        """Check out a recognizer if one is free at once, else None for the client to retry."""
+        stack = ExitStack()
+        try:
+            rec = stack.enter_context(self.engines.vosk_recognizers().recognizer(timeout=0))
+        except queue.Empty:
+            return None
+        rec_id = next(self.rec_ids)
+        self.recognizers[rec_id] = (stack, rec)
+        return rec_id
+
+    def op_accept(self, reader, offset, nbytes, rec_id):
+        # Copy out of the ring: Vosk may keep a reference past this call.
+        pcm = bytes(reader.shm.buf[offset:offset + nbytes])
+        return self.recognizers[rec_id][1].AcceptWaveform(pcm)
+
+    def op_result(self, reader, rec_id):
+        return self.recognizers[rec_id][1].Result()
+
+    def op_partial(self, reader, rec_id):
+        return self.recognizers[rec_id][1].PartialResult()
+
+    def op_final(self, reader, rec_id):
+        return self.recognizers[rec_id][1].FinalResult()
+
+    def op_close(self, reader, rec_id):
+        stack, _ = self.recognizers.pop(rec_id)
+        stack.close()
+
+    def op_stats(self, reader):
+        engines = self.engines
+        return {
+            "pid": os.getpid(),
+            "yamnet_backend": engines.YAMNET_BACKEND,
+            "yamnet_batcher": engines.yamnet_batcher.stats() if engines.yamnet_batcher is not None else None,
+            "vosk": engines.pool_stats(),
+            "ready": engines.readiness.snapshot(),
+        }
+
+
+def serve(address, authkey=None, workers=16):
+    """Load the engines and serve web workers on the Unix socket ``address``."""
+    # Import the app here with local engines, so the service loads and warms
+    # them exactly as a standalone worker would.
+    os.environ.pop("INFERENCE_SOCKET", None)
+    import app as engines
+
+    if os.path.exists(address):
+        os.remove(address)
+    # Messages are pickles: only the service's own user may connect. The
+    # socket is created 0600 rather than chmodded after binding, which would
+    # leave it open to other users in between.
+    umask = os.umask(0o177)
+    try:
+        listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    finally:
+        os.umask(umask)
+    if authkey is None:
+        print("Inference service: INFERENCE_AUTHKEY is not set; relying on socket permissions alone")
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+    print(f"Inference service listening on {address}")
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            print(f"Inference service rejected a connection: {e}")
+            continue
+        session = _Session(conn, engines, executor)
+        threading.Thread(target=session.run, daemon=True, name="inference-session").start()
+
+
+if __name__ == "__main__":
+    serve(
+        os.getenv("INFERENCE_SOCKET", "/tmp/cosmic-inference.sock"),
+        authkey=os.getenv("INFERENCE_AUTHKEY", "").encode() or None,
+        workers=int(os.getenv("INFERENCE_WORKERS", "16")),
+    )
@@ -0,0 +1,242 @@
+"""Per-stage spans and Prometheus-format metrics.
+
+Wrapping a pipeline stage in ``span("yamnet")`` records its duration in the
+``pipeline_stage_seconds`` histogram, keeps ``pipeline_stage_in_flight``
+current and counts exceptions in ``pipeline_stage_errors_total``. Between
+``start_trace`` and ``end_trace`` the spans are also collected for the current
+request. With ``METRICS_TRACE_LOG=1`` they are printed as one JSON line when
+the request ends.
+
+The hot-path cost of a span is two ``perf_counter`` calls and a few
+dictionary updates under a lock. With ``METRICS=0`` ``span`` returns a
+shared no-op and nothing is recorded.
+"""
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+ENABLED = os.getenv("METRICS", "1") != "0"
+TRACE_LOG = os.getenv("METRICS_TRACE_LOG", "0") == "1"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=(), fn=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # ``fn`` makes this a collect-time metric: it returns {label values: value}.
+        self.fn = fn
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        if self.fn is not None:
+            values = self.fn()
+            return [(self.name, k if isinstance(k, tuple) else (k,) if self.labelnames else (), "", v)
+                    for k, v in values.items()]
+        with self._lock:
+            return [(self.name, k, "", v) for k, v in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, extra, value in self.samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, labels, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, value=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, value=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def dec(self, *labels, value=1):
+        self.inc(*labels, value=-value)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        if not ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            snapshot = [(k, list(v[0]), v[1], v[2]) for k, v in self._values.items()]
+        samples = []
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                samples.append((f"{self.name}_bucket", labels, f'le="{_format_value(bound)}"', cumulative))
+            samples.append((f"{self.name}_sum", labels, "", total))
+            samples.append((f"{self.name}_count", labels, "", count))
+        return samples
+
+
+class Registry:
+    """Ordered collection of metrics rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=(), fn=None):
+        return self._add(Counter(name, help, labelnames, fn))
+
+    def gauge(self, name, help, labelnames=(), fn=None):
+        return self._add(Gauge(name, help, labelnames, fn))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # A failing collect-time callback must not break the scrape.
+                lines.append(f"# {metric.name} collection failed: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+STAGE_SECONDS = registry.histogram("pipeline_stage_seconds", "Time spent in each pipeline stage.", ("stage",))
+STAGE_ERRORS = registry.counter("pipeline_stage_errors_total", "Pipeline stages that raised.", ("stage",))
+STAGE_IN_FLIGHT = registry.gauge("pipeline_stage_in_flight", "Pipeline stages currently running.", ("stage",))
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        STAGE_IN_FLIGHT.inc(self.stage)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        elapsed = end - self.start
+        STAGE_IN_FLIGHT.dec(self.stage)
+        STAGE_SECONDS.observe(elapsed, self.stage)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(self.stage)
+        current = _trace.get()
+        if current is not None:
+            entry = {"stage": self.stage, "start_ms": round((self.start - current["t0"]) * 1000, 3),
+                     "ms": round(elapsed * 1000, 3)}
+            if exc_type is not None:
+                entry["error"] = exc_type.__name__
+            current["spans"].append(entry)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(stage):
+    """Context manager timing one pipeline stage."""
+    return _Span(stage) if ENABLED else _NOOP
+
+
+def start_trace(name):
+    """Collect spans for the current request until ``end_trace`` is called.
+
+    Returns a token for ``end_trace``. Worker threads only see the trace if
+    they run inside a copy of the caller's context
+    (``contextvars.copy_context().run``).
+    """
+    if not (ENABLED and TRACE_LOG):
+        return None
+    return _trace.set({"id": uuid.uuid4().hex[:16], "name": name, "t0": time.perf_counter(), "spans": []})
+
+
+def end_trace(token, **fields):
+    """Stop collecting and print the request's spans as one JSON line."""
+    if token is None:
+        return
+    current = _trace.get()
+    try:
+        _trace.reset(token)
+    except ValueError:
+        # Ended from a different context (e.g. after a streamed response).
+        pass
+    if current is None:
+        return
+    record = {"trace": current["id"], "name": current["name"],
+              "ms": round((time.perf_counter() - current["t0"]) * 1000, 3), "spans": current["spans"]}
+    record.update(fields)
+    print(json.dumps(record), flush=True)
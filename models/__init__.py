@@ -0,0 +1 @@
+"""ML model utilities used by the RAKSHA X Flask app (YAMNet, Vosk, audio helpers)."""
@@ -0,0 +1,84 @@
+"""In-memory audio helpers shared by the detection pipeline.
+
+Uploads are decoded once to a float32 buffer for YAMNet and converted once to
+int16 PCM for Vosk. Vosk is fed memoryview slices of that PCM buffer, so no
+temporary WAV file is written and no per-chunk copies are made.
+"""
+import numpy as np
+import soundfile as sf
+
+from models.resample import BlockResampler, resample
+
+SAMPLE_RATE = 16000
+# Frames handed to KaldiRecognizer.AcceptWaveform per call (0.25 s at 16 kHz).
+VOSK_CHUNK_FRAMES = 4000
+
+_accepts_buffer = True
+
+
+def downmix(frames):
+    """Average a ``(samples, channels)`` float32 array to mono with one allocation."""
+    if frames.ndim == 1:
+        return frames
+    if frames.shape[1] == 1:
+        return frames[:, 0]
+    # Column-wise adds are much faster than a reduction along the short
+    # channel axis.
+    mono = frames[:, 0] + frames[:, 1]
+    for c in range(2, frames.shape[1]):
+        mono += frames[:, c]
+    mono *= np.float32(1.0 / frames.shape[1])
+    return mono
+
+
+def decode_audio(filepath):
+    """Read an audio file as a mono float32 waveform at 16 kHz."""
+    wav_data, sr = sf.read(filepath, dtype='float32')
+    wav_data = resample(downmix(wav_data), sr, SAMPLE_RATE)
+    return np.ascontiguousarray(wav_data, dtype=np.float32)
+
+
+def decode_audio_blocks(filepath, blocksize=65536):
+    """Yield a file as consecutive mono float32 16 kHz blocks.
+
+    Only one block of the source file is in memory at a time, so long
+    recordings can be processed without decoding them in full.
+    """
+    sr = sf.info(filepath).samplerate
+    resampler = BlockResampler(sr, SAMPLE_RATE)
+    for block in sf.blocks(filepath, blocksize=blocksize, dtype='float32', always_2d=True):
+        out = resampler.process(downmix(block))
+        if len(out):
+            yield out
+    tail = resampler.flush()
+    if len(tail):
+        yield tail
+
+
+def to_pcm16(wav):
+    """Convert a float waveform in [-1, 1] to a contiguous int16 PCM array."""
+    pcm = np.clip(wav, -1.0, 1.0) * 32767.0
+    return np.ascontiguousarray(pcm, dtype=np.int16)
+
+
+def pcm_chunks(pcm, frames=VOSK_CHUNK_FRAMES):
+    """Yield zero-copy byte memoryviews over ``pcm`` of ``frames`` samples each."""
+    view = memoryview(pcm).cast("B")
+    step = frames * pcm.itemsize
+    for start in range(0, len(view), step):
+        yield view[start:start + step]
+
+
+def accept_waveform(rec, chunk):
+    """Feed a PCM memoryview to a KaldiRecognizer.
+
+    Older vosk builds only accept ``bytes`` for the waveform argument; the
+    first TypeError switches this process over to copying each chunk.
+    """
+    global _accepts_buffer
+    if _accepts_buffer:
+        try:
+            return rec.AcceptWaveform(chunk)
+        except TypeError:
+            _accepts_buffer = False
+    return rec.AcceptWaveform(chunk.tobytes())
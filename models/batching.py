@@ -0,0 +1,143 @@
+"""Dynamic micro-batching for YAMNet inference.
+
+The TF Hub YAMNet signature only takes a single 1-D waveform, so batching is
+done along the time axis: pending clips are zero-padded exactly as YAMNet pads
+a lone clip, laid out back to back on patch-hop boundaries and scored in one
+call. Each patch of the combined run then belongs to exactly one request, and
+its scores, embeddings and spectrogram frames are sliced back out per clip.
+"""
+import math
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+PATCH_SAMPLES = 15600  # 0.96 s patch + one 25 ms STFT window - one 10 ms hop
+HOP_SAMPLES = 7680     # 0.48 s patch hop
+STFT_HOP_SAMPLES = 160
+STFT_WINDOW_SAMPLES = 400
+
+
+def num_patches(num_samples):
+    """Number of patches YAMNet produces for a clip of ``num_samples``."""
+    return 1 + math.ceil(max(0, num_samples - PATCH_SAMPLES) / HOP_SAMPLES)
+
+
+class _Request:
+    __slots__ = ("waveform", "future", "enqueued")
+
+    def __init__(self, waveform):
+        self.waveform = waveform
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class YamnetBatcher:
+    """Collects concurrent YAMNet requests and flushes them as one forward pass.
+
+    A batch is flushed once ``max_batch_size`` requests are pending or the
+    oldest one has waited ``max_wait_ms``, whichever comes first.
+    """
+
+    def __init__(self, model, max_batch_size=8, max_wait_ms=10):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._batch_sizes = deque(maxlen=1024)
+        self._queue_latencies = deque(maxlen=1024)
+        self._thread = threading.Thread(target=self._run, name="yamnet-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, waveform):
+        """Queue a float32 16 kHz waveform and return a Future of (scores, embeddings, spectrogram)."""
+        request = _Request(np.asarray(waveform, dtype=np.float32).reshape(-1))
+        self._queue.put(request)
+        return request.future
+
+    def infer(self, waveform):
+        """Blocking drop-in replacement for ``model(waveform)``."""
+        return self.submit(waveform).result()
+
+    __call__ = infer
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0].enqueued + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        with self._lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._batch_sizes.append(len(batch))
+            self._queue_latencies.extend(started - r.enqueued for r in batch)
+
+        offsets = []
+        total = 0
+        for r in batch:
+            offsets.append(total)
+            padded = PATCH_SAMPLES + (num_patches(len(r.waveform)) - 1) * HOP_SAMPLES
+            total += math.ceil(padded / HOP_SAMPLES) * HOP_SAMPLES
+        last = batch[-1]
+        total = offsets[-1] + PATCH_SAMPLES + (num_patches(len(last.waveform)) - 1) * HOP_SAMPLES
+
+        combined = np.zeros(total, dtype=np.float32)
+        for r, offset in zip(batch, offsets):
+            combined[offset:offset + len(r.waveform)] = r.waveform
+
+        try:
+            scores, embeddings, spectrogram = self.model(combined)
+            scores = np.asarray(scores)
+            embeddings = np.asarray(embeddings)
+            spectrogram = np.asarray(spectrogram)
+        except Exception as e:
+            for r in batch:
+                r.future.set_exception(e)
+            return
+
+        for r, offset in zip(batch, offsets):
+            patch = offset // HOP_SAMPLES
+            n = num_patches(len(r.waveform))
+            frame = offset // STFT_HOP_SAMPLES
+            padded = PATCH_SAMPLES + (n - 1) * HOP_SAMPLES
+            n_frames = 1 + (padded - STFT_WINDOW_SAMPLES) // STFT_HOP_SAMPLES
+            r.future.set_result((
+                scores[patch:patch + n],
+                embeddings[patch:patch + n],
+                spectrogram[frame:frame + n_frames],
+            ))
+
+    def stats(self):
+        """Batch size and queue latency figures for the /stats endpoint."""
+        with self._lock:
+            sizes = np.array(self._batch_sizes) if self._batch_sizes else np.zeros(1)
+            waits = np.array(self._queue_latencies) * 1000 if self._queue_latencies else np.zeros(1)
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self._batches,
+                "requests": self._requests,
+                "pending": self._queue.qsize(),
+                "batch_size_avg": round(float(sizes.mean()), 3),
+                "batch_size_max": int(sizes.max()),
+                "queue_ms_p50": round(float(np.percentile(waits, 50)), 3),
+                "queue_ms_p99": round(float(np.percentile(waits, 99)), 3),
+            }
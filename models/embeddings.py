@@ -0,0 +1,207 @@
+"""Uses of the YAMNet embeddings that every forward pass already computes.
+
+``DangerHead`` is a logistic regression on the 1024-d patch embeddings,
+trained by ``scripts/train_danger_head.py`` on our own labelled clips. It
+catches danger the fixed ``danger_sounds`` classes miss, such as a shouted
+"leave me". Scoring is one small matrix-vector product per clip on the
+embeddings YAMNet returned with the class scores. No second model runs. A
+clip's score is its highest patch probability, so one loud second is not
+averaged away.
+
+``EmbeddingStore`` keeps one L2-normalized float16 embedding per stored
+upload, keyed by evidence ID. Records have a fixed size and are appended to a
+file. The file is memory-mapped rather than loaded, so every worker on the
+host shares one copy in the page cache and picks up the others' appends.
+``similar`` scans the store in float32 chunks with one matrix-vector product
+each and returns the top-k cosine matches. The scan is exact and costs a few
+milliseconds per thousand clips, most of it converting float16 to float32.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+from models.yamnet import EMBEDDING_SIZE
+
+SCAN_CHUNK = 8192
+
+
+def clip_embedding(embeddings):
+    """Mean patch embedding of a clip as float32, or None if it has no patches."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings.mean(axis=0) if len(embeddings) else None
+
+
+class DangerHead:
+    """Logistic regression over standardized YAMNet patch embeddings."""
+
+    def __init__(self, weights, bias, mean, scale, threshold=0.5):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.threshold = float(threshold)
+
+    def patch_scores(self, embeddings):
+        """Danger probability of each patch."""
+        x = (np.asarray(embeddings, dtype=np.float32) - self.mean) / self.scale
+        return 1.0 / (1.0 + np.exp(-(x @ self.weights + self.bias)))
+
+    def score(self, embeddings):
+        """Highest patch probability of a clip (0.0 with no patches)."""
+        return float(self.patch_scores(embeddings).max()) if len(embeddings) else 0.0
+
+    @classmethod
+    def fit(cls, embeddings, labels, l2=1.0, threshold=0.5):
+        """Fit on patch ``embeddings`` and 0/1 ``labels`` with class-balanced, L2-regularized log loss."""
+        from scipy.optimize import minimize
+
+        x = np.asarray(embeddings, dtype=np.float64)
+        y = np.asarray(labels, dtype=np.float64)
+        mean = x.mean(axis=0)
+        scale = x.std(axis=0) + 1e-6
+        x = (x - mean) / scale
+        positives = max(1.0, y.sum())
+        negatives = max(1.0, len(y) - y.sum())
+        sample_weight = np.where(y == 1, len(y) / (2 * positives), len(y) / (2 * negatives))
+
+        def loss(params):
+            w, b = params[:-1], params[-1]
+            z = x @ w + b
+            p = 1.0 / (1.0 + np.exp(-z))
+            # log(1 + e^z) - y z, computed stably.
+            value = (sample_weight * (np.logaddexp(0.0, z) - y * z)).sum() / len(y) + 0.5 * l2 * w @ w / len(y)
+            grad_z = sample_weight * (p - y) / len(y)
+            return value, np.append(x.T @ grad_z + l2 * w / len(y), grad_z.sum())
+
+        result = minimize(loss, np.zeros(x.shape[1] + 1), jac=True, method="L-BFGS-B")
+        return cls(result.x[:-1], result.x[-1], mean, scale, threshold)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            return cls(npz["weights"], npz["bias"], npz["mean"], npz["scale"], npz["threshold"])
+
+    def save(self, path):
+        np.savez(path, weights=self.weights, bias=self.bias, mean=self.mean, scale=self.scale,
+                 threshold=self.threshold)
+
+
+def record_dtype(dim=EMBEDDING_SIZE):
+    # 128-byte header keeps each float16 vector aligned within the record.
+    return np.dtype({"names": ["id", "t", "alert", "vec"],
+                     "formats": ["S64", "<f8", "i1", ("<f2", (dim,))],
+                     "offsets": [0, 64, 72, 128],
+                     "itemsize": 128 + 2 * dim})
+
+
+class EmbeddingStore:
+    """Append-only float16 clip embeddings with brute-force cosine search."""
+
+    def __init__(self, path=None, dim=EMBEDDING_SIZE):
+        self.path = path
+        self.dim = dim
+        self.dtype = record_dtype(dim)
+        self._lock = threading.Lock()
+        self._records = np.zeros(0, dtype=self.dtype)
+        self._count = 0
+        self._rows = {}
+        self.searches = 0
+        self.search_seconds = 0.0
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with self._lock:
+                self._sync()
+
+    def add(self, incident_id, embedding, alert=False, t=None):
+        """Store a clip's embedding under ``incident_id``; returns False if it is already stored."""
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        record = np.zeros(1, dtype=self.dtype)
+        record["id"] = incident_id.encode("ascii")
+        record["t"] = time.time() if t is None else t
+        record["alert"] = int(bool(alert))
+        record["vec"] = vec / norm if norm else vec
+        with self._lock:
+            self._sync()
+            if incident_id in self._rows:
+                return False
+            if self.path is None:
+                self._append(record)
+            else:
+                # Whole records in one O_APPEND write, so workers never interleave.
+                with open(self.path, "ab") as f:
+                    f.write(record.tobytes())
+                self._sync()
+            return True
+
+    def _append(self, record):
+        if self._count == len(self._records):
+            grown = np.zeros(max(1024, 2 * len(self._records)), dtype=self.dtype)
+            grown[:self._count] = self._records[:self._count]
+            self._records = grown
+        self._records[self._count] = record[0]
+        self._rows[record["id"][0].decode("ascii")] = self._count
+        self._count += 1
+
+    def _sync(self):
+        """Map records appended to the file since the last call."""
+        if self.path is None:
+            return
+        try:
+            count = os.path.getsize(self.path) // self.dtype.itemsize
+        except FileNotFoundError:
+            return
+        if count <= self._count:
+            return
+        self._records = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(count,))
+        for row in range(self._count, count):
+            self._rows[self._records[row]["id"].decode("ascii")] = row
+        self._count = count
+
+    def get(self, incident_id):
+        """Stored (normalized) embedding of an incident as float32, or None."""
+        with self._lock:
+            self._sync()
+            row = self._rows.get(incident_id)
+            return None if row is None else self._records[row]["vec"].astype(np.float32)
+
+    def similar(self, embedding, k=5, exclude=None):
+        """Top-``k`` stored clips by cosine similarity to ``embedding``."""
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        if norm:
+            query = query / norm
+        with self._lock:
+            self._sync()
+            # Rows are never rewritten, so this prefix stays valid after the lock.
+            records = self._records[:self._count]
+        start = time.perf_counter()
+        similarity = np.empty(len(records), dtype=np.float32)
+        vectors = records["vec"]
+        for begin in range(0, len(records), SCAN_CHUNK):
+            chunk = vectors[begin:begin + SCAN_CHUNK].astype(np.float32)
+            np.dot(chunk, query, out=similarity[begin:begin + SCAN_CHUNK])
+        if exclude is not None:
+            row = self._rows.get(exclude)
+            if row is not None and row < len(similarity):
+                similarity[row] = -np.inf
+        k = min(k, int(np.isfinite(similarity).sum()))
+        top = np.argpartition(-similarity, k - 1)[:k] if k else np.zeros(0, dtype=np.int64)
+        top = top[np.argsort(-similarity[top])]
+        with self._lock:
+            self.searches += 1
+            self.search_seconds += time.perf_counter() - start
+        return [{"id": records[i]["id"].decode("ascii"), "similarity": round(float(similarity[i]), 4),
+                 "t": float(records[i]["t"]), "alert": bool(records[i]["alert"])} for i in top]
+
+    def stats(self):
+        with self._lock:
+            self._sync()
+            return {
+                "clips": self._count,
+                "bytes": self._count * self.dtype.itemsize,
+                "searches": self.searches,
+                "search_ms_avg": round(self.search_seconds / self.searches * 1000, 3) if self.searches else 0.0,
+            }
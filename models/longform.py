@@ -0,0 +1,163 @@
+"""Block-wise analysis of long recordings in bounded memory.
+
+``decode_audio`` holds the whole clip, plus its resampled copy and the int16
+PCM for Vosk, so memory grows with recording length. ``LongformAnalyzer``
+instead takes the 16 kHz blocks produced by ``decode_audio_blocks`` and keeps
+a single segment buffer of ``segment_hops`` YAMNet hops. Consecutive segments
+overlap by ``PATCH_SAMPLES - HOP_SAMPLES`` samples and start on hop
+boundaries. YAMNet therefore sees exactly the patches it would produce for
+the whole file, and each patch is scored once.
+
+Clip-level results come from running sums: the mean score per class (the
+same top-5 ``classify_sounds`` reports), the strongest danger-class patch
+with its time, the mean embedding and, with a ``DangerHead``, its highest
+patch score. Vosk is fed each segment's new audio chunk by chunk and keeps
+only the recognized text. Segments with no frame above the energy gate are
+skipped by both engines.
+"""
+import json
+
+import numpy as np
+
+from models.audio import accept_waveform, pcm_chunks, to_pcm16
+from models.batching import HOP_SAMPLES, PATCH_SAMPLES, SAMPLE_RATE
+from models.vad import DEFAULT_THRESHOLD, frame_rms
+
+OVERLAP_SAMPLES = PATCH_SAMPLES - HOP_SAMPLES
+SEGMENT_HOPS = 125  # 60 s of new audio per YAMNet call
+
+
+class LongformAnalyzer:
+    """Accumulates YAMNet and Vosk results over a stream of 16 kHz float32 blocks."""
+
+    def __init__(self, model, class_map, danger_sounds, recognizer=None, keep_words=False,
+                 vad_threshold=DEFAULT_THRESHOLD, segment_hops=SEGMENT_HOPS, head=None):
+        self.model = model
+        self.head = head
+        self.class_map = class_map
+        self.danger_indices = np.array([i for i, name in enumerate(class_map) if name in danger_sounds],
+                                       dtype=np.int64)
+        self.recognizer = recognizer
+        self.keep_words = keep_words
+        self.vad_threshold = vad_threshold
+        self.segment_samples = segment_hops * HOP_SAMPLES
+
+        self._buffer = np.zeros(self.segment_samples + OVERLAP_SAMPLES, dtype=np.float32)
+        self._filled = 0
+        self._new_from = 0   # buffer index where audio not yet processed starts
+        self._offset = 0     # absolute sample index of _buffer[0]
+        self._fed = 0        # samples handed to Vosk so far
+        self._shift = 0.0    # seconds to add to Vosk timestamps for the current utterance
+        self._open = False   # Vosk holds audio not yet returned by a final result
+        self.samples = 0
+        self.active_samples = 0
+        self.patches = 0
+        self.score_sum = None
+        self.embedding_sum = None
+        self.danger_score = None
+        self.peak = None
+        self.texts = []
+        self.words = []
+
+    def feed(self, block):
+        """Add a block of mono float32 16 kHz samples."""
+        block = np.asarray(block, dtype=np.float32)
+        self.samples += len(block)
+        while len(block):
+            take = min(len(block), len(self._buffer) - self._filled)
+            self._buffer[self._filled:self._filled + take] = block[:take]
+            self._filled += take
+            block = block[take:]
+            if self._filled == len(self._buffer):
+                self._process()
+                # Keep the overlap so the next segment's first patch is complete.
+                self._buffer[:OVERLAP_SAMPLES] = self._buffer[self.segment_samples:]
+                self._offset += self.segment_samples
+                self._filled = self._new_from = OVERLAP_SAMPLES
+
+    def finish(self):
+        """Process the remaining audio and return the aggregated clip-level result."""
+        if self._filled > self._new_from:
+            self._process()
+        if self.recognizer is not None:
+            self._flush_speech()
+
+        results = []
+        labels = []
+        if self.score_sum is not None:
+            mean_scores = self.score_sum / self.patches
+            top_indices = mean_scores.argsort()[-5:][::-1]
+            labels = [self._label(i) for i in top_indices]
+            results = [(label, f"{mean_scores[i]*100:.2f}") for label, i in zip(labels, top_indices)]
+        return {
+            "results": results,
+            "labels": labels,
+            "peak_danger": self.peak,
+            "embedding": self.embedding_sum / self.patches if self.embedding_sum is not None else None,
+            "danger_score": self.danger_score,
+            "speech_text": " ".join(self.texts),
+            "words": self.words,
+            "seconds": round(self.samples / SAMPLE_RATE, 3),
+            "skipped_fraction": round(1.0 - self.active_samples / self.samples, 4) if self.samples else 1.0,
+            "patches": self.patches,
+        }
+
+    def _label(self, i):
+        return self.class_map[i] if i < len(self.class_map) else f"Class_{i}"
+
+    def _process(self):
+        segment = self._buffer[:self._filled]
+        new = segment[self._new_from:]
+        new_start = self._offset + self._new_from
+        if not (frame_rms(new) > self.vad_threshold).any():
+            # Silent: finish any open utterance so Vosk timestamps stay exact
+            # across the skipped audio.
+            if self.recognizer is not None:
+                self._flush_speech()
+            return
+        self.active_samples += len(new)
+
+        if self.model is not None:
+            scores, embeddings, _ = self.model(segment)
+            scores = np.asarray(scores)
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            self.score_sum = scores.sum(axis=0) if self.score_sum is None else self.score_sum + scores.sum(axis=0)
+            self.embedding_sum = (embeddings.sum(axis=0) if self.embedding_sum is None
+                                  else self.embedding_sum + embeddings.sum(axis=0))
+            if self.head is not None and len(embeddings):
+                self.danger_score = max(self.danger_score or 0.0, self.head.score(embeddings))
+            self.patches += len(scores)
+            if len(self.danger_indices):
+                danger = scores[:, self.danger_indices]
+                patch, cls = np.unravel_index(int(danger.argmax()), danger.shape)
+                score = float(danger[patch, cls])
+                if self.peak is None or score > self.peak["score"]:
+                    self.peak = {
+                        "label": self._label(int(self.danger_indices[cls])),
+                        "score": round(score, 4),
+                        "t": round((self._offset + int(patch) * HOP_SAMPLES) / SAMPLE_RATE, 3),
+                    }
+
+        if self.recognizer is not None:
+            # Vosk timestamps count only the audio it was fed; skipped
+            # segments shift them back onto the recording's timeline.
+            self._shift = (new_start - self._fed) / SAMPLE_RATE
+            self._open = True
+            for chunk in pcm_chunks(to_pcm16(new)):
+                if accept_waveform(self.recognizer, chunk):
+                    self._collect(json.loads(self.recognizer.Result()), self._shift)
+            self._fed += len(new)
+
+    def _flush_speech(self):
+        if self._open:
+            self._collect(json.loads(self.recognizer.FinalResult()), self._shift)
+            self._open = False
+
+    def _collect(self, result, shift):
+        if result.get("text"):
+            self.texts.append(result["text"])
+        if self.keep_words:
+            for w in result.get("result", []):
+                w["start"] += shift
+                w["end"] += shift
+                self.words.append(w)
@@ -0,0 +1,32 @@
+"""Per-engine warm-up state behind the /healthz/ready probe."""
+import threading
+import time
+
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class Readiness:
+    """Tracks whether each inference engine has loaded and run a warm-up pass."""
+
+    def __init__(self, engines):
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._engines = {name: {"status": LOADING} for name in engines}
+
+    def mark(self, engine, status, detail=None):
+        entry = {"status": status, "seconds": round(time.time() - self._started, 3)}
+        if detail:
+            entry["detail"] = detail
+        with self._lock:
+            self._engines[engine] = entry
+
+    def is_ready(self):
+        """True once every engine has warmed up successfully."""
+        with self._lock:
+            return all(e["status"] == READY for e in self._engines.values())
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._engines.items()}
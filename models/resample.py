@@ -0,0 +1,106 @@
+"""Polyphase resampling to 16 kHz with cached anti-aliasing filters.
+
+Designing the low-pass FIR filter is the costly part of polyphase resampling.
+Filters are designed once per ``(orig_sr, target_sr)`` pair and kept for the
+life of the process. All arithmetic stays in float32.
+"""
+import threading
+from math import gcd
+
+import numpy as np
+from scipy.signal import firwin, resample_poly
+
+TARGET_SR = 16000
+
+_filters = {}
+_filters_lock = threading.Lock()
+
+
+def polyphase_filter(orig_sr, target_sr=TARGET_SR):
+    """Return ``(up, down, taps)`` for resampling ``orig_sr`` to ``target_sr``.
+
+    ``taps`` is the same Kaiser-windowed low-pass filter ``resample_poly``
+    designs by default, stored as float32 and cached per rate pair.
+    """
+    key = (orig_sr, target_sr)
+    cached = _filters.get(key)
+    if cached is not None:
+        return cached
+    g = gcd(int(orig_sr), int(target_sr))
+    up, down = target_sr // g, orig_sr // g
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    taps = firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0)).astype(np.float32)
+    with _filters_lock:
+        _filters.setdefault(key, (up, down, taps))
+    return _filters[key]
+
+
+def resample(wav, orig_sr, target_sr=TARGET_SR):
+    """Resample a 1-D float32 waveform in one pass."""
+    if orig_sr == target_sr:
+        return wav
+    up, down, taps = polyphase_filter(orig_sr, target_sr)
+    return resample_poly(wav, up, down, window=taps)
+
+
+class BlockResampler:
+    """Resamples a stream block by block with output identical to one-shot ``resample``.
+
+    Input is buffered with enough context on both sides of each emitted span
+    to cover the filter, and spans start on multiples of ``down`` input
+    samples so the output grid lines up across blocks. Output therefore lags
+    input by about half the filter length.
+    """
+
+    def __init__(self, orig_sr, target_sr=TARGET_SR):
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+        self.passthrough = orig_sr == target_sr
+        if not self.passthrough:
+            self.up, self.down, self.taps = polyphase_filter(orig_sr, target_sr)
+            half = (len(self.taps) - 1) // 2
+            context = -(-half // self.up) + 1
+            self.context = -(-context // self.down) * self.down
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_start = 0  # absolute input index of _buffer[0]
+        self._emitted = 0       # absolute input index up to which output was produced
+        self._total = 0
+
+    def process(self, block):
+        """Add a block of input samples and return whatever output is now final."""
+        block = np.asarray(block, dtype=np.float32)
+        if self.passthrough:
+            return block
+        self._buffer = np.concatenate((self._buffer, block))
+        self._total += len(block)
+        end = self._total - self.context
+        end -= (end - self._emitted) % self.down
+        if end <= self._emitted:
+            return np.zeros(0, dtype=np.float32)
+        return self._emit(end)
+
+    def flush(self):
+        """Return the remaining output once the input has ended."""
+        if self.passthrough or self._emitted >= self._total:
+            return np.zeros(0, dtype=np.float32)
+        return self._emit(self._total)
+
+    def _emit(self, end):
+        seg_start = max(self._buffer_start, self._emitted - self.context)
+        seg_end = min(self._total, end + self.context)
+        seg = self._buffer[seg_start - self._buffer_start:seg_end - self._buffer_start]
+        y = resample_poly(seg, self.up, self.down, window=self.taps)
+        first = (self._emitted - seg_start) * self.up // self.down
+        if end == self._total:
+            last = -(-self._total * self.up // self.down) - seg_start * self.up // self.down
+        else:
+            last = (end - seg_start) * self.up // self.down
+        out = y[first:last]
+
+        self._emitted = end
+        keep_from = max(self._buffer_start, end - self.context)
+        keep_from -= (keep_from - self._buffer_start) % self.down
+        self._buffer = self._buffer[keep_from - self._buffer_start:]
+        self._buffer_start = keep_from
+        return out
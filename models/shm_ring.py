@@ -0,0 +1,137 @@
+"""Shared-memory ring buffer for handing audio to the inference service.
+
+Each web worker owns one ring: a ``multiprocessing.shared_memory`` segment
+that its threads carve variable-sized regions out of in FIFO order. A region
+is written once by the worker, read in place by the inference process, and
+released when the reply arrives. Regions released out of order are
+reclaimed once every older region has been released too. When the ring is
+full, writers wait for space, which bounds the audio in flight per worker.
+"""
+import threading
+import time
+from collections import deque
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+ALIGN = 64
+
+
+class RingFull(Exception):
+    """No space freed up in the ring within the timeout."""
+
+
+class ShmRing:
+    """Producer side of the ring; ``write`` returns an offset the consumer can ``view``."""
+
+    def __init__(self, size):
+        self.size = size
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.name = self.shm.name
+        self._cond = threading.Condition()
+        self._live = deque()  # [offset, end, released] in allocation order
+        self.writes = 0
+        self.waits = 0
+        self.high_water = 0
+
+    def write(self, data, timeout=30):
+        """Copy ``data`` (any buffer) into the ring and return ``(offset, nbytes)``."""
+        src = np.frombuffer(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data.reshape(-1).view(np.uint8)
+        nbytes = src.nbytes
+        if nbytes > self.size:
+            raise ValueError(f"{nbytes} bytes do not fit in a {self.size} byte ring")
+        with self._cond:
+            deadline = time.monotonic() + timeout
+            offset = self._place(nbytes)
+            if offset is None:
+                self.waits += 1
+            while offset is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RingFull(f"no {nbytes} byte region freed within {timeout} s")
+                self._cond.wait(remaining)
+                offset = self._place(nbytes)
+            self._live.append([offset, offset + nbytes, False])
+            self.writes += 1
+            self.high_water = max(self.high_water, self._used())
+        self.shm.buf[offset:offset + nbytes] = src
+        return offset, nbytes
+
+    def release(self, offset):
+        """Mark the region at ``offset`` as consumed."""
+        with self._cond:
+            for region in self._live:
+                if region[0] == offset and not region[2]:
+                    region[2] = True
+                    break
+            while self._live and self._live[0][2]:
+                self._live.popleft()
+            self._cond.notify_all()
+
+    def _place(self, nbytes):
+        # Regions are rounded up to ALIGN so float32 views stay aligned.
+        if not self._live:
+            return 0
+        first = self._live[0][0]
+        last_offset, head = self._live[-1][0], self._live[-1][1]
+        head = -(-head // ALIGN) * ALIGN
+        if first <= last_offset:
+            # Live data is one run [first, head): use the end, else wrap to 0.
+            if head + nbytes <= self.size:
+                return head
+            if nbytes <= first:
+                return 0
+            return None
+        # Wrapped: free space is [head, first).
+        if head + nbytes <= first:
+            return head
+        return None
+
+    def _used(self):
+        if not self._live:
+            return 0
+        first, head = self._live[0][0], self._live[-1][1]
+        return head - first if head >= first else self.size - first + head
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "in_flight": len(self._live),
+                "used_bytes": self._used(),
+                "high_water_bytes": self.high_water,
+                "writes": self.writes,
+                "waits": self.waits,
+            }
+
+    def unlink(self):
+        """Remove the segment's name; existing mappings stay valid until closed."""
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        self.shm.close()
+        self.unlink()
+
+
+class RingReader:
+    """Consumer side: zero-copy numpy views into another process's ring."""
+
+    def __init__(self, name):
+        self.shm = shared_memory.SharedMemory(name=name)
+        # The producer owns the segment; stop this process's resource tracker
+        # from unlinking it when we exit.
+        resource_tracker.unregister(self.shm._name, "shared_memory")
+
+    def view(self, offset, nbytes, dtype):
+        dtype = np.dtype(dtype)
+        return np.ndarray((nbytes // dtype.itemsize,), dtype=dtype, buffer=self.shm.buf, offset=offset)
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            # A view is still referenced somewhere; the mapping goes with the process.
+            pass
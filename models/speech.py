@@ -0,0 +1,176 @@
+"""Process-wide Vosk model cache and a bounded pool of reusable recognizers.
+
+Loading ``vosk.Model`` reads the acoustic model and decoding graph from disk,
+which is far too slow to repeat on every upload. The model is loaded once per
+process and ``KaldiRecognizer`` objects are handed out from a fixed-size pool,
+reset and returned after each request.
+
+Pools can also be built with a Vosk grammar (see ``keyword_grammar``), which
+restricts decoding to a fixed phrase list for cheap keyword spotting.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+
+from vosk import Model, KaldiRecognizer
+
+VOSK_MODEL_URL = "https://alphacephei.com/vosk/models/vosk-model-small-en-us-0.15.zip"
+
+_model_lock = threading.Lock()
+_models = {}
+_pools = {}
+
+
+def download_vosk_model(model_path, url=VOSK_MODEL_URL):
+    """Download and unpack the Vosk model next to ``model_path``."""
+    import requests
+    print("Vosk model not found, attempting to download...")
+    r = requests.get(url, timeout=30)
+    with open("vosk_model.zip", "wb") as f:
+        f.write(r.content)
+    with zipfile.ZipFile("vosk_model.zip", "r") as zip_ref:
+        zip_ref.extractall(os.path.dirname(os.path.abspath(model_path)))
+    print("Vosk model downloaded successfully")
+
+
+def get_vosk_model(model_path, allow_download=True):
+    """Return the cached Vosk model for ``model_path``, loading it on first use.
+
+    With ``allow_download=False`` a missing model raises ``FileNotFoundError``
+    instead of being fetched from the network.
+    """
+    cached = _models.get(model_path)
+    if cached is not None:
+        return cached
+    with _model_lock:
+        if model_path not in _models:
+            if not os.path.exists(model_path):
+                if not allow_download:
+                    raise FileNotFoundError(f"Vosk model not found at {model_path}")
+                download_vosk_model(model_path)
+            _models[model_path] = Model(model_path)
+        return _models[model_path]
+
+
+class RecognizerPool:
+    """Bounded pool of ``KaldiRecognizer`` objects sharing one Vosk model."""
+
+    def __init__(self, vosk_model, size=4, sample_rate=16000, grammar=None):
+        self.vosk_model = vosk_model
+        self.size = size
+        self.sample_rate = sample_rate
+        self.grammar = grammar
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._acquired = 0
+        self._waited = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _checkout(self, timeout):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._new_recognizer()
+        return self._idle.get(timeout=timeout)
+
+    def _new_recognizer(self):
+        if self.grammar is None:
+            return KaldiRecognizer(self.vosk_model, self.sample_rate)
+        rec = KaldiRecognizer(self.vosk_model, self.sample_rate, self.grammar)
+        rec.SetWords(True)
+        return rec
+
+    @contextmanager
+    def recognizer(self, timeout=30):
+        """Borrow a recognizer; it is reset and returned to the pool afterwards.
+
+        Raises ``queue.Empty`` if none becomes free within ``timeout`` seconds.
+        """
+        start = time.perf_counter()
+        rec = self._checkout(timeout)
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            if waited > 0.001:
+                self._waited += 1
+        try:
+            yield rec
+        finally:
+            rec.Reset()
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(rec)
+
+    def stats(self):
+        """Pool occupancy and wait-time counters for the /stats endpoint."""
+        with self._lock:
+            return {
+                "size": self.size,
+                "grammar": self.grammar is not None,
+                "created": self._created,
+                "in_use": self._in_use,
+                "acquired": self._acquired,
+                "waited": self._waited,
+                "wait_avg_ms": round(self._wait_total / self._acquired * 1000, 3) if self._acquired else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+
+def get_recognizer_pool(model_path, size=4, sample_rate=16000, allow_download=True, grammar=None):
+    """Return the process-wide recognizer pool for ``model_path`` and ``grammar``."""
+    key = (model_path, grammar)
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+    vosk_model = get_vosk_model(model_path, allow_download=allow_download)
+    with _model_lock:
+        if key not in _pools:
+            _pools[key] = RecognizerPool(vosk_model, size=size, sample_rate=sample_rate, grammar=grammar)
+        return _pools[key]
+
+
+def pool_stats():
+    """Stats for every pool created in this process, keyed by model path."""
+    return {(path if grammar is None else f"{path}#grammar"): pool.stats()
+            for (path, grammar), pool in _pools.items()}
+
+
+def keyword_grammar(keywords):
+    """Vosk grammar that only recognizes ``keywords``, with ``[unk]`` absorbing other speech."""
+    return json.dumps(sorted({k.lower() for k in keywords}) + ["[unk]"])
+
+
+def find_keywords(words, keywords):
+    """Locate keyword phrases in Vosk word results (``SetWords(True)`` output).
+
+    Returns one ``{"keyword", "start", "end", "conf"}`` dict per occurrence,
+    ordered by start time. Confidence is that of the least confident word.
+    """
+    tokens = [w["word"].lower() for w in words]
+    hits = []
+    for keyword in keywords:
+        parts = keyword.lower().split()
+        for i in range(len(tokens) - len(parts) + 1):
+            if tokens[i:i + len(parts)] == parts:
+                span = words[i:i + len(parts)]
+                hits.append({
+                    "keyword": keyword,
+                    "start": span[0]["start"],
+                    "end": span[-1]["end"],
+                    "conf": round(min(w.get("conf", 1.0) for w in span), 3),
+                })
+    return sorted(hits, key=lambda h: h["start"])
@@ -0,0 +1,148 @@
+"""Incremental YAMNet + Vosk scoring for live 16 kHz PCM streams.
+
+The phone sends little-endian int16 mono PCM at 16 kHz in arbitrary sized
+chunks. Every HOP_SAMPLES of new audio the most recent YAMNet patch is
+scored, so an alert is raised at most one hop after the dangerous sound
+arrives instead of after the whole recording has been uploaded.
+"""
+import json
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+# One YAMNet patch (0.975 s) scored every 0.48 s, matching YAMNet's own hop.
+WINDOW_SAMPLES = 15600
+HOP_SAMPLES = 7680
+DEFAULT_THRESHOLD = 0.2
+
+
+class StreamingDetector:
+    """Feeds PCM chunks to YAMNet and Vosk and reports alert events as soon as they happen."""
+
+    def __init__(self, model, class_map, danger_sounds, keywords, recognizer=None,
+                 threshold=DEFAULT_THRESHOLD, hop_samples=HOP_SAMPLES):
+        self.model = model
+        self.class_map = class_map
+        self.danger_indices = [i for i, name in enumerate(class_map) if name in danger_sounds]
+        self.keywords = [k.lower() for k in keywords]
+        self.recognizer = recognizer
+        self.threshold = threshold
+        self.hop_samples = hop_samples
+
+        self.window = np.zeros(WINDOW_SAMPLES, dtype=np.float32)
+        self.filled = 0
+        self.pending = 0
+        self.samples_seen = 0
+        self.leftover = b""
+        self.score_sum = None
+        self.windows_scored = 0
+        self.texts = []
+        self.alert = None
+
+    def feed(self, chunk):
+        """Consume a chunk of int16 PCM bytes and return the list of events it produced."""
+        events = []
+        data = self.leftover + chunk
+        usable = len(data) - (len(data) % 2)
+        self.leftover = data[usable:]
+        if not usable:
+            return events
+        pcm = data[:usable]
+
+        if self.recognizer is not None and self.alert is None:
+            events.extend(self._feed_speech(pcm))
+
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        while len(samples):
+            take = min(len(samples), self.hop_samples - self.pending)
+            self._push(samples[:take])
+            samples = samples[take:]
+            self.pending += take
+            self.samples_seen += take
+            if self.pending >= self.hop_samples:
+                self.pending = 0
+                event = self._score_window()
+                if event is not None:
+                    events.append(event)
+        return events
+
+    def finish(self):
+        """Flush buffered audio and return the final summary event."""
+        if self.pending and self.alert is None:
+            event = self._score_window()
+            if event is not None:
+                yield event
+        if self.recognizer is not None:
+            final = json.loads(self.recognizer.FinalResult()).get("text", "")
+            if final:
+                self.texts.append(final)
+                # Words only settled by the final decode still raise an alert.
+                if self.alert is None:
+                    event = self._match_keywords(final)
+                    if event is not None:
+                        yield event
+
+        results = []
+        if self.score_sum is not None:
+            mean_scores = self.score_sum / self.windows_scored
+            top_indices = mean_scores.argsort()[-5:][::-1]
+            results = [(self._label(i), f"{mean_scores[i]*100:.2f}") for i in top_indices]
+        yield {
+            "event": "summary",
+            "results": results,
+            "speech_text": " ".join(self.texts),
+            "alert": self.alert is not None,
+            "seconds": round(self.samples_seen / SAMPLE_RATE, 3),
+        }
+
+    def _label(self, i):
+        return self.class_map[i] if i < len(self.class_map) else f"Class_{i}"
+
+    def _push(self, samples):
+        n = len(samples)
+        self.window = np.roll(self.window, -n)
+        self.window[-n:] = samples
+        self.filled = min(WINDOW_SAMPLES, self.filled + n)
+
+    def _score_window(self):
+        if self.model is None or self.alert is not None:
+            return None
+        scores, _, _ = self.model(self.window[-self.filled:] if self.filled < WINDOW_SAMPLES else self.window)
+        frame_scores = np.asarray(scores).max(axis=0)
+        self.score_sum = frame_scores if self.score_sum is None else self.score_sum + frame_scores
+        self.windows_scored += 1
+
+        if not self.danger_indices:
+            return None
+        danger = frame_scores[self.danger_indices]
+        best = int(danger.argmax())
+        if danger[best] >= self.threshold:
+            return self._raise_alert("yamnet", self._label(self.danger_indices[best]), float(danger[best]))
+        return None
+
+    def _feed_speech(self, pcm):
+        if self.recognizer.AcceptWaveform(pcm):
+            text = json.loads(self.recognizer.Result()).get("text", "")
+            if text:
+                self.texts.append(text)
+        else:
+            text = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        event = self._match_keywords(text)
+        return [] if event is None else [event]
+
+    def _match_keywords(self, text):
+        lowered = text.lower()
+        for keyword in self.keywords:
+            if keyword in lowered:
+                return self._raise_alert("speech", keyword, 1.0)
+        return None
+
+    def _raise_alert(self, source, label, score):
+        self.alert = {
+            "event": "alert",
+            "source": source,
+            "label": label,
+            "score": round(score, 4),
+            "t": round(self.samples_seen / SAMPLE_RATE, 3),
+        }
+        return self.alert
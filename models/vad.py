@@ -0,0 +1,74 @@
+"""Frame-level energy gating in front of YAMNet and Vosk.
+
+The waveform is cut into 30 ms frames and the RMS energy of every frame is
+computed in one vectorized pass. Frames above the threshold are active; each
+active run is padded on both sides so word onsets and tails are kept, and
+overlapping runs are merged. Silent uploads skip inference entirely and Vosk
+only decodes the active segments.
+"""
+import threading
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = 480       # 30 ms
+DEFAULT_THRESHOLD = 0.01  # RMS, about -40 dBFS
+DEFAULT_PAD_MS = 300
+
+
+def frame_rms(wav, frame=FRAME_SAMPLES):
+    """RMS energy of each ``frame``-sample frame; a partial last frame is zero-padded."""
+    n_frames = -(-len(wav) // frame)
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    padded = np.zeros(n_frames * frame, dtype=np.float32)
+    padded[:len(wav)] = wav
+    frames = padded.reshape(n_frames, frame)
+    return np.sqrt(np.einsum("ij,ij->i", frames, frames) / frame)
+
+
+def active_segments(wav, threshold=DEFAULT_THRESHOLD, pad_ms=DEFAULT_PAD_MS, frame=FRAME_SAMPLES):
+    """Return merged ``(start, end)`` sample ranges whose energy exceeds ``threshold``."""
+    active = frame_rms(wav, frame) > threshold
+    if not active.any():
+        return []
+    pad = int(round(pad_ms * SAMPLE_RATE / 1000 / frame))
+    if pad:
+        # Dilate the mask by ``pad`` frames on each side. "full" plus a centred
+        # slice keeps the mask's length even when it is shorter than the kernel.
+        dilated = np.convolve(active.astype(np.int8), np.ones(2 * pad + 1, dtype=np.int8), mode="full")
+        active = dilated[pad:pad + len(active)] > 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], active.astype(np.int8), [0]))))
+    starts, ends = edges[0::2], edges[1::2]
+    return [(int(s * frame), int(min(e * frame, len(wav)))) for s, e in zip(starts, ends)]
+
+
+class GateStats:
+    """Running totals of how much audio the gate let through."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clips = 0
+        self.silent_clips = 0
+        self.total_samples = 0
+        self.active_samples = 0
+
+    def record(self, total_samples, segments):
+        active = sum(end - start for start, end in segments)
+        with self._lock:
+            self.clips += 1
+            self.silent_clips += not segments
+            self.total_samples += total_samples
+            self.active_samples += active
+        return 1.0 - active / total_samples if total_samples else 1.0
+
+    def stats(self):
+        with self._lock:
+            skipped = self.total_samples - self.active_samples
+            return {
+                "clips": self.clips,
+                "silent_clips": self.silent_clips,
+                "audio_seconds": round(self.total_samples / SAMPLE_RATE, 3),
+                "skipped_seconds": round(skipped / SAMPLE_RATE, 3),
+                "skipped_fraction": round(skipped / self.total_samples, 4) if self.total_samples else 0.0,
+            }
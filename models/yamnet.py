@@ -0,0 +1,130 @@
+"""Pluggable YAMNet inference backends.
+
+Every backend is a callable taking a mono float32 16 kHz waveform and
+returning numpy ``(scores, embeddings, spectrogram)`` with the same shapes as
+the TF Hub model: ``(patches, 521)``, ``(patches, 1024)`` and
+``(frames, 64)``. ``detect()`` and the batcher only rely on that contract.
+
+Backends:
+    tf           TF Hub / SavedModel graph run eagerly (default)
+    tflite       float32 TFLite conversion of the same graph
+    tflite-int8  int8-quantized TFLite conversion
+
+TFLite files are produced by ``scripts/convert_yamnet_tflite.py``.
+"""
+import os
+import threading
+
+import numpy as np
+
+from models.batching import HOP_SAMPLES, PATCH_SAMPLES, num_patches
+
+BACKENDS = ("tf", "tflite", "tflite-int8")
+TFLITE_FILES = {"tflite": "yamnet.tflite", "tflite-int8": "yamnet_int8.tflite"}
+NUM_CLASSES = 521
+EMBEDDING_SIZE = 1024
+MEL_BANDS = 64
+
+
+class TFBackend:
+    """The TF Hub YAMNet graph, loaded from a hub URL or a local SavedModel."""
+
+    name = "tf"
+
+    def __init__(self, handle):
+        import tensorflow_hub as hub
+        self.model = hub.load(handle)
+
+    def __call__(self, waveform):
+        scores, embeddings, spectrogram = self.model(waveform)
+        return scores.numpy(), embeddings.numpy(), spectrogram.numpy()
+
+
+def _interpreter_class():
+    # The slim tflite-runtime wheel is enough on small instances; fall back to
+    # the interpreter bundled with full TensorFlow.
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteBackend:
+    """YAMNet run through a TFLite interpreter.
+
+    Models with a dynamic waveform input are resized to each clip. Models with
+    a fixed single-patch input (such as the published classification model)
+    are run once per 0.96 s patch, padded the same way YAMNet pads a clip.
+    Outputs are told apart by their last dimension, because output tensor
+    names differ between converters.
+    """
+
+    def __init__(self, model_path, name="tflite", num_threads=None):
+        self.name = name
+        Interpreter = _interpreter_class()
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._lock = threading.Lock()
+        self._input = self.interpreter.get_input_details()[0]
+        signature = self._input.get("shape_signature", self._input["shape"])
+        self._dynamic = any(int(d) < 0 for d in signature)
+        self._input_len = None
+        self._outputs = {}
+        for detail in self.interpreter.get_output_details():
+            last = int(detail["shape"][-1]) if len(detail["shape"]) else 0
+            key = {NUM_CLASSES: "scores", EMBEDDING_SIZE: "embeddings", MEL_BANDS: "spectrogram"}.get(last)
+            if key is not None:
+                self._outputs[key] = detail["index"]
+
+    def _invoke(self, waveform):
+        if self._dynamic:
+            if self._input_len != len(waveform):
+                self.interpreter.resize_tensor_input(self._input["index"], [len(waveform)])
+                self.interpreter.allocate_tensors()
+                self._input_len = len(waveform)
+            self.interpreter.set_tensor(self._input["index"], waveform)
+        else:
+            self.interpreter.set_tensor(self._input["index"], waveform.reshape(self._input["shape"]))
+        self.interpreter.invoke()
+        out = {}
+        for key, index in self._outputs.items():
+            tensor = self.interpreter.get_tensor(index)
+            out[key] = tensor.reshape(-1, tensor.shape[-1])
+        return out
+
+    def __call__(self, waveform):
+        waveform = np.ascontiguousarray(waveform, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if self._dynamic:
+                out = self._invoke(waveform)
+            else:
+                n = num_patches(len(waveform))
+                padded = np.zeros(PATCH_SAMPLES + (n - 1) * HOP_SAMPLES, dtype=np.float32)
+                padded[:len(waveform)] = waveform
+                parts = [self._invoke(padded[k * HOP_SAMPLES:k * HOP_SAMPLES + PATCH_SAMPLES]) for k in range(n)]
+                out = {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+        patches = len(out["scores"])
+        return (
+            out["scores"],
+            out.get("embeddings", np.zeros((patches, 0), dtype=np.float32)),
+            out.get("spectrogram", np.zeros((0, MEL_BANDS), dtype=np.float32)),
+        )
+
+
+def load_backend(name, handle=None, model_dir=".", num_threads=None):
+    """Create the YAMNet backend called ``name`` (one of ``BACKENDS``)."""
+    if name == "tf":
+        return TFBackend(handle)
+    if name in TFLITE_FILES:
+        path = os.path.join(model_dir, TFLITE_FILES[name])
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{name} model not found at {path}; run scripts/convert_yamnet_tflite.py")
+        return TFLiteBackend(path, name=name, num_threads=num_threads)
+    raise ValueError(f"Unknown YAMNet backend {name!r}; expected one of {', '.join(BACKENDS)}")
+
+
+def top_k(mean_scores, k=5):
+    """Indices of the ``k`` highest mean scores, best first."""
+    return mean_scores.argsort()[-k:][::-1]
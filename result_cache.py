@@ -0,0 +1,132 @@
+"""Content-addressed cache of detection results.
+
+Mobile clients retry uploads on flaky networks, so the same clip is often
+analyzed more than once. Results are keyed by a hash of the uploaded bytes
+and kept in a size-bounded in-process LRU. Optionally they are also kept in an
+on-disk tier that every gunicorn worker on the host shares. Both tiers expire
+entries after ``ttl`` seconds.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """Two-tier (memory LRU + optional shared directory) cache with a TTL."""
+
+    def __init__(self, max_entries=256, ttl=3600, disk_dir=None, max_disk_entries=10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        """Return the cached value for ``key`` or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._entries[key]
+
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._memory_put(key, value, now)
+        return value
+
+    def put(self, key, value):
+        """Store a JSON-serializable ``value`` under ``key`` in both tiers."""
+        now = time.time()
+        with self._lock:
+            self._memory_put(key, value, now)
+            self._puts += 1
+            prune = self._puts % 100 == 0
+        if self.disk_dir:
+            self._disk_put(key, value)
+            if prune:
+                self._disk_prune(now)
+
+    def _memory_put(self, key, value, now):
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl <= now:
+                os.remove(path)
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, key, value):
+        # Write to a temporary file and rename so other workers never read a
+        # half-written entry.
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Result cache write error: {e}")
+
+    def _disk_prune(self, now):
+        """Drop expired entries, then the oldest ones beyond ``max_disk_entries``."""
+        try:
+            entries = []
+            for name in os.listdir(self.disk_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.disk_dir, name)
+                mtime = os.path.getmtime(path)
+                if mtime + self.ttl <= now:
+                    os.remove(path)
+                else:
+                    entries.append((mtime, path))
+            entries.sort()
+            for _, path in entries[:max(0, len(entries) - self.max_disk_entries)]:
+                os.remove(path)
+        except OSError as e:
+            print(f"Result cache prune error: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "disk": bool(self.disk_dir),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
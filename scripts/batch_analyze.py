@@ -0,0 +1,208 @@
+"""Run the /detect pipeline over a directory of recordings.
+
+Usage:
+    python scripts/batch_analyze.py DIR [--output results.jsonl] [--workers N]
+                                        [--labels labels.csv]
+
+Files are fanned out to a process pool. Each worker imports the app once, so
+YAMNet and Vosk are loaded once per process rather than once per file. One
+JSON line is written per file with its top classes, transcript, alert flag
+and per-stage timings. Unlike /detect, both engines always run to completion,
+so every line has a full result even when the first engine already alerted.
+Recordings longer than LONGFORM_SECONDS go through the app's block-wise path
+and report a single ``longform`` timing.
+
+The labels file is a CSV of ``file,label`` rows, where ``file`` is a path
+relative to DIR (or a bare file name) and ``label`` is unsafe/safe, alert/none,
+1/0 or true/false. With it the run ends with accuracy, precision and recall of
+the alert decision.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.audio import decode_audio
+
+AUDIO_EXTENSIONS = (".wav", ".ogg", ".flac", ".mp3", ".m4a")
+POSITIVE_LABELS = ("1", "true", "yes", "unsafe", "alert", "danger")
+
+detection = None
+
+
+def init_worker():
+    """Import the app in this process with per-request batching and warm-up off."""
+    global detection
+    os.environ["WARMUP"] = "0"
+    os.environ["YAMNET_BATCHING"] = "0"
+    os.environ.setdefault("VOSK_POOL_SIZE", "1")
+    os.environ.setdefault("DETECT_WORKERS", "2")
+    import app
+    detection = app
+
+
+def analyze(path):
+    """Run every detection stage on ``path`` and time each one."""
+    timings = {}
+    record = {"file": path, "results": None, "speech_text": "", "keyword_hits": [],
+              "skipped_fraction": None, "danger_score": None, "alert": False}
+
+    try:
+        long_recording = detection.sf.info(path).duration > detection.LONGFORM_SECONDS
+    except Exception:
+        long_recording = False
+    if long_recording:
+        # Long recordings are processed block-wise in one pass; only the total is timed.
+        start = time.perf_counter()
+        analysis = detection.analyze_long_file(path)
+        record.update({k: analysis.get(k) for k in ("results", "speech_text", "keyword_hits", "skipped_fraction",
+                                                 "alert", "peak_danger", "danger_score")})
+        record["seconds"] = round(detection.sf.info(path).duration, 3)
+        record["timings_ms"] = {"longform": round((time.perf_counter() - start) * 1000, 3)}
+        return record
+
+    start = time.perf_counter()
+    try:
+        wav = decode_audio(path)
+    except Exception as e:
+        record["error"] = f"decode failed: {e}"
+        record["timings_ms"] = {"decode": round((time.perf_counter() - start) * 1000, 3)}
+        return record
+    timings["decode"] = time.perf_counter() - start
+    record["seconds"] = round(len(wav) / 16000, 3)
+
+    start = time.perf_counter()
+    segments = detection.active_segments(wav, threshold=detection.VAD_THRESHOLD, pad_ms=detection.VAD_PAD_MS)
+    active = sum(end - begin for begin, end in segments)
+    record["skipped_fraction"] = round(1.0 - active / len(wav), 4) if len(wav) else 1.0
+    timings["gate"] = time.perf_counter() - start
+
+    if segments:
+        start = time.perf_counter()
+        results, labels, _, danger_score = detection.classify_sounds(wav)
+        timings["sound"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        speech_text, keyword_hits = detection.transcribe(wav, segments)
+        timings["speech"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        alert = (detection.is_danger_sound(labels) or detection.is_danger_embedding(danger_score)
+                 or detection.is_danger_speech(speech_text))
+        timings["decide"] = time.perf_counter() - start
+
+        record.update(results=[list(r) for r in results], speech_text=speech_text, keyword_hits=keyword_hits,
+                      danger_score=round(danger_score, 4) if danger_score is not None else None, alert=alert)
+    else:
+        record["results"] = [["Silence", "100.00"]]
+
+    record["timings_ms"] = {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+    return record
+
+
+def find_audio(root):
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        paths.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.lower().endswith(AUDIO_EXTENSIONS))
+    return paths
+
+
+def load_labels(path):
+    """Map file keys (relative path and bare name) to a boolean alert label."""
+    labels = {}
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or row[0].strip().lower() in ("file", "filename", "path"):
+                continue
+            labels[row[0].strip()] = row[1].strip().lower() in POSITIVE_LABELS
+    return labels
+
+
+def label_for(labels, root, path):
+    relative = os.path.relpath(path, root)
+    if relative in labels:
+        return labels[relative]
+    return labels.get(os.path.basename(path))
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--output", default="batch_results.jsonl")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--labels", help="CSV of file,label rows to score the alert decision against")
+    args = parser.parse_args()
+
+    paths = find_audio(args.directory)
+    if not paths:
+        sys.exit(f"No audio files found under {args.directory}")
+    labels = load_labels(args.labels) if args.labels else None
+
+    stage_ms = {}
+    audio_seconds = 0.0
+    errors = 0
+    confusion = {"tp": 0, "fp": 0, "tn": 0, "fn": 0}
+    unlabeled = 0
+    unscored = 0
+
+    # spawn rather than fork: TensorFlow does not survive being forked after import.
+    ctx = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx, initializer=init_worker) as pool, \
+            open(args.output, "w") as out:
+        for record in pool.map(analyze, paths):
+            record["file"] = os.path.relpath(record["file"], args.directory)
+            for stage, ms in record["timings_ms"].items():
+                stage_ms.setdefault(stage, []).append(ms)
+            audio_seconds += record.get("seconds", 0.0)
+            if "error" in record:
+                errors += 1
+            if labels is not None:
+                expected = label_for(labels, args.directory, os.path.join(args.directory, record["file"]))
+                if expected is None:
+                    unlabeled += 1
+                elif "error" in record:
+                    # Never analyzed: counting it as "no alert" would skew the metrics.
+                    unscored += 1
+                else:
+                    record["expected_alert"] = expected
+                    key = ("t" if record["alert"] == expected else "f") + ("p" if record["alert"] else "n")
+                    confusion[key] += 1
+            out.write(json.dumps(record) + "\n")
+    wall = time.perf_counter() - start
+
+    print(f"{len(paths)} files ({audio_seconds:.1f} s of audio) in {wall:.1f} s with {args.workers} workers, "
+          f"{errors} errors -> {args.output}")
+    print(f"throughput: {len(paths) / wall:.2f} files/s, {audio_seconds / wall:.1f}x real time "
+          f"(includes model loading)")
+    print(f"{'stage':<8} {'p50 ms':>10} {'p95 ms':>10} {'total s':>10}")
+    for stage, values in stage_ms.items():
+        print(f"{stage:<8} {percentile(values, 50):>10.2f} {percentile(values, 95):>10.2f} {sum(values) / 1000:>10.2f}")
+
+    if labels is not None:
+        scored = sum(confusion.values())
+        tp, fp, tn, fn = confusion["tp"], confusion["fp"], confusion["tn"], confusion["fn"]
+        print(f"labels: {scored} scored, {unlabeled} without a label, {unscored} failed and not scored")
+        if scored:
+            precision = tp / (tp + fp) if tp + fp else 0.0
+            recall = tp / (tp + fn) if tp + fn else 0.0
+            print(f"accuracy {(tp + tn) / scored:.3f}  precision {precision:.3f}  recall {recall:.3f}  "
+                  f"(tp {tp}, fp {fp}, tn {tn}, fn {fn})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Per-stage micro-benchmarks for the detection pipeline.
+
+Usage:
+    python scripts/bench_pipeline.py [--repeat 20] [--dataset DIR] [--no-yamnet] [--no-vosk]
+                                     [--save baseline.json]
+                                     [--baseline baseline.json] [--tolerance 0.25]
+
+Every clip runs the stages /detect runs, in order, each timed in isolation
+on the previous stage's output:
+    read      soundfile decode to float32
+    downmix   channel average to mono
+    resample  cached polyphase resample to 16 kHz
+    gate      frame RMS energy gate
+    yamnet    YAMNet forward pass (YAMNET_BACKEND, skipped if it cannot load)
+    topk      top-5 of the mean class scores
+    pcm16     float32 -> int16 PCM for Vosk
+    vosk      Vosk decode of the whole clip (skipped if the model is not on disk)
+    keywords  emergency keyword match over a transcript
+
+Clips are synthetic noise bursts at several lengths, sample rates and channel
+counts, plus the bundled dataset clips. Each stage reports p50/p95 latency
+and the peak traced allocation of one extra run.
+
+--save writes the results as a JSON baseline. --baseline compares a run
+against one and exits with status 1 if any stage's p50 is more than
+--tolerance (a fraction) slower and at least --min-ms slower in absolute
+terms.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import soundfile as sf
+
+from models.audio import SAMPLE_RATE, accept_waveform, downmix, pcm_chunks, to_pcm16
+from models.resample import resample
+from models.vad import active_segments
+from models.yamnet import load_backend, top_k
+
+DEFAULT_DATASET = os.path.join("STEP-2 &STEP 3 DETECTION AND RECOVERY", "dataset")
+AUDIO_EXTENSIONS = (".wav", ".ogg", ".flac", ".mp3")
+# (seconds, sample rate, channels) of the synthetic clips.
+SYNTHETIC = ((1, 16000, 1), (5, 44100, 2), (5, 48000, 1), (30, 44100, 2), (30, 48000, 2))
+# The same list app.py matches transcripts against.
+KEYWORDS = ["help", "save me", "leave me", "don't touch", "Stay away"]
+TRANSCRIPT_WORDS = "please i am walking home and someone keeps following me i want them to stay away".split()
+
+
+def synthetic_clip(path, seconds, sr, channels, rng):
+    """Write noise bursts over a quiet floor, so the gate keeps part of the clip."""
+    n = int(seconds * sr)
+    wav = rng.standard_normal((n, channels)).astype(np.float32) * 0.002
+    burst = sr // 2
+    for start in range(0, n, 2 * burst):
+        wav[start:start + burst] *= 50
+    sf.write(path, wav, sr, subtype="PCM_16")
+
+
+def is_danger_speech(text):
+    return any(k.lower() in text.lower() for k in KEYWORDS)
+
+
+def load_yamnet(model_dir):
+    name = os.getenv("YAMNET_BACKEND", "tf")
+    handle = os.path.join(model_dir, "yamnet")
+    if not os.path.exists(handle):
+        handle = "https://tfhub.dev/google/yamnet/1"
+    try:
+        backend = load_backend(name, handle=handle, model_dir=model_dir)
+        backend(np.zeros(SAMPLE_RATE, dtype=np.float32))
+        return backend
+    except Exception as e:
+        print(f"yamnet stage skipped: {e}")
+        return None
+
+
+def load_vosk(model_dir):
+    try:
+        from models.speech import get_recognizer_pool
+        path = os.path.join(model_dir, "vosk-model-small-en-us-0.15")
+        return get_recognizer_pool(path, size=1, allow_download=False)
+    except Exception as e:
+        print(f"vosk stage skipped: {e}")
+        return None
+
+
+def decode_with(pool, pcm):
+    with pool.recognizer() as rec:
+        for chunk in pcm_chunks(pcm):
+            accept_waveform(rec, chunk)
+        return json.loads(rec.FinalResult()).get("text", "")
+
+
+def measure(fn, repeat):
+    """Time ``fn`` ``repeat`` times after one warm-up call; return stats and its output."""
+    result = fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings = np.array(timings)
+    return {
+        "p50_ms": round(float(np.percentile(timings, 50)), 4),
+        "p95_ms": round(float(np.percentile(timings, 95)), 4),
+        "min_ms": round(float(timings.min()), 4),
+        "peak_mb": round(peak / 2**20, 3),
+    }, result
+
+
+def bench_clip(path, repeat, yamnet, vosk_pool):
+    stages = {}
+    stages["read"], (frames, sr) = measure(lambda: sf.read(path, dtype="float32", always_2d=True), repeat)
+    stages["downmix"], mono = measure(lambda: downmix(frames), repeat)
+    stages["resample"], wav = measure(lambda: np.ascontiguousarray(resample(mono, sr, SAMPLE_RATE)), repeat)
+    stages["gate"], _ = measure(lambda: active_segments(wav), repeat)
+    if yamnet is not None:
+        stages["yamnet"], (scores, _, _) = measure(lambda: yamnet(wav), repeat)
+        mean_scores = np.asarray(scores).mean(axis=0)
+        stages["topk"], _ = measure(lambda: top_k(mean_scores, 5), repeat)
+    stages["pcm16"], pcm = measure(lambda: to_pcm16(wav), repeat)
+    transcript = None
+    if vosk_pool is not None:
+        stages["vosk"], transcript = measure(lambda: decode_with(vosk_pool, pcm), repeat)
+    if not transcript:
+        # Noise decodes to nothing; match against speech-like text of the same length.
+        words = int(len(wav) / SAMPLE_RATE * 2.5) or 1
+        transcript = " ".join(TRANSCRIPT_WORDS[i % len(TRANSCRIPT_WORDS)] for i in range(words))
+    stages["keywords"], _ = measure(lambda: is_danger_speech(transcript), repeat)
+    return {"seconds": round(len(wav) / SAMPLE_RATE, 3), "sample_rate": sr, "channels": frames.shape[1],
+            "stages": stages}
+
+
+def compare(results, baseline, tolerance, min_ms):
+    """Return ``(clip, stage, base, now)`` for every stage slower than the baseline allows."""
+    regressions = []
+    for clip, result in results.items():
+        base_clip = baseline.get("clips", {}).get(clip)
+        if base_clip is None:
+            continue
+        for stage, stats in result["stages"].items():
+            base = base_clip["stages"].get(stage)
+            if base is None:
+                continue
+            now, before = stats["p50_ms"], base["p50_ms"]
+            if now > before * (1 + tolerance) and now - before >= min_ms:
+                regressions.append((clip, stage, before, now))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--dataset", default=DEFAULT_DATASET)
+    parser.add_argument("--model-dir", default=os.getenv("MODEL_DIR", "model_artifacts"))
+    parser.add_argument("--no-yamnet", action="store_true")
+    parser.add_argument("--no-vosk", action="store_true")
+    parser.add_argument("--save", help="write the results to this JSON baseline")
+    parser.add_argument("--baseline", help="compare against this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown as a fraction")
+    parser.add_argument("--min-ms", type=float, default=0.05, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    yamnet = None if args.no_yamnet else load_yamnet(args.model_dir)
+    vosk_pool = None if args.no_vosk else load_vosk(args.model_dir)
+
+    rng = np.random.default_rng(0)
+    clips = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for seconds, sr, channels in SYNTHETIC:
+            path = os.path.join(tmp, f"synthetic-{seconds}s-{sr}-{channels}ch.wav")
+            synthetic_clip(path, seconds, sr, channels, rng)
+            clips[os.path.basename(path)] = path
+        if os.path.isdir(args.dataset):
+            for name in sorted(os.listdir(args.dataset)):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    clips[name] = os.path.join(args.dataset, name)
+
+        results = {}
+        for name, path in clips.items():
+            results[name] = bench_clip(path, args.repeat, yamnet, vosk_pool)
+
+    print(f"{'clip':<34} {'stage':<9} {'p50 ms':>9} {'p95 ms':>9} {'peak MB':>8}")
+    for name, result in results.items():
+        for stage, stats in result["stages"].items():
+            print(f"{name[:34]:<34} {stage:<9} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} {stats['peak_mb']:>8.2f}")
+
+    report = {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count(), "numpy": np.__version__},
+        "repeat": args.repeat,
+        "clips": results,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline written to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_ms)
+        for clip, stage, before, now in regressions:
+            print(f"REGRESSION {clip} {stage}: p50 {before:.3f} ms -> {now:.3f} ms (+{(now / before - 1) * 100:.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"no stage regressed by more than {args.tolerance * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
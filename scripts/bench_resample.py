@@ -0,0 +1,81 @@
+"""Benchmark the cached polyphase decode path against the old librosa path.
+
+Usage:
+    python scripts/bench_resample.py [--seconds 30] [--repeat 5]
+
+For 44.1 kHz and 48 kHz stereo input this reports the median time and the
+peak traced allocation of:
+    librosa  float64 read, np.mean downmix, librosa.resample, cast to float32
+    poly     float32 downmix and cached polyphase resample (models.audio)
+    blocks   the same path run block-wise through BlockResampler
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import librosa
+import numpy as np
+
+from models.audio import downmix
+from models.resample import BlockResampler, resample
+
+TARGET_SR = 16000
+
+
+def librosa_path(stereo64, sr):
+    wav = np.mean(stereo64, axis=1)
+    wav = librosa.resample(wav, orig_sr=sr, target_sr=TARGET_SR)
+    return wav.astype(np.float32)
+
+
+def poly_path(stereo32, sr):
+    return resample(downmix(stereo32), sr, TARGET_SR)
+
+
+def block_path(stereo32, sr, blocksize=65536):
+    resampler = BlockResampler(sr, TARGET_SR)
+    out = [resampler.process(downmix(stereo32[i:i + blocksize])) for i in range(0, len(stereo32), blocksize)]
+    out.append(resampler.flush())
+    return np.concatenate(out)
+
+
+def measure(fn, args, repeat):
+    fn(*args)  # warm caches
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return float(np.median(timings) * 1000), peak / 2**20, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'rate':>6} {'path':<8} {'median ms':>10} {'peak MB':>8} {'max |diff|':>11}")
+    for sr in (44100, 48000):
+        stereo32 = (rng.standard_normal((int(sr * args.seconds), 2)) * 0.1).astype(np.float32)
+        stereo64 = stereo32.astype(np.float64)
+        ms, mb, reference = measure(librosa_path, (stereo64, sr), args.repeat)
+        print(f"{sr:>6} {'librosa':<8} {ms:>10.1f} {mb:>8.1f} {'-':>11}")
+        for name, fn in (("poly", poly_path), ("blocks", block_path)):
+            ms, mb, out = measure(fn, (stereo32, sr), args.repeat)
+            n = min(len(out), len(reference))
+            diff = float(np.abs(out[:n] - reference[:n]).max())
+            print(f"{sr:>6} {name:<8} {ms:>10.1f} {mb:>8.1f} {diff:>11.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Compare YAMNet backends on latency, memory and agreement with the TF graph.
+
+Usage:
+    python scripts/bench_yamnet_backends.py [--backends tf,tflite,tflite-int8]
+                                            [--dataset DIR] [--repeat 5] [--json out.json]
+
+Each backend runs in its own process so that peak RSS is measured in
+isolation. Agreement is reported against the 'tf' backend: top-1 match rate
+and mean overlap of the top-5 classes per clip.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+DEFAULT_DATASET = os.path.join("STEP-2 &STEP 3 DETECTION AND RECOVERY", "dataset")
+AUDIO_EXTENSIONS = (".wav", ".ogg", ".flac", ".mp3")
+
+
+def run_backend(name, model_dir, clips, repeat, queue):
+    """Worker: load one backend, time it over every clip and report results."""
+    from models.audio import decode_audio
+    from models.yamnet import load_backend, top_k
+
+    handle = os.path.join(model_dir, "yamnet")
+    if not os.path.exists(handle):
+        handle = "https://tfhub.dev/google/yamnet/1"
+    try:
+        start = time.perf_counter()
+        backend = load_backend(name, handle=handle, model_dir=model_dir)
+        load_s = time.perf_counter() - start
+    except Exception as e:
+        queue.put({"backend": name, "error": str(e)})
+        return
+
+    waveforms = {clip: decode_audio(clip) for clip in clips}
+    backend(np.zeros(16000, dtype=np.float32))  # warm-up
+
+    per_clip = {}
+    for clip, wav in waveforms.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            scores, _, _ = backend(wav)
+            timings.append(time.perf_counter() - start)
+        per_clip[os.path.basename(clip)] = {
+            "seconds": len(wav) / 16000,
+            "latency_ms": float(np.median(timings) * 1000),
+            "top5": [int(i) for i in top_k(np.asarray(scores).mean(axis=0), 5)],
+        }
+    queue.put({
+        "backend": name,
+        "load_s": load_s,
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "clips": per_clip,
+    })
+
+
+def agreement(result, reference):
+    top1 = []
+    overlap = []
+    for clip, stats in result["clips"].items():
+        ref = reference["clips"][clip]["top5"]
+        top1.append(stats["top5"][0] == ref[0])
+        overlap.append(len(set(stats["top5"]) & set(ref)) / 5)
+    return float(np.mean(top1)), float(np.mean(overlap))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="tf,tflite,tflite-int8")
+    parser.add_argument("--model-dir", default=os.getenv("MODEL_DIR", "model_artifacts"))
+    parser.add_argument("--dataset", default=DEFAULT_DATASET)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="write the full results to this file")
+    args = parser.parse_args()
+
+    clips = [os.path.join(args.dataset, f) for f in sorted(os.listdir(args.dataset))
+             if f.lower().endswith(AUDIO_EXTENSIONS)]
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for name in args.backends.split(","):
+        queue = ctx.Queue()
+        proc = ctx.Process(target=run_backend, args=(name, args.model_dir, clips, args.repeat, queue))
+        proc.start()
+        results[name] = queue.get()
+        proc.join()
+
+    reference = results.get("tf")
+    print(f"{'backend':<12} {'load s':>8} {'RSS MB':>8} {'median ms':>10} {'top-1':>6} {'top-5':>6}")
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name:<12} unavailable: {result['error']}")
+            continue
+        latency = np.median([c["latency_ms"] for c in result["clips"].values()])
+        if reference and "error" not in reference:
+            top1, top5 = agreement(result, reference)
+            result["top1_agreement"], result["top5_overlap"] = top1, top5
+            agree = f"{top1:>6.2f} {top5:>6.2f}"
+        else:
+            agree = f"{'-':>6} {'-':>6}"
+        print(f"{name:<12} {result['load_s']:>8.2f} {result['rss_mb']:>8.0f} {latency:>10.2f} {agree}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Convert the YAMNet SavedModel to the TFLite backends used by YAMNET_BACKEND.
+
+Usage:
+    python scripts/convert_yamnet_tflite.py [--model-dir model_artifacts] [--dataset DIR]
+
+Writes MODEL_DIR/yamnet.tflite (float32) and MODEL_DIR/yamnet_int8.tflite
+(int8 weights and activations, float32 waveform in and scores out). The int8
+model is calibrated on 1 s windows taken from the clips in --dataset.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import tensorflow as tf
+import tensorflow_hub as hub
+
+from models.audio import decode_audio
+
+DEFAULT_DATASET = os.path.join("STEP-2 &STEP 3 DETECTION AND RECOVERY", "dataset")
+AUDIO_EXTENSIONS = (".wav", ".ogg", ".flac", ".mp3")
+
+
+def representative_windows(dataset_dir, window=16000, limit=200):
+    """Yield calibration inputs: 1 s windows cut from every clip in ``dataset_dir``."""
+    count = 0
+    for name in sorted(os.listdir(dataset_dir)):
+        if not name.lower().endswith(AUDIO_EXTENSIONS):
+            continue
+        wav = decode_audio(os.path.join(dataset_dir, name))
+        for start in range(0, max(1, len(wav) - window + 1), window):
+            chunk = np.zeros(window, dtype=np.float32)
+            piece = wav[start:start + window]
+            chunk[:len(piece)] = piece
+            yield [chunk]
+            count += 1
+            if count >= limit:
+                return
+
+
+def convert(model_dir, dataset_dir):
+    handle = os.path.join(model_dir, "yamnet")
+    if not os.path.exists(handle):
+        handle = "https://tfhub.dev/google/yamnet/1"
+    model = hub.load(handle)
+    concrete = tf.function(lambda waveform: model(waveform)).get_concrete_function(
+        tf.TensorSpec([None], tf.float32))
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete], model)
+    path = os.path.join(model_dir, "yamnet.tflite")
+    with open(path, "wb") as f:
+        f.write(converter.convert())
+    print(f"Wrote {path}")
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete], model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = lambda: representative_windows(dataset_dir)
+    path = os.path.join(model_dir, "yamnet_int8.tflite")
+    with open(path, "wb") as f:
+        f.write(converter.convert())
+    print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=os.getenv("MODEL_DIR", "model_artifacts"))
+    parser.add_argument("--dataset", default=DEFAULT_DATASET)
+    args = parser.parse_args()
+    os.makedirs(args.model_dir, exist_ok=True)
+    convert(args.model_dir, args.dataset)
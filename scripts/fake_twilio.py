@@ -0,0 +1,117 @@
+"""Local stand-in for the Twilio Messages API.
+
+Serve it and point the app at it:
+    python scripts/fake_twilio.py --port 8765 [--latency-ms 200] [--fail-rate 0.2]
+    TWILIO_API_BASE=http://127.0.0.1:8765 TWILIO_ACCOUNT_SID=AC_test TWILIO_AUTH_TOKEN=x python app.py
+
+Or measure enqueue-to-delivery latency of the SOS dispatcher against it:
+    python scripts/fake_twilio.py --bench 200 [--latency-ms 200] [--fail-rate 0.2]
+
+The server answers POST /2010-04-01/Accounts/<sid>/Messages.json with a
+Twilio-shaped 201 response, fails a --fail-rate fraction of requests with
+503, and counts deliveries per Idempotency-Key so duplicates are visible.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeTwilio(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=0.0, fail_rate=0.0):
+        super().__init__(address, FakeTwilioHandler)
+        self.latency = latency_ms / 1000
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.messages = []
+        self.deliveries = {}
+
+
+class FakeTwilioHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.endswith("/Messages.json"):
+            return self._reply(404, {"message": "Not found"})
+        time.sleep(server.latency)
+        if random.random() < server.fail_rate:
+            return self._reply(503, {"message": "Service unavailable"})
+        form = {k: v[0] for k, v in parse_qs(body.decode("utf-8")).items()}
+        sid = "SM" + uuid.uuid4().hex
+        key = self.headers.get("Idempotency-Key", sid)
+        with server.lock:
+            server.messages.append(dict(form, sid=sid, key=key))
+            server.deliveries[key] = server.deliveries.get(key, 0) + 1
+        self._reply(201, {"sid": sid, "status": "queued", "to": form.get("To"), "from": form.get("From")})
+
+    def _reply(self, code, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bench(server, count, workers):
+    from sos_dispatch import SENT, FAILED, SosDispatcher, TwilioSender
+
+    host, port = server.server_address
+    sender = TwilioSender("AC_test", "token", "whatsapp:+10000000000", "whatsapp:+10000000001",
+                          api_base=f"http://{host}:{port}", pool_size=workers)
+    dispatcher = SosDispatcher(sender, workers=workers, base_delay=0.05, max_delay=1.0)
+    ids = [dispatcher.submit(f"incident-{i}", "SOS benchmark")["id"] for i in range(count)]
+    # Double-taps must not produce extra deliveries.
+    duplicates = sum(dispatcher.submit(f"incident-{i}", "SOS benchmark")["duplicate"] for i in range(count))
+
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        states = [dispatcher.status(i) for i in ids]
+        if all(s["status"] in (SENT, FAILED) for s in states):
+            break
+        time.sleep(0.05)
+
+    latencies = sorted(s["latency_ms"] for s in states if s["status"] == SENT)
+    failed = sum(s["status"] == FAILED for s in states)
+    extra = sum(n - 1 for n in server.deliveries.values())
+    print(f"sent {len(latencies)}/{count}, failed {failed}, deduplicated {duplicates}, duplicate deliveries {extra}")
+    if latencies:
+        pct = lambda p: latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+        print(f"enqueue-to-delivery ms: p50 {pct(50):.1f}  p90 {pct(90):.1f}  p99 {pct(99):.1f}  max {latencies[-1]:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--bench", type=int, metavar="N", help="dispatch N incidents and report latency")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    server = FakeTwilio((args.host, 0 if args.bench else args.port), args.latency_ms, args.fail_rate)
+    if args.bench:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        bench(server, args.bench, args.workers)
+        server.shutdown()
+    else:
+        print(f"Fake Twilio listening on http://{args.host}:{args.port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Download every model artifact into MODEL_DIR so the app can start offline.
+
+Usage:
+    python scripts/fetch_models.py [model_dir]
+
+Then run the app with MODEL_DIR=<model_dir> OFFLINE_MODELS=1.
+"""
+import io
+import os
+import sys
+import tarfile
+import urllib.request
+import zipfile
+
+YAMNET_URL = 'https://tfhub.dev/google/yamnet/1?tf-hub-format=compressed'
+CLASS_MAP_URL = 'https://raw.githubusercontent.com/tensorflow/models/master/research/audioset/yamnet/yamnet_class_map.csv'
+VOSK_URL = 'https://alphacephei.com/vosk/models/vosk-model-small-en-us-0.15.zip'
+
+
+def fetch(url):
+    print(f"Downloading {url} ...")
+    with urllib.request.urlopen(url, timeout=120) as response:
+        return response.read()
+
+
+def main(model_dir):
+    os.makedirs(model_dir, exist_ok=True)
+
+    yamnet_dir = os.path.join(model_dir, 'yamnet')
+    if not os.path.exists(yamnet_dir):
+        with tarfile.open(fileobj=io.BytesIO(fetch(YAMNET_URL)), mode='r:gz') as tar:
+            tar.extractall(yamnet_dir)
+
+    class_map = os.path.join(model_dir, 'yamnet_class_map.csv')
+    if not os.path.exists(class_map):
+        with open(class_map, 'wb') as f:
+            f.write(fetch(CLASS_MAP_URL))
+
+    if not os.path.exists(os.path.join(model_dir, 'vosk-model-small-en-us-0.15')):
+        with zipfile.ZipFile(io.BytesIO(fetch(VOSK_URL))) as zf:
+            zf.extractall(model_dir)
+
+    print(f"Model artifacts ready in {model_dir}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else os.getenv('MODEL_DIR', 'model_artifacts'))
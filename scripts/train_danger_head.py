@@ -0,0 +1,123 @@
+"""Train the danger head on labelled clips.
+
+Usage:
+    python scripts/train_danger_head.py DIR --labels labels.csv
+                                        [--output model_artifacts/danger_head.npz]
+                                        [--l2 10] [--threshold 0.5] [--holdout 0.25]
+
+The labels file has the same ``file,label`` format as scripts/batch_analyze.py.
+Each clip is run through YAMNet once. Its patch embeddings inherit the clip's
+label, except that silent patches of unsafe clips are dropped, since the
+danger is not in the silence. A class-balanced logistic regression is fitted
+on the patches.
+
+Like the app, a clip is scored by its highest patch probability. Clip-level
+precision and recall are reported on the training clips and, with
+--holdout, on a held-out fraction of them. The head is saved to --output,
+where the app loads it from (DANGER_HEAD).
+
+For the bundled dataset, a labels file could read:
+    Unsafe.wav,unsafe
+    leave me.ogg,unsafe
+    SAFE.wav,safe
+    blank audio.ogg,safe
+    loud bg noise.ogg,safe
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from batch_analyze import find_audio, label_for, load_labels
+from models.audio import decode_audio
+from models.batching import HOP_SAMPLES, PATCH_SAMPLES, num_patches
+from models.embeddings import DangerHead
+from models.yamnet import load_backend
+
+
+def load_yamnet(model_dir):
+    handle = os.path.join(model_dir, "yamnet")
+    if not os.path.exists(handle):
+        handle = "https://tfhub.dev/google/yamnet/1"
+    return load_backend(os.getenv("YAMNET_BACKEND", "tf"), handle=handle, model_dir=model_dir)
+
+
+def active_patches(wav, threshold):
+    """Mask of YAMNet patches whose RMS is above the energy gate."""
+    padded = np.pad(wav, (0, max(0, PATCH_SAMPLES - len(wav))))
+    mask = np.zeros(num_patches(len(wav)), dtype=bool)
+    for i in range(len(mask)):
+        patch = padded[i * HOP_SAMPLES:i * HOP_SAMPLES + PATCH_SAMPLES]
+        mask[i] = np.sqrt(np.mean(patch ** 2)) > threshold
+    return mask
+
+
+def clip_report(name, head, clips):
+    tp = fp = tn = fn = 0
+    for embeddings, label in clips:
+        alert = head.score(embeddings) >= head.threshold
+        tp += alert and label
+        fp += alert and not label
+        tn += not alert and not label
+        fn += not alert and label
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    print(f"{name:<8} {len(clips)} clips  precision {precision:.3f}  recall {recall:.3f}  "
+          f"(tp {tp}, fp {fp}, tn {tn}, fn {fn})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--labels", required=True)
+    parser.add_argument("--model-dir", default=os.getenv("MODEL_DIR", "model_artifacts"))
+    parser.add_argument("--output", help="default: MODEL_DIR/danger_head.npz")
+    parser.add_argument("--l2", type=float, default=10.0)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--holdout", type=float, default=0.0, help="fraction of clips kept out of training")
+    parser.add_argument("--vad-threshold", type=float, default=float(os.getenv("VAD_THRESHOLD", "0.01")))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    labels = load_labels(args.labels)
+    model = load_yamnet(args.model_dir)
+    clips = []
+    for path in find_audio(args.directory):
+        label = label_for(labels, args.directory, path)
+        if label is None:
+            continue
+        wav = decode_audio(path)
+        _, embeddings, _ = model(wav)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if label:
+            embeddings = embeddings[active_patches(wav, args.vad_threshold)[:len(embeddings)]]
+        if len(embeddings):
+            clips.append((embeddings, bool(label)))
+    if not clips or all(label for _, label in clips) or not any(label for _, label in clips):
+        sys.exit("Need labelled clips of both classes")
+
+    order = np.random.default_rng(args.seed).permutation(len(clips))
+    held = int(round(len(clips) * args.holdout))
+    train = [clips[i] for i in order[held:]]
+    test = [clips[i] for i in order[:held]]
+
+    x = np.concatenate([embeddings for embeddings, _ in train])
+    y = np.concatenate([np.full(len(embeddings), label, dtype=np.float32) for embeddings, label in train])
+    print(f"training on {len(x)} patches from {len(train)} clips ({int(y.sum())} unsafe patches)")
+    head = DangerHead.fit(x, y, l2=args.l2, threshold=args.threshold)
+
+    clip_report("train", head, train)
+    if test:
+        clip_report("holdout", head, test)
+
+    output = args.output or os.path.join(args.model_dir, "danger_head.npz")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    head.save(output)
+    print(f"saved {output}")
+
+
+if __name__ == "__main__":
+    main()
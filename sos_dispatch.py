@@ -0,0 +1,205 @@
+"""Background SOS dispatch with retries and per-incident deduplication.
+
+``/send_sos`` used to call Twilio inside the request, so a slow API call
+stalled the worker and a double-tap sent two WhatsApp alerts. Messages are
+now queued and the route returns at once with a dispatch ID. Worker threads
+send through one pooled HTTP session, retrying transient failures with
+exponential backoff. Each incident gets an idempotency key, and repeat
+requests for the same incident within the dedup window return the original
+dispatch instead of sending again.
+"""
+import hashlib
+import heapq
+import itertools
+import random
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import span
+
+QUEUED = "queued"
+SENDING = "sending"
+RETRYING = "retrying"
+SENT = "sent"
+FAILED = "failed"
+
+TWILIO_API_BASE = "https://api.twilio.com"
+
+
+class DispatchError(Exception):
+    """A send attempt failed; ``retryable`` says whether trying again may help."""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class TwilioSender:
+    """Sends WhatsApp messages through the Twilio REST API on a pooled session."""
+
+    def __init__(self, account_sid, auth_token, from_, to, api_base=TWILIO_API_BASE,
+                 timeout=10, pool_size=4):
+        self.account_sid = account_sid
+        self.from_ = from_
+        self.to = to
+        self.timeout = timeout
+        self.url = f"{api_base.rstrip('/')}/2010-04-01/Accounts/{account_sid}/Messages.json"
+        self.session = requests.Session()
+        self.session.auth = (account_sid, auth_token)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.configured = bool(account_sid and auth_token)
+
+    def __call__(self, body, idempotency_key):
+        if not self.configured:
+            raise DispatchError("Twilio credentials are not configured", retryable=False)
+        try:
+            response = self.session.post(
+                self.url,
+                data={"From": self.from_, "To": self.to, "Body": body},
+                # Twilio's Messages API has no idempotency support, which is
+                # why the dispatcher dedups locally. The key is still sent so a
+                # proxy or the stand-in server can deduplicate retries.
+                headers={"Idempotency-Key": idempotency_key},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            raise DispatchError(f"Twilio request failed: {e}")
+        if response.status_code == 429 or response.status_code >= 500:
+            raise DispatchError(f"Twilio returned {response.status_code}")
+        if response.status_code >= 400:
+            raise DispatchError(f"Twilio rejected the message ({response.status_code}): {response.text[:200]}",
+                                retryable=False)
+        return response.json().get("sid")
+
+
+class SosDispatcher:
+    """Queue of outgoing SOS messages drained by background worker threads."""
+
+    def __init__(self, send, workers=2, max_attempts=5, base_delay=1.0, max_delay=30.0,
+                 dedup_window=600, max_records=1000):
+        self.send = send
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.dedup_window = dedup_window
+        self.max_records = max_records
+        self._cond = threading.Condition()
+        self._heap = []
+        self._order = itertools.count()
+        self._records = {}
+        self._incidents = {}
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"sos-dispatch-{i}", daemon=True).start()
+
+    def submit(self, incident, body):
+        """Queue ``body`` for ``incident`` and return its dispatch record.
+
+        A second submit for the same incident inside the dedup window returns
+        the existing record with ``duplicate`` set instead of sending again.
+        """
+        now = time.time()
+        idempotency_key = hashlib.sha256(incident.encode("utf-8")).hexdigest()[:32]
+        with self._cond:
+            existing = self._incidents.get(idempotency_key)
+            if existing is not None:
+                record = self._records.get(existing)
+                if record is not None and record["status"] != FAILED and now - record["enqueued_at"] < self.dedup_window:
+                    return dict(record, duplicate=True)
+            record = {
+                "id": uuid.uuid4().hex,
+                "incident": incident,
+                "idempotency_key": idempotency_key,
+                "body": body,
+                "status": QUEUED,
+                "attempts": 0,
+                "sid": None,
+                "error": None,
+                "enqueued_at": now,
+                "delivered_at": None,
+            }
+            self._records[record["id"]] = record
+            self._incidents[idempotency_key] = record["id"]
+            self._trim()
+            heapq.heappush(self._heap, (now, next(self._order), record["id"]))
+            self._cond.notify()
+            return dict(record, duplicate=False)
+
+    def status(self, dispatch_id):
+        """Current state of a dispatch, or None if unknown."""
+        with self._cond:
+            record = self._records.get(dispatch_id)
+            if record is None:
+                return None
+            result = dict(record)
+        if result["delivered_at"] is not None:
+            result["latency_ms"] = round((result["delivered_at"] - result["enqueued_at"]) * 1000, 3)
+        return result
+
+    def stats(self):
+        with self._cond:
+            counts = {}
+            for record in self._records.values():
+                counts[record["status"]] = counts.get(record["status"], 0) + 1
+            return {"pending": len(self._heap), "by_status": counts}
+
+    def _trim(self):
+        # Forget the oldest finished dispatches once the table is full.
+        if len(self._records) <= self.max_records:
+            return
+        for dispatch_id, record in list(self._records.items()):
+            if len(self._records) <= self.max_records:
+                break
+            if record["status"] in (SENT, FAILED):
+                del self._records[dispatch_id]
+                if self._incidents.get(record["idempotency_key"]) == dispatch_id:
+                    del self._incidents[record["idempotency_key"]]
+
+    def _next(self):
+        with self._cond:
+            while True:
+                if self._heap:
+                    ready_at, _, dispatch_id = self._heap[0]
+                    delay = ready_at - time.time()
+                    if delay <= 0:
+                        heapq.heappop(self._heap)
+                        record = self._records.get(dispatch_id)
+                        if record is None:
+                            continue
+                        record["status"] = SENDING
+                        record["attempts"] += 1
+                        return record
+                    self._cond.wait(delay)
+                else:
+                    self._cond.wait()
+
+    def _worker(self):
+        while True:
+            record = self._next()
+            try:
+                with span("sos_dispatch"):
+                    sid = self.send(record["body"], record["idempotency_key"])
+            except Exception as e:
+                retryable = getattr(e, "retryable", True)
+                with self._cond:
+                    record["error"] = str(e)
+                    if retryable and record["attempts"] < self.max_attempts:
+                        record["status"] = RETRYING
+                        delay = min(self.max_delay, self.base_delay * 2 ** (record["attempts"] - 1))
+                        delay *= random.uniform(0.5, 1.0)
+                        heapq.heappush(self._heap, (time.time() + delay, next(self._order), record["id"]))
+                        self._cond.notify()
+                    else:
+                        record["status"] = FAILED
+                        print(f"SOS dispatch {record['id']} failed: {e}")
+                continue
+            with self._cond:
+                record["status"] = SENT
+                record["sid"] = sid
+                record["error"] = None
+                record["delivered_at"] = time.time()
@@ -5,6 +5,16 @@ document.addEventListener('DOMContentLoaded', function() {
     const sendButton = document.getElementById('sendButton');
     const loading = document.getElementById('loading');
 
+    // The server keeps the conversation history; remember which session is ours
+    let sessionId = sessionStorage.getItem('chatSessionId');
+
+    function rememberSession(id) {
+        if (id && id !== sessionId) {
+            sessionId = id;
+            sessionStorage.setItem('chatSessionId', id);
+        }
+    }
+
     // Auto-resize and focus
     messageInput.focus();
     
@@ -30,27 +40,13 @@ document.addEventListener('DOMContentLoaded', function() {
         setLoading(true);
 
         try {
-            const response = await fetch('/chat', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({ message: message })
-            });
-
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-
-            const data = await response.json();
-            
-            if (data.error) {
-                throw new Error(data.error);
+            try {
+                await streamReply(message);
+            } catch (streamError) {
+                // Fall back to the plain JSON endpoint if streaming is unavailable
+                console.warn('Streaming failed, falling back to /chat:', streamError);
+                await fetchReply(message);
             }
-
-            // Add bot response to chat
-            addMessage(data.response, 'bot');
-            
         } catch (error) {
             console.error('Error:', error);
             addMessage('I apologize, but I\'m having trouble connecting right now. Please try again in a moment, or reach out to a mental health professional if you need immediate support.', 'bot');
@@ -59,6 +55,94 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Stream the reply from /chat/stream (server-sent events) token by token
+    async function streamReply(message) {
+        const response = await fetch('/chat/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ message: message, session_id: sessionId })
+        });
+
+        if (!response.ok || !response.body) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let content = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const raw = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                raw.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                });
+                const payload = data ? JSON.parse(data) : {};
+
+                if (event === 'done') {
+                    rememberSession(payload.session_id);
+                }
+
+                if (event === 'error') {
+                    // Keep a partial reply rather than asking again
+                    if (content) return;
+                    throw new Error(payload.error);
+                }
+                if (event === 'message' && payload.token) {
+                    if (!content) {
+                        setLoading(false);
+                        content = addMessage('', 'bot');
+                    }
+                    content.textContent += payload.token;
+                    chatMessages.scrollTop = chatMessages.scrollHeight;
+                }
+            }
+        }
+
+        if (!content) {
+            throw new Error('Empty streamed response');
+        }
+    }
+
+    async function fetchReply(message) {
+        const response = await fetch('/chat', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ message: message, session_id: sessionId })
+        });
+
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        const data = await response.json();
+        
+        if (data.error) {
+            throw new Error(data.error);
+        }
+
+        rememberSession(data.session_id);
+
+        // Add bot response to chat
+        addMessage(data.response, 'bot');
+    }
+
     function addMessage(content, sender) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${sender}`;
@@ -82,6 +166,7 @@ document.addEventListener('DOMContentLoaded', function() {
         
         chatMessages.appendChild(messageDiv);
         chatMessages.scrollTop = chatMessages.scrollHeight;
+        return messageContent;
     }
 
     function setLoading(isLoading) {
@@ -126,12 +211,13 @@ Would you like to talk about what you're going through?
     // Override addMessage to check for crisis situations
     const originalAddMessage = addMessage;
     addMessage = function(content, sender) {
-        originalAddMessage(content, sender);
+        const messageContent = originalAddMessage(content, sender);
         
         if (sender === 'user' && containsCrisisKeywords(content)) {
             setTimeout(() => {
                 showCrisisResources();
             }, 1000);
         }
+        return messageContent;
     };
 });
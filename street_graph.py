@@ -0,0 +1,329 @@
+"""Street network with per-edge safety and safest-route search for ``/route``.
+
+The street safety game only knows the nine streets on its map and assigns
+each a random safety level in the browser. Here a real street network is
+loaded once per process into compact CSR arrays: ``indptr`` (int32 per
+node), and ``head``, ``length`` and ``risk`` (int32/float32 per directed
+edge). A graph with 500k edges takes about 10 MB. Edge safety changes at
+runtime (see ``set_risk``), which would invalidate a precomputed contraction.
+Queries therefore run A* with landmark lower bounds (ALT) instead.
+
+Each edge costs ``length * (1 + safety_weight * risk)``, where ``risk`` is
+``1 - safety``. A weight of 0 gives the shortest route; larger weights trade
+extra metres for avoiding unsafe streets. Every cost is at least the edge's
+length, so any lower bound on the remaining street distance is an admissible
+and consistent heuristic, whatever the weight or the current risks. There
+are two such bounds: the great-circle distance, and the triangle-inequality
+bound from ``landmarks`` nodes. The landmark bound needs street distances to
+and from every node, computed once at load time with scipy's Dijkstra. On
+grid-like streets it is much tighter than the straight line.
+
+Origins and destinations are snapped to the nearest node. Results are cached
+per (origin node, destination node, weight) in an LRU, which is cleared
+whenever edge safety changes.
+
+Graphs load from JSON (``nodes``: id/lat/lon, ``edges``: from/to and
+optional length in metres, safety as 0..1 or safe/caution/unsafe, oneway and
+name) or from the ``.npz`` that ``save`` writes, which loads without parsing.
+"""
+import heapq
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+EARTH_RADIUS_M = 6371008.8
+SAFETY_LEVELS = {"safe": 1.0, "caution": 0.5, "unsafe": 0.0}
+
+
+class RouteNotFound(Exception):
+    """No path connects the two points, or one is too far from any street."""
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres; works on scalars and numpy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(x) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _safety_value(value):
+    if isinstance(value, str):
+        if value not in SAFETY_LEVELS:
+            raise ValueError(f"Unknown safety level {value!r}; expected one of {', '.join(SAFETY_LEVELS)}")
+        return SAFETY_LEVELS[value]
+    return min(1.0, max(0.0, float(value)))
+
+
+class StreetGraph:
+    """Directed street graph in CSR form with cached A* safest-route queries."""
+
+    def __init__(self, node_ids, lat, lon, tail, head, length=None, safety=None, name=None, names=(),
+                 cache_size=1024, landmarks=8):
+        self.node_ids = np.asarray(node_ids, dtype=np.int64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        tail = np.asarray(tail, dtype=np.int32)
+        head = np.asarray(head, dtype=np.int32)
+        straight = haversine_m(self.lat[tail], self.lon[tail], self.lat[head], self.lon[head])
+        # Lengths below the straight-line distance would make the heuristic overestimate.
+        length = straight if length is None else np.maximum(np.asarray(length, dtype=np.float64), straight)
+        safety = np.ones(len(tail)) if safety is None else np.asarray(safety, dtype=np.float64)
+
+        order = np.argsort(tail, kind="stable")
+        self.indptr = np.zeros(len(self.node_ids) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(tail, minlength=len(self.node_ids)), out=self.indptr[1:])
+        self.tail = tail[order]
+        self.head = head[order]
+        self.length = length[order].astype(np.float32)
+        self.risk = (1.0 - np.clip(safety[order], 0.0, 1.0)).astype(np.float32)
+        self.name = (np.asarray(name, dtype=np.int32)[order] if name is not None
+                     else np.full(len(tail), -1, dtype=np.int32))
+        self.names = list(names)
+        self._landmarks(landmarks)
+
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = 0
+        self.queries = 0
+        self.cache_hits = 0
+        self.search_seconds = 0.0
+        self.settled = 0
+        self._views()
+
+    def _landmarks(self, count):
+        """Pick ``count`` far-apart landmarks and their street distances to and from every node."""
+        n = self.num_nodes
+        count = min(count, n)
+        self.landmark_nodes = np.zeros(0, dtype=np.int64)
+        self.dist_from = np.zeros((0, n), dtype=np.float32)
+        self.dist_to = np.zeros((0, n), dtype=np.float32)
+        if not count:
+            return
+        # Parallel edges would be summed by scipy; keep the shortest of each.
+        order = np.lexsort((self.length, self.head, self.tail))
+        pairs = self.tail[order].astype(np.int64) * n + self.head[order]
+        first = np.ones(len(pairs), dtype=bool)
+        first[1:] = pairs[1:] != pairs[:-1]
+        order = order[first]
+        forward = csr_matrix((self.length[order].astype(np.float64), (self.tail[order], self.head[order])),
+                             shape=(n, n))
+
+        # Farthest-point selection: each landmark is the node farthest (in
+        # street distance) from those already chosen.
+        chosen = [int(np.argmax(self.lat))]
+        dist_from = [dijkstra(forward, indices=chosen[0])]
+        nearest = dist_from[0].copy()
+        while len(chosen) < count:
+            reachable = np.where(np.isfinite(nearest), nearest, -1.0)
+            reachable[chosen] = -1.0
+            candidate = int(np.argmax(reachable))
+            if reachable[candidate] <= 0:
+                break
+            chosen.append(candidate)
+            dist_from.append(dijkstra(forward, indices=candidate))
+            nearest = np.minimum(nearest, dist_from[-1])
+        self.landmark_nodes = np.array(chosen, dtype=np.int64)
+        self.dist_from = np.array(dist_from, dtype=np.float32)
+        self.dist_to = dijkstra(forward.T.tocsr(), indices=chosen).astype(np.float32)
+
+    def _lower_bounds(self, target):
+        """Lower bound on the street distance from every node to ``target``."""
+        bound = haversine_m(self.lat, self.lon, self.lat[target], self.lon[target]).astype(np.float32)
+        with np.errstate(invalid="ignore"):
+            for dist_from, dist_to in zip(self.dist_from, self.dist_to):
+                # d(v, t) >= d(L, t) - d(L, v) and d(v, t) >= d(v, L) - d(t, L).
+                # inf - inf is nan, which np.fmax ignores: that landmark says nothing.
+                np.fmax(bound, dist_from[target] - dist_from, out=bound)
+                np.fmax(bound, dist_to - dist_to[target], out=bound)
+        # Shrink slightly so float32 rounding never overestimates.
+        bound *= np.float32(1 - 1e-5)
+        return bound
+
+    def _views(self):
+        # memoryviews index to plain Python numbers about as fast as lists,
+        # without a list's per-element object overhead.
+        self._indptr_v = memoryview(self.indptr)
+        self._head_v = memoryview(self.head)
+        self._length_v = memoryview(self.length)
+        self._risk_v = memoryview(self.risk)
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self):
+        return len(self.head)
+
+    # --- loading ---
+
+    @classmethod
+    def from_json(cls, data, **kwargs):
+        """Build from ``{"nodes": [...], "edges": [...]}``; two-way edges become two directed ones."""
+        index = {}
+        node_ids, lat, lon = [], [], []
+        for node in data["nodes"]:
+            index[node["id"]] = len(node_ids)
+            node_ids.append(node["id"])
+            lat.append(node["lat"])
+            lon.append(node["lon"])
+        names = {}
+        tail, head, length, safety, name = [], [], [], [], []
+        for edge in data["edges"]:
+            u, v = index[edge["from"]], index[edge["to"]]
+            value = _safety_value(edge.get("safety", 1.0))
+            n = names.setdefault(edge["name"], len(names)) if edge.get("name") else -1
+            for a, b in ((u, v),) if edge.get("oneway") else ((u, v), (v, u)):
+                tail.append(a)
+                head.append(b)
+                length.append(edge.get("length", 0.0))
+                safety.append(value)
+                name.append(n)
+        return cls(node_ids, lat, lon, tail, head, length, safety, name, names=list(names), **kwargs)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        if path.endswith(".npz"):
+            with np.load(path) as npz:
+                names = json.loads(str(npz["names"])) if "names" in npz else []
+                return cls(npz["node_ids"], npz["lat"], npz["lon"], npz["tail"], npz["head"],
+                           npz["length"], 1.0 - npz["risk"], npz["name"], names=names, **kwargs)
+        with open(path) as f:
+            return cls.from_json(json.load(f), **kwargs)
+
+    def save(self, path):
+        np.savez(path, node_ids=self.node_ids, lat=self.lat, lon=self.lon, tail=self.tail, head=self.head,
+                 length=self.length, risk=self.risk, name=self.name, names=np.array(json.dumps(self.names)))
+
+    # --- updates ---
+
+    def set_risk(self, edges, risk):
+        """Replace the risk (0 safe .. 1 unsafe) of directed ``edges`` and drop cached routes."""
+        with self._lock:
+            self.risk[np.asarray(edges, dtype=np.int64)] = np.clip(risk, 0.0, 1.0)
+            self._cache.clear()
+            self.version += 1
+
+    # --- queries ---
+
+    def nearest(self, lat, lon):
+        """Index of the node closest to (lat, lon) and its distance in metres."""
+        # Equirectangular distance is accurate enough to pick the nearest node.
+        dx = (self.lon - lon) * math.cos(math.radians(lat))
+        dy = self.lat - lat
+        node = int(np.argmin(dx * dx + dy * dy))
+        return node, float(haversine_m(lat, lon, self.lat[node], self.lon[node]))
+
+    def route(self, source, target, safety_weight=4.0):
+        """Safest route between node indices; raises RouteNotFound if disconnected."""
+        key = (source, target, float(safety_weight))
+        with self._lock:
+            self.queries += 1
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return dict(cached, cached=True)
+            version = self.version
+
+        start = time.perf_counter()
+        edges, settled = self._astar(source, target, float(safety_weight))
+        elapsed = time.perf_counter() - start
+        result = self._describe(source, target, edges, float(safety_weight))
+        result["search_ms"] = round(elapsed * 1000, 3)
+        result["settled_nodes"] = settled
+
+        with self._lock:
+            self.search_seconds += elapsed
+            self.settled += settled
+            # A concurrent set_risk makes this result stale; do not cache it.
+            if version == self.version:
+                self._cache[key] = result
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return dict(result, cached=False)
+
+    def _astar(self, source, target, weight):
+        indptr, head, length, risk = self._indptr_v, self._head_v, self._length_v, self._risk_v
+        heappush, heappop = heapq.heappush, heapq.heappop
+        remaining = memoryview(self._lower_bounds(target))
+
+        best = {source: 0.0}
+        via = {source: -1}
+        heap = [(remaining[source], 0.0, source)]
+        settled = 0
+        while heap:
+            _, cost, v = heappop(heap)
+            if cost > best[v]:
+                continue
+            settled += 1
+            if v == target:
+                break
+            for e in range(indptr[v], indptr[v + 1]):
+                u = head[e]
+                new_cost = cost + length[e] * (1.0 + weight * risk[e])
+                if new_cost < best.get(u, math.inf):
+                    estimate = remaining[u]
+                    if estimate == math.inf:
+                        # The landmarks prove the target is unreachable from u.
+                        continue
+                    best[u] = new_cost
+                    via[u] = e
+                    heappush(heap, (new_cost + estimate, new_cost, u))
+        else:
+            raise RouteNotFound("No route between these points")
+
+        edges = []
+        v = target
+        while via[v] != -1:
+            e = via[v]
+            edges.append(e)
+            v = int(self.tail[e])
+        edges.reverse()
+        return np.array(edges, dtype=np.int64), settled
+
+    def _describe(self, source, target, edges, weight):
+        nodes = np.concatenate(([source], self.head[edges])).astype(np.int64)
+        length = self.length[edges].astype(np.float64)
+        risk = self.risk[edges].astype(np.float64)
+        distance = float(length.sum())
+        streets = []
+        for n in self.name[edges]:
+            if n >= 0 and (not streets or streets[-1] != self.names[n]):
+                streets.append(self.names[n])
+        return {
+            "distance_m": round(distance, 1),
+            "cost": round(float((length * (1.0 + weight * risk)).sum()), 1),
+            # Length-weighted mean safety along the route, 1.0 when it is empty.
+            "safety": round(1.0 - float((length * risk).sum()) / distance, 4) if distance else 1.0,
+            "unsafe_m": round(float(length[risk >= 0.5].sum()), 1),
+            "streets": streets,
+            "path": [[round(float(self.lat[n]), 6), round(float(self.lon[n]), 6)] for n in nodes],
+            "safety_weight": weight,
+        }
+
+    def stats(self):
+        with self._lock:
+            searches = self.queries - self.cache_hits
+            return {
+                "nodes": self.num_nodes,
+                "edges": self.num_edges,
+                "memory_bytes": sum(a.nbytes for a in (self.indptr, self.tail, self.head, self.length, self.risk,
+                                                       self.name, self.lat, self.lon, self.node_ids)),
+                "landmarks": len(self.landmark_nodes),
+                "landmark_bytes": self.dist_from.nbytes + self.dist_to.nbytes,
+                "version": self.version,
+                "queries": self.queries,
+                "cache_hits": self.cache_hits,
+                "cache_misses": searches,
+                "cache_entries": len(self._cache),
+                "search_ms_avg": round(self.search_seconds / searches * 1000, 3) if searches else 0.0,
+                "settled_nodes_avg": round(self.settled / searches, 1) if searches else 0.0,
+            }